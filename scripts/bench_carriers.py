@@ -0,0 +1,70 @@
+"""مقارنة أداء طلبات التتبع: اتصال جديد لكل طلب مقابل جلسة بمجمع اتصالات
+
+    python scripts/bench_carriers.py --requests 300 --concurrency 8 --latency 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from carrier_stub import start_stub
+
+def run(label, call, total, concurrency):
+    latencies = []
+
+    def timed(index):
+        started = time.perf_counter()
+        call(index)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f'{label:<28} {total / elapsed:8.1f} req/s   '
+          f'p50={statistics.median(latencies):6.1f}ms   '
+          f'p95={latencies[int(len(latencies) * 0.95) - 1]:6.1f}ms')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=20.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, state = start_stub(0, args.latency, 0, args.error_rate)
+    base_url = f'http://127.0.0.1:{server.server_port}/yalidine'
+    os.environ['YALIDINE_BASE_URL'] = base_url
+
+    from src.services.delivery_integration import YalidineService
+
+    before = state.connections
+    run('requests.get (no pooling)',
+        lambda i: requests.get(f'{base_url}/parcels/yal-{i}/tracking', timeout=30),
+        args.requests, args.concurrency)
+    print(f'{"":<28} connections opened: {state.connections - before}')
+
+    service = YalidineService()
+    before = state.connections
+    run('YalidineService (pooled)',
+        lambda i: service.track_shipment(f'yal-{i}'),
+        args.requests, args.concurrency)
+    print(f'{"":<28} connections opened: {state.connections - before}')
+
+    stats = service.http.get_stats()
+    print(f'retries={stats["retries"]} failures={stats["failures"]} latency={stats["latency_ms"]}')
+
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
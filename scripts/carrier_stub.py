@@ -0,0 +1,203 @@
+"""خادم محلي يحاكي واجهات Yalidine و Aramex لاختبار الأداء والتطوير
+
+التشغيل:
+    python scripts/carrier_stub.py --port 8765 --latency 40 --error-rate 0.05
+
+ثم توجيه التطبيق إليه:
+    YALIDINE_BASE_URL=http://127.0.0.1:8765/yalidine
+    ARAMEX_BASE_URL=http://127.0.0.1:8765/aramex
+"""
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STATUSES = ['in_transit', 'out_for_delivery', 'delivered', 'returned']
+
+class StubState:
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        # ذيل بطيء: نسبة من الطلبات تتأخر slow_ms إضافية
+        self.slow_rate = 0.0
+        self.slow_ms = 0.0
+        self.connections = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        # حالات ثابتة لأرقام تتبع محددة؛ غير ذلك حالة عشوائية
+        self.statuses = {}
+        # أرقام الطلبات التي يرفضها الإنشاء المجمع
+        self.rejected_orders = set()
+
+    def status_for(self, tracking_number):
+        return self.statuses.get(tracking_number) or random.choice(STATUSES)
+
+def make_handler(state):
+    class CarrierStubHandler(BaseHTTPRequestHandler):
+        # HTTP/1.1 ليبقى الاتصال مفتوحاً بين الطلبات
+        protocol_version = 'HTTP/1.1'
+        # كتابة الرأس والجسم معاً دون انتظار Nagle/delayed ACK
+        wbufsize = 64 * 1024
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            super().setup()
+            with state.lock:
+                state.connections += 1
+
+        def log_message(self, format, *args):
+            pass
+
+        def _body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            if not length:
+                return {}
+            return json.loads(self.rfile.read(length) or b'{}')
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _simulate(self):
+            with state.lock:
+                state.requests += 1
+            delay = state.latency_ms + random.uniform(0, state.jitter_ms)
+            if random.random() < state.slow_rate:
+                delay += state.slow_ms
+            if delay:
+                time.sleep(delay / 1000.0)
+            return random.random() < state.error_rate
+
+        def _handle(self, method):
+            body = self._body() if method in ('POST', 'PUT') else {}
+            if self._simulate():
+                return self._reply(503, {'error': 'service unavailable'})
+
+            path = self.path.split('?', 1)[0].rstrip('/')
+            now = datetime.utcnow().isoformat()
+
+            if path.startswith('/yalidine/parcels'):
+                parts = path.split('/')
+                if method == 'POST' and len(parts) == 3 and isinstance(body, list):
+                    # إنشاء عدة طرود: الرد قاموس مفتاحه order_id
+                    replies = {}
+                    for parcel in body:
+                        order_id = str(parcel.get('order_id', ''))
+                        if order_id in state.rejected_orders:
+                            replies[order_id] = {'success': False, 'order_id': order_id, 'message': 'invalid commune'}
+                            continue
+                        parcel_id = next(state.ids)
+                        replies[order_id] = {
+                            'success': True,
+                            'order_id': order_id,
+                            'tracking': f'yal-{parcel_id:08d}',
+                            'import_id': parcel_id,
+                            'message': ''
+                        }
+                    return self._reply(200, replies)
+                if method == 'POST' and len(parts) == 3:
+                    parcel_id = next(state.ids)
+                    return self._reply(201, {'id': parcel_id, 'tracking': f'yal-{parcel_id:08d}'})
+                if method == 'GET' and path.endswith('/tracking'):
+                    return self._reply(200, {
+                        'tracking': parts[3],
+                        'status': state.status_for(parts[3]),
+                        'last_update': now,
+                        'tracking_history': []
+                    })
+                if method == 'DELETE':
+                    return self._reply(200, {'deleted': parts[3]})
+
+            if path == '/yalidine/deliveryfees' and method == 'POST':
+                weight = float(body.get('weight', 1) or 1)
+                return self._reply(200, {
+                    'delivery_cost': 400 + 50 * weight,
+                    'return_cost': 200,
+                    'total_cost': 600 + 50 * weight
+                })
+
+            if path == '/aramex/json/TrackShipments' and method == 'POST':
+                return self._reply(200, {
+                    'HasErrors': False,
+                    'Notifications': [],
+                    'TrackingResults': [
+                        {
+                            'WaybillNumber': waybill,
+                            'UpdateDescription': state.status_for(waybill),
+                            'UpdateDateTime': now,
+                            'UpdateLocation': 'Algiers'
+                        }
+                        for waybill in body.get('Shipments', [])
+                    ]
+                })
+
+            if path == '/aramex/json/CreateShipments' and method == 'POST':
+                shipments = body.get('Shipments', [])
+                return self._reply(200, {
+                    'HasErrors': False,
+                    'Notifications': [],
+                    'Shipments': [
+                        {'ID': f'arx-{next(state.ids):08d}', 'Reference1': s.get('Reference1', '')}
+                        for s in shipments
+                    ],
+                    'LabelURL': ''
+                })
+
+            if path == '/aramex/json/CalculateRate' and method == 'POST':
+                weight = float(body.get('ShipmentDetails', {}).get('ActualWeight', {}).get('Value', 1) or 1)
+                return self._reply(200, {
+                    'HasErrors': False,
+                    'TotalAmount': {'CurrencyCode': 'DZD', 'Value': 700 + 60 * weight}
+                })
+
+            return self._reply(404, {'error': f'unknown endpoint {method} {path}'})
+
+        def do_GET(self):
+            self._handle('GET')
+
+        def do_POST(self):
+            self._handle('POST')
+
+        def do_DELETE(self):
+            self._handle('DELETE')
+
+    return CarrierStubHandler
+
+def start_stub(port=0, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0):
+    """تشغيل الخادم في خيط خلفي وإرجاع (الخادم، الحالة)"""
+    state = StubState(latency_ms, jitter_ms, error_rate)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='خادم محاكاة لشركات التوصيل')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=30.0, help='زمن الاستجابة بالملي ثانية')
+    parser.add_argument('--jitter', type=float, default=10.0, help='تذبذب إضافي عشوائي بالملي ثانية')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='نسبة ردود 503')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='نسبة الطلبات البطيئة')
+    parser.add_argument('--slow-ms', type=float, default=0.0, help='التأخير الإضافي للطلبات البطيئة')
+    args = parser.parse_args()
+
+    server, state = start_stub(args.port, args.latency, args.jitter, args.error_rate)
+    state.slow_rate = args.slow_rate
+    state.slow_ms = args.slow_ms
+    print(f'carrier stub listening on http://127.0.0.1:{server.server_port}')
+    try:
+        while True:
+            time.sleep(10)
+            print(f'connections={state.connections} requests={state.requests}')
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -11,6 +11,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from flask import Flask, send_from_directory
 from flask_cors import CORS
 from src.models import db
+from src.models.migrations import upgrade_schema
 from src.routes.user import user_bp
 from src.routes.product import product_bp
 from src.routes.order import order_bp
@@ -20,9 +21,14 @@ from src.routes.delivery_company import delivery_company_bp
 from src.routes.delivery_price_list import delivery_price_list_bp
 from src.routes.staff import staff_bp
 from src.routes.inventory import inventory_bp
-from src.routes.delivery_integration import delivery_integration_bp
+from src.routes.delivery_integration import delivery_integration_bp, shipment_poller
 from src.routes.expense import expense_bp
 from src.routes.financial_reports import financial_reports_bp
+from src.routes.report_jobs import report_jobs_bp
+from src.routes.analytics import analytics_bp, analytics_snapshot
+from src.routes.order_archive import order_archive_bp
+from src.services.order_archive import get_order_archive
+from src.services.shipment_callbacks import callback_buffer
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 
@@ -43,6 +49,9 @@ app.register_blueprint(inventory_bp, url_prefix='/api')
 app.register_blueprint(delivery_integration_bp, url_prefix='/api')
 app.register_blueprint(expense_bp, url_prefix='/api')
 app.register_blueprint(financial_reports_bp, url_prefix='/api')
+app.register_blueprint(report_jobs_bp, url_prefix='/api')
+app.register_blueprint(analytics_bp, url_prefix='/api')
+app.register_blueprint(order_archive_bp, url_prefix='/api')
 
 # Database configuration
 database_url = os.getenv("DATABASE_URL", f"sqlite:///{os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'app.db')}")
@@ -51,6 +60,22 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 with app.app_context():
     db.create_all()
+    upgrade_schema()
+    # إكمال أو إلغاء أرشفة توقفت في منتصفها
+    get_order_archive().reconcile()
+
+# تحديث دوري للقطة التحليلات إذا تم تفعيله
+if os.getenv('ANALYTICS_REFRESH_INTERVAL'):
+    analytics_snapshot.start_background_refresh(app, float(os.getenv('ANALYTICS_REFRESH_INTERVAL')))
+
+# متابعة دورية لحالات الشحنات الجارية إذا تم تفعيلها؛ الشحنات تحجز في قاعدة البيانات
+# فيمكن تشغيلها في كل worker، لكن لا داعي لها في عملية المراقبة الأم لـ reloader
+if os.getenv('SHIPMENT_POLL_TICK') and (__name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+    shipment_poller.start_background_polling(app, float(os.getenv('SHIPMENT_POLL_TICK')))
+
+# أحداث شركات التوصيل التي خُزنت ولم تطبق قبل إعادة التشغيل لا تنتظر إشعاراً جديداً
+if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    callback_buffer.start_if_pending(app)
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -10,6 +10,15 @@ from .staff import Staff
 from .delivery_price_list import DeliveryPriceList
 from .expense import Expense
 from .order import Order
+from .stock_lot import StockLot, StockLotConsumption
+from .order_metric_sketch import OrderMetricSketch
+from .inventory_movement import InventoryMovement, InventorySnapshot
+from .product_sales_velocity import ProductSalesVelocity
+from .inventory_alert import InventoryAlert
+from .catalog_version import CatalogVersion
+from .carrier_event import CarrierEvent
+from .shipment_job import ShipmentJob
+from .report_job import ReportJob
 
 __all__ = [
     'db',
@@ -19,6 +28,17 @@ __all__ = [
     'Staff',
     'DeliveryPriceList',
     'Expense',
-    'Order'
+    'Order',
+    'StockLot',
+    'StockLotConsumption',
+    'OrderMetricSketch',
+    'InventoryMovement',
+    'InventorySnapshot',
+    'ProductSalesVelocity',
+    'InventoryAlert',
+    'CatalogVersion',
+    'CarrierEvent',
+    'ShipmentJob',
+    'ReportJob'
 ]
 
@@ -0,0 +1,44 @@
+from . import db
+from datetime import datetime
+
+class CarrierEvent(db.Model):
+    """أحداث التتبع المستلمة من شركات التوصيل؛ كل حدث يطبق مرة واحدة فقط"""
+    __tablename__ = 'carrier_events'
+    __table_args__ = (
+        db.UniqueConstraint('carrier', 'event_id', name='uq_carrier_events_carrier_event'),
+        db.Index('ix_carrier_events_tracking', 'tracking_number', 'occurred_at'),
+        db.Index('ix_carrier_events_pending', 'pending', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    carrier = db.Column(db.String(50), nullable=False)
+    event_id = db.Column(db.String(100), nullable=False)
+    tracking_number = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(50), nullable=False)
+    occurred_at = db.Column(db.DateTime, nullable=False)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.order_id'), nullable=True)
+    applied = db.Column(db.Boolean, default=False, nullable=False)
+    # مخزن ولم يطبق بعد؛ المحاولات الفاشلة وآخر خطأ لإيقاف الحدث المعطوب
+    pending = db.Column(db.Boolean, default=False, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'carrier': self.carrier,
+            'event_id': self.event_id,
+            'tracking_number': self.tracking_number,
+            'status': self.status,
+            'occurred_at': self.occurred_at.isoformat() if self.occurred_at else None,
+            'received_at': self.received_at.isoformat() if self.received_at else None,
+            'order_id': self.order_id,
+            'applied': self.applied,
+            'pending': self.pending,
+            'attempts': self.attempts,
+            'last_error': self.last_error
+        }
+    
+    def __repr__(self):
+        return f'<CarrierEvent {self.carrier} {self.event_id}>'
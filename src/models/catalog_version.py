@@ -0,0 +1,19 @@
+from . import db
+from datetime import datetime
+
+class CatalogVersion(db.Model):
+    """عداد إصدار الكتالوج (صف واحد) يُزاد مع كل تغيير على المنتجات"""
+    __tablename__ = 'catalog_version'
+    
+    catalog_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'version': self.version,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+    
+    def __repr__(self):
+        return f'<CatalogVersion {self.version}>'
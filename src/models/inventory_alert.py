@@ -0,0 +1,40 @@
+from . import db
+from datetime import datetime
+
+class InventoryAlert(db.Model):
+    """تنبيهات المخزون؛ تنبيه نشط واحد على الأكثر لكل منتج"""
+    __tablename__ = 'inventory_alerts'
+    __table_args__ = (
+        db.Index('ix_inventory_alerts_active', 'is_active', 'alert_type'),
+        db.Index('ix_inventory_alerts_product', 'product_id', 'is_active'),
+    )
+    
+    LOW_STOCK = 'low_stock'
+    OUT_OF_STOCK = 'out_of_stock'
+    
+    alert_id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.product_id'), nullable=False)
+    alert_type = db.Column(db.String(20), nullable=False)  # low_stock, out_of_stock
+    current_stock = db.Column(db.Integer, nullable=False)
+    threshold = db.Column(db.Integer, nullable=False)
+    is_active = db.Column(db.Boolean, default=True, nullable=False)
+    triggered_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    resolved_at = db.Column(db.DateTime)
+    
+    # Relationships
+    product = db.relationship('Product', lazy=True)
+    
+    def to_dict(self):
+        return {
+            'alert_id': self.alert_id,
+            'product_id': self.product_id,
+            'alert_type': self.alert_type,
+            'current_stock': self.current_stock,
+            'threshold': self.threshold,
+            'is_active': self.is_active,
+            'triggered_at': self.triggered_at.isoformat() if self.triggered_at else None,
+            'resolved_at': self.resolved_at.isoformat() if self.resolved_at else None
+        }
+    
+    def __repr__(self):
+        return f'<InventoryAlert {self.product_id} {self.alert_type}>'
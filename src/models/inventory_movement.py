@@ -0,0 +1,69 @@
+from . import db
+from datetime import datetime
+
+class InventoryMovement(db.Model):
+    """سجل حركات المخزون (إضافة فقط، لا يعدل ولا يحذف)"""
+    __tablename__ = 'inventory_movements'
+    __table_args__ = (
+        db.Index('ix_inventory_movements_product_time', 'product_id', 'created_at'),
+        db.Index('ix_inventory_movements_time_reason', 'created_at', 'reason'),
+    )
+    
+    ORDER = 'order'
+    ORDER_CANCELLED = 'order_cancelled'
+    ORDER_RETURNED = 'order_returned'
+    RESTOCK = 'restock'
+    ADJUSTMENT = 'adjustment'
+    STOCK_SET = 'stock_set'
+    INITIAL = 'initial'
+    
+    movement_id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.product_id'), nullable=False)
+    quantity_change = db.Column(db.Integer, nullable=False)  # موجب للإضافة وسالب للخصم
+    balance_after = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.String(50), nullable=False)
+    reference_type = db.Column(db.String(50))  # order, lot ...
+    reference_id = db.Column(db.Integer)
+    note = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def to_dict(self):
+        return {
+            'movement_id': self.movement_id,
+            'product_id': self.product_id,
+            'quantity_change': self.quantity_change,
+            'balance_after': self.balance_after,
+            'reason': self.reason,
+            'reference_type': self.reference_type,
+            'reference_id': self.reference_id,
+            'note': self.note,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+    
+    def __repr__(self):
+        return f'<InventoryMovement {self.product_id} {self.quantity_change:+d} ({self.reason})>'
+
+class InventorySnapshot(db.Model):
+    """رصيد افتتاح يومي لكل منتج يُكتب مع أول حركة في اليوم"""
+    __tablename__ = 'inventory_snapshots'
+    __table_args__ = (
+        db.UniqueConstraint('product_id', 'day', name='uq_inventory_snapshots_product_day'),
+    )
+    
+    snapshot_id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.product_id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    opening_stock = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'snapshot_id': self.snapshot_id,
+            'product_id': self.product_id,
+            'day': self.day.isoformat() if self.day else None,
+            'opening_stock': self.opening_stock,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+    
+    def __repr__(self):
+        return f'<InventorySnapshot {self.product_id} {self.day}: {self.opening_stock}>'
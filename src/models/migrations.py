@@ -0,0 +1,49 @@
+from sqlalchemy import inspect, text
+from . import db
+
+
+def _literal_default(column):
+    """قيمة افتراضية حرفية للعمود إن كانت بسيطة"""
+    default = column.default
+    if default is None or not getattr(default, 'is_scalar', False):
+        return None
+    value = default.arg
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return None
+
+
+def upgrade_schema():
+    """إضافة الأعمدة والفهارس الجديدة إلى الجداول الموجودة
+
+    db.create_all() لا ينشئ إلا الجداول المفقودة، لذلك نضيف هنا الأعمدة
+    القابلة للإضافة (ALTER TABLE ADD COLUMN) والفهارس الناقصة دون المساس بالبيانات.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            existing_columns = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                default = _literal_default(column)
+                if default is not None:
+                    ddl += f' DEFAULT {default}'
+                connection.execute(text(ddl))
+
+            existing_indexes = {i['name'] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(bind=connection, checkfirst=True)
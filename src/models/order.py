@@ -3,16 +3,37 @@ from datetime import datetime
 
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        db.Index('ix_orders_status_date', 'order_status', 'order_date'),
+        db.Index('ix_orders_order_date', 'order_date'),
+        db.Index('ix_orders_shipping_tracking_id', 'shipping_tracking_id'),
+        db.Index('ix_orders_status_next_poll', 'order_status', 'next_poll_at'),
+    )
+    
+    # الحالات التي تحتسب كمبيعات في التقارير
+    SOLD_STATUSES = ['مؤكد', 'تم الشحن', 'تم التسليم']
     
     order_id = db.Column(db.Integer, primary_key=True)
     customer_name = db.Column(db.String(255), nullable=False)
     customer_phone = db.Column(db.String(20), nullable=False)
     customer_address = db.Column(db.Text, nullable=False)
+    wilaya = db.Column(db.String(100), nullable=True)  # ولاية العميل
     product_id = db.Column(db.Integer, db.ForeignKey('products.product_id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False, default=1)
+    # لقطات الأسعار وقت إنشاء الطلب
+    unit_price = db.Column(db.Float, nullable=True)
+    total_amount = db.Column(db.Float, nullable=True)
+    unit_cost = db.Column(db.Float, nullable=True)
     order_source = db.Column(db.String(50), nullable=False)  # Google Sheet, Webhook
     order_status = db.Column(db.String(50), nullable=False, default='قيد الانتظار')
     # حالات الطلب: قيد الانتظار، اتصال أول، اتصال ثانٍ، مؤكد، ملغى، تم الشحن، تم التسليم، مرتجع
+    # حالة الشحنة لدى شركة التوصيل أثناء 'تم الشحن': في الطريق، خرج للتسليم
+    shipment_status = db.Column(db.String(50), nullable=True)
+    # مهمة الشحن التي تحجز الطلب أثناء إرساله إلى الشركة (ShipmentJobRunner)
+    shipment_job_id = db.Column(db.Integer, nullable=True)
+    # جدولة متابعة الشحنة لدى الشركة (ShipmentPoller)
+    next_poll_at = db.Column(db.DateTime, nullable=True)
+    poll_interval = db.Column(db.Float, nullable=True)
     confirmation_staff_id = db.Column(db.Integer, db.ForeignKey('staff.staff_id'), nullable=True)
     delivery_company_id = db.Column(db.Integer, db.ForeignKey('delivery_companies.company_id'), nullable=True)
     delivery_price = db.Column(db.Float, nullable=True)
@@ -41,10 +62,15 @@ class Order(db.Model):
             'customer_name': self.customer_name,
             'customer_phone': self.customer_phone,
             'customer_address': self.customer_address,
+            'wilaya': self.wilaya,
             'product_id': self.product_id,
             'quantity': self.quantity,
+            'unit_price': self.unit_price,
+            'total_amount': self.total_amount,
+            'unit_cost': self.unit_cost,
             'order_source': self.order_source,
             'order_status': self.order_status,
+            'shipment_status': self.shipment_status,
             'confirmation_staff_id': self.confirmation_staff_id,
             'delivery_company_id': self.delivery_company_id,
             'delivery_price': self.delivery_price,
@@ -62,13 +88,22 @@ class Order(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
     
+    def apply_product_snapshot(self, product):
+        """تثبيت سعر وتكلفة المنتج في الطلب وقت إنشائه"""
+        self.unit_price = product.price
+        self.unit_cost = product.cost_price
+        self.total_amount = (product.price or 0) * (self.quantity or 0)
+    
     def calculate_profit(self):
         """حساب ربح الطلب"""
         if not self.product or self.order_status not in ['تم التسليم']:
             return 0
         
         # إجمالي الإيرادات
-        total_revenue = self.product.price * self.quantity
+        if self.total_amount is not None:
+            total_revenue = self.total_amount
+        else:
+            total_revenue = self.product.price * self.quantity
         
         # إجمالي المصاريف المرتبطة بهذا الطلب
         order_expenses = sum([expense.amount for expense in self.expenses])
@@ -0,0 +1,29 @@
+from . import db
+from datetime import datetime
+
+class OrderMetricSketch(db.Model):
+    __tablename__ = 'order_metric_sketches'
+    __table_args__ = (
+        db.UniqueConstraint('metric', 'day', name='uq_order_metric_sketches_metric_day'),
+    )
+    
+    sketch_id = db.Column(db.Integer, primary_key=True)
+    metric = db.Column(db.String(50), nullable=False)  # order_value, time_to_confirm, time_to_deliver, customers
+    day = db.Column(db.Date, nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # الملخص بصيغة JSON
+    observations = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'sketch_id': self.sketch_id,
+            'metric': self.metric,
+            'day': self.day.isoformat() if self.day else None,
+            'observations': self.observations,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+    
+    def __repr__(self):
+        return f'<OrderMetricSketch {self.metric} {self.day}>'
@@ -3,14 +3,24 @@ from datetime import datetime
 
 class Product(db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        # تقارير المخزون المنخفض والنافد تبحث بالمدى على المخزون الحالي
+        db.Index('ix_products_current_stock', 'current_stock'),
+        # البحث بالبادئة في اسم المنتج (sku مفهرس بقيد التفرد)
+        db.Index('ix_products_product_name', 'product_name'),
+        db.Index('ix_products_updated_at', 'updated_at'),
+    )
     
     product_id = db.Column(db.Integer, primary_key=True)
     product_name = db.Column(db.String(255), nullable=False)
     sku = db.Column(db.String(100), unique=True, nullable=False)
     description = db.Column(db.Text)
     price = db.Column(db.Float, nullable=False)
+    cost_price = db.Column(db.Float, nullable=True)  # سعر الشراء
     current_stock = db.Column(db.Integer, default=0)
     initial_stock = db.Column(db.Integer, default=0)
+    is_active = db.Column(db.Boolean, default=True, nullable=False)  # المنتجات الموقوفة لا تقبل طلبات جديدة
+    low_stock_threshold = db.Column(db.Integer, nullable=True)  # حد التنبيه الخاص بالمنتج (الافتراضي عند عدم تحديده)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -25,8 +35,11 @@ class Product(db.Model):
             'sku': self.sku,
             'description': self.description,
             'price': self.price,
+            'cost_price': self.cost_price,
             'current_stock': self.current_stock,
             'initial_stock': self.initial_stock,
+            'is_active': self.is_active,
+            'low_stock_threshold': self.low_stock_threshold,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
@@ -0,0 +1,24 @@
+from . import db
+from datetime import datetime
+
+class ProductSalesVelocity(db.Model):
+    """حالة سرعة البيع اليومية (متوسط أسي) لكل منتج"""
+    __tablename__ = 'product_sales_velocity'
+    
+    product_id = db.Column(db.Integer, db.ForeignKey('products.product_id'), primary_key=True)
+    velocity = db.Column(db.Float, nullable=False, default=0.0)  # المتوسط حتى نهاية اليوم السابق لـ day
+    day = db.Column(db.Date, nullable=False)  # اليوم الجاري تجميعه
+    day_units = db.Column(db.Integer, nullable=False, default=0)  # صافي الوحدات المباعة في day
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'product_id': self.product_id,
+            'velocity': self.velocity,
+            'day': self.day.isoformat() if self.day else None,
+            'day_units': self.day_units,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+    
+    def __repr__(self):
+        return f'<ProductSalesVelocity {self.product_id}: {self.velocity:.2f}/day>'
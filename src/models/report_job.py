@@ -0,0 +1,37 @@
+from . import db
+from datetime import datetime
+import json
+
+class ReportJob(db.Model):
+    """مهمة تقرير في الخلفية؛ النتيجة نفسها ملف مضغوط في REPORT_JOBS_DIR"""
+    __tablename__ = 'report_jobs'
+    __table_args__ = (
+        db.Index('ix_report_jobs_spec_status', 'spec_hash', 'status'),
+    )
+    
+    job_id = db.Column(db.String(32), primary_key=True)
+    report = db.Column(db.String(100), nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    spec_hash = db.Column(db.String(40), nullable=False)  # لدمج المهام المتطابقة قيد التنفيذ
+    status = db.Column(db.String(20), nullable=False)
+    error = db.Column(db.Text)
+    result_size = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'report': self.report,
+            'params': json.loads(self.params or '{}'),
+            'status': self.status,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'error': self.error,
+            'result_size': self.result_size
+        }
+    
+    def __repr__(self):
+        return f'<ReportJob {self.job_id} {self.status}>'
@@ -0,0 +1,54 @@
+from . import db
+from datetime import datetime
+import json
+
+class ShipmentJob(db.Model):
+    """مهمة إنشاء شحنات مجمعة؛ تحفظ نتيجة كل طلب لتستأنف من الطلبات الفاشلة فقط"""
+    __tablename__ = 'shipment_jobs'
+    
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    PARTIAL = 'partial'
+    FAILED = 'failed'
+    
+    job_id = db.Column(db.Integer, primary_key=True)
+    service_name = db.Column(db.String(50))  # فارغ = شركة التوصيل المسجلة في كل طلب
+    status = db.Column(db.String(20), nullable=False, default=PENDING)
+    order_ids = db.Column(db.Text, nullable=False)  # JSON
+    options = db.Column(db.Text, nullable=False, default='{}')  # JSON: أبعاد الطرد وبيانات المرسل
+    results = db.Column(db.Text, nullable=False, default='{}')  # JSON: order_id -> نتيجة
+    total_orders = db.Column(db.Integer, nullable=False, default=0)
+    created_count = db.Column(db.Integer, nullable=False, default=0)
+    failed_count = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def get_order_ids(self):
+        return json.loads(self.order_ids or '[]')
+    
+    def get_options(self):
+        return json.loads(self.options or '{}')
+    
+    def get_results(self):
+        return json.loads(self.results or '{}')
+    
+    def to_dict(self, include_results=True):
+        data = {
+            'job_id': self.job_id,
+            'service_name': self.service_name,
+            'status': self.status,
+            'total_orders': self.total_orders,
+            'created_count': self.created_count,
+            'failed_count': self.failed_count,
+            'attempts': self.attempts,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+        if include_results:
+            data['results'] = self.get_results()
+        return data
+    
+    def __repr__(self):
+        return f'<ShipmentJob {self.job_id} {self.status}>'
@@ -0,0 +1,63 @@
+from . import db
+from datetime import datetime
+
+class StockLot(db.Model):
+    __tablename__ = 'stock_lots'
+    __table_args__ = (
+        # قائمة الدفعات المفتوحة لكل منتج بترتيب FIFO دون المرور على الدفعات المستهلكة
+        db.Index(
+            'ix_stock_lots_open_fifo', 'product_id', 'received_at', 'lot_id',
+            sqlite_where=db.text('remaining_quantity > 0'),
+            postgresql_where=db.text('remaining_quantity > 0')
+        ),
+    )
+    
+    lot_id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.product_id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    remaining_quantity = db.Column(db.Integer, nullable=False)
+    unit_cost = db.Column(db.Float, nullable=False)  # سعر الشراء للوحدة في هذه الدفعة
+    reference = db.Column(db.String(255))  # رقم فاتورة الشراء أو الحاوية
+    received_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    consumptions = db.relationship('StockLotConsumption', backref='lot', lazy=True)
+    
+    def to_dict(self):
+        return {
+            'lot_id': self.lot_id,
+            'product_id': self.product_id,
+            'quantity': self.quantity,
+            'remaining_quantity': self.remaining_quantity,
+            'unit_cost': self.unit_cost,
+            'reference': self.reference,
+            'received_at': self.received_at.isoformat() if self.received_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+    
+    def __repr__(self):
+        return f'<StockLot {self.lot_id}: {self.remaining_quantity}/{self.quantity}>'
+
+class StockLotConsumption(db.Model):
+    __tablename__ = 'stock_lot_consumptions'
+    
+    consumption_id = db.Column(db.Integer, primary_key=True)
+    lot_id = db.Column(db.Integer, db.ForeignKey('stock_lots.lot_id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.order_id'), nullable=False, index=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    unit_cost = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'consumption_id': self.consumption_id,
+            'lot_id': self.lot_id,
+            'order_id': self.order_id,
+            'quantity': self.quantity,
+            'unit_cost': self.unit_cost,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+    
+    def __repr__(self):
+        return f'<StockLotConsumption lot={self.lot_id} order={self.order_id}: {self.quantity}>'
@@ -0,0 +1,133 @@
+from flask import Blueprint, request, jsonify
+from src.models import Order
+from src.services.analytics_snapshot import OrderAnalyticsSnapshot, to_day
+from datetime import datetime
+import os
+
+analytics_bp = Blueprint('analytics', __name__)
+
+# لقطة التحليلات المشتركة لهذه العملية
+analytics_snapshot = OrderAnalyticsSnapshot()
+
+ANALYTICS_MAX_AGE = float(os.getenv('ANALYTICS_MAX_AGE', 30))
+ANALYTICS_FULL_REFRESH_SECONDS = float(os.getenv('ANALYTICS_FULL_REFRESH_SECONDS', 3600))
+
+def _split_arg(name):
+    value = request.args.get(name)
+    return [item.strip() for item in value.split(',') if item.strip()] if value else []
+
+def _day_arg(name):
+    value = request.args.get(name)
+    return to_day(datetime.fromisoformat(value)) if value else None
+
+@analytics_bp.route('/analytics/orders/aggregate', methods=['GET'])
+def aggregate_orders():
+    """تجميع الطلبات حسب المنتج والولاية والفترة"""
+    try:
+        group_by = _split_arg('group_by')
+        metrics = _split_arg('metrics') or ['revenue', 'orders']
+        statuses = _split_arg('status')
+        limit = request.args.get('limit', 1000)
+        
+        # افتراضياً نحتسب الطلبات المباعة فقط، و status=all لجميع الحالات
+        if not statuses:
+            statuses = Order.SOLD_STATUSES
+        elif statuses == ['all']:
+            statuses = None
+        
+        analytics_snapshot.ensure_fresh(ANALYTICS_MAX_AGE, ANALYTICS_FULL_REFRESH_SECONDS)
+        
+        rows = analytics_snapshot.aggregate_orders(
+            group_by=group_by,
+            metrics=metrics,
+            start_day=_day_arg('start_date'),
+            end_day=_day_arg('end_date'),
+            statuses=statuses,
+            product_ids=[int(p) for p in _split_arg('product_id')],
+            wilayas=_split_arg('wilaya'),
+            sources=_split_arg('source'),
+            limit=int(limit) if limit else None
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'group_by': group_by,
+                'metrics': metrics,
+                'rows': rows,
+                'total_groups': len(rows)
+            }
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في تجميع الطلبات: {str(e)}'
+        }), 500
+
+@analytics_bp.route('/analytics/expenses/aggregate', methods=['GET'])
+def aggregate_expenses():
+    """تجميع المصاريف حسب النوع والفترة"""
+    try:
+        group_by = _split_arg('group_by') or ['expense_type']
+        
+        analytics_snapshot.ensure_fresh(ANALYTICS_MAX_AGE, ANALYTICS_FULL_REFRESH_SECONDS)
+        
+        rows = analytics_snapshot.aggregate_expenses(
+            group_by=group_by,
+            start_day=_day_arg('start_date'),
+            end_day=_day_arg('end_date'),
+            expense_types=_split_arg('expense_type')
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'group_by': group_by,
+                'rows': rows,
+                'total_groups': len(rows)
+            }
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في تجميع المصاريف: {str(e)}'
+        }), 500
+
+@analytics_bp.route('/analytics/refresh', methods=['POST'])
+def refresh_analytics():
+    """تحديث لقطة التحليلات يدوياً"""
+    try:
+        full = request.args.get('full', 'false').lower() == 'true'
+        analytics_snapshot.refresh(full=full)
+        
+        return jsonify({
+            'success': True,
+            'message': 'تم تحديث لقطة التحليلات',
+            'data': analytics_snapshot.status()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في تحديث لقطة التحليلات: {str(e)}'
+        }), 500
+
+@analytics_bp.route('/analytics/status', methods=['GET'])
+def get_analytics_status():
+    """حالة لقطة التحليلات"""
+    return jsonify({
+        'success': True,
+        'data': analytics_snapshot.status()
+    }), 200
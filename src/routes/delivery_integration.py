@@ -1,7 +1,13 @@
-from flask import Blueprint, request, jsonify
-from src.models import db, Order, DeliveryCompany
+from flask import Blueprint, request, jsonify, current_app
+from src.models import db, Order, DeliveryCompany, ShipmentJob
 from src.services.delivery_integration import DeliveryManager, DeliveryServiceFactory
-from datetime import datetime
+from src.services.shipment_tracking import ShipmentTracker, resolve_tracking_numbers, apply_shipment_status
+from src.services.shipment_poller import ShipmentPoller
+from src.services.shipment_jobs import (ShipmentJobRunner, ShipmentJobRunningError, shipment_payload, select_orders,
+                                        SHIPPABLE_STATUS, SHIPPED_STATUS)
+from src.services.order_status import change_order_status
+from src.services.shipping_quotes import quote_cache, rate_shop
+from src.services.shipment_callbacks import callback_buffer, webhook_secret, verify_signature, normalize_events
 
 delivery_integration_bp = Blueprint('delivery_integration', __name__)
 
@@ -21,6 +27,9 @@ try:
 except Exception as e:
     print(f"فشل في تسجيل خدمة Aramex: {str(e)}")
 
+# متابعة حالات الشحنات الجارية دورياً
+shipment_poller = ShipmentPoller(delivery_manager)
+
 @delivery_integration_bp.route('/delivery/services', methods=['GET'])
 def get_available_services():
     """جلب قائمة بخدمات التوصيل المتاحة"""
@@ -35,10 +44,13 @@ def get_available_services():
             # البحث عن الشركة في قاعدة البيانات
             db_company = next((c for c in db_companies if c.company_name.lower() == service_name), None)
             
+            breaker = delivery_manager.get_breaker_state(service_name)
             service_details.append({
                 'service_name': service_name,
                 'display_name': service_name.title(),
                 'is_configured': True,  # لأنها مسجلة في المدير
+                'is_available': breaker is None or breaker['state'] != 'open',
+                'circuit_breaker': breaker,
                 'database_info': db_company.to_dict() if db_company else None
             })
         
@@ -54,6 +66,115 @@ def get_available_services():
             'message': f'خطأ في جلب خدمات التوصيل: {str(e)}'
         }), 500
 
+@delivery_integration_bp.route('/delivery/stats', methods=['GET'])
+def get_delivery_http_stats():
+    """إحصائيات الاتصالات وزمن الاستجابة لكل شركة توصيل"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': delivery_manager.get_http_stats()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في جلب إحصائيات التوصيل: {str(e)}'
+        }), 500
+
+@delivery_integration_bp.route('/delivery/poller', methods=['GET'])
+def get_poller_status():
+    """حالة متابعة الشحنات الجارية"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': shipment_poller.status()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في جلب حالة متابعة الشحنات: {str(e)}'
+        }), 500
+
+@delivery_integration_bp.route('/delivery/poller/run', methods=['POST'])
+def run_poller():
+    """تنفيذ دورة متابعة فورية للشحنات المستحقة"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': shipment_poller.poll_once()
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في متابعة الشحنات: {str(e)}'
+        }), 500
+
+@delivery_integration_bp.route('/delivery/callbacks/<carrier>', methods=['POST'])
+def receive_carrier_callback(carrier):
+    """استقبال تحديثات التتبع المرسلة من شركة التوصيل"""
+    try:
+        carrier = carrier.lower()
+        if not delivery_manager.get_service(carrier):
+            return jsonify({
+                'success': False,
+                'message': f'خدمة التوصيل {carrier} غير متاحة'
+            }), 404
+        
+        # التحقق من توقيع الإشعار بالسر المشترك مع الشركة
+        body = request.get_data()
+        if not verify_signature(webhook_secret(carrier), body, request.headers.get('X-Signature')):
+            return jsonify({
+                'success': False,
+                'message': 'توقيع الإشعار غير صحيح'
+            }), 401
+        
+        payload = request.get_json(silent=True)
+        if payload is None:
+            return jsonify({
+                'success': False,
+                'message': 'لا توجد بيانات في الطلب'
+            }), 400
+        
+        events = normalize_events(carrier, payload)
+        # الأحداث تخزن قبل الرد، وتطبق على الطلبات في الخلفية
+        stored = callback_buffer.add(current_app._get_current_object(), events)
+        
+        return jsonify({
+            'success': True,
+            'accepted_events': len(events),
+            'new_events': stored
+        }), 202
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في استقبال إشعار التتبع: {str(e)}'
+        }), 500
+
+@delivery_integration_bp.route('/delivery/callbacks/status', methods=['GET'])
+def get_callbacks_status():
+    """إحصائيات إشعارات التتبع المستلمة"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': callback_buffer.status()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في جلب إحصائيات الإشعارات: {str(e)}'
+        }), 500
+
 @delivery_integration_bp.route('/delivery/create-shipment', methods=['POST'])
 def create_shipment():
     """إنشاء شحنة جديدة"""
@@ -79,42 +200,30 @@ def create_shipment():
                 'message': 'الطلب غير موجود'
             }), 404
         
+        # نفس شروط مهام الشحن المجمعة: طلب مؤكد بلا رقم تتبع ولا تحجزه مهمة
+        if order.order_status != SHIPPABLE_STATUS or order.shipping_tracking_id:
+            return jsonify({
+                'success': False,
+                'message': f'لا يمكن شحن طلب حالته {order.order_status}'
+                           if order.order_status != SHIPPABLE_STATUS else 'الطلب لديه رقم تتبع مسبقاً'
+            }), 400
+        if order.shipment_job_id:
+            return jsonify({
+                'success': False,
+                'message': f'الطلب قيد الإرسال في مهمة الشحن {order.shipment_job_id}'
+            }), 409
+        
         # تحضير بيانات الشحنة
-        shipment_data = {
-            'order_id': str(order.order_id),
-            'customer_name': order.customer_name,
-            'customer_phone': order.customer_phone,
-            'customer_address': order.customer_address,
-            'product_description': f'طلب رقم {order.order_id}',
-            'total_amount': float(order.total_amount or 0),
-            'weight': data.get('weight', 1),
-            'length': data.get('length', 10),
-            'width': data.get('width', 10),
-            'height': data.get('height', 10),
-            'declared_value': float(order.total_amount or 0),
-            'insurance': data.get('insurance', False),
-            'free_shipping': data.get('free_shipping', False),
-            'from_wilaya': data.get('from_wilaya', 'الجزائر'),
-            'to_wilaya': data.get('to_wilaya', ''),
-            'to_commune': data.get('to_commune', ''),
-            'sender_name': data.get('sender_name', ''),
-            'sender_company': data.get('sender_company', ''),
-            'sender_phone': data.get('sender_phone', ''),
-            'sender_address': data.get('sender_address', ''),
-            'sender_email': data.get('sender_email', ''),
-            'customer_email': data.get('customer_email', ''),
-            'comments': data.get('comments', order.notes or '')
-        }
+        shipment_data = shipment_payload(order, data)
         
         # إنشاء الشحنة
         result = delivery_manager.create_shipment_with_service(service_name, shipment_data)
         
         if result['success']:
             # تحديث الطلب بمعلومات الشحنة
-            order.tracking_number = result.get('tracking_number', '')
-            order.delivery_company_id = data.get('delivery_company_id')
-            order.order_status = 'تم الشحن'
-            order.shipped_date = datetime.utcnow()
+            order.shipping_tracking_id = result.get('tracking_number', '')
+            order.delivery_company_id = data.get('delivery_company_id', order.delivery_company_id)
+            change_order_status(order, SHIPPED_STATUS)
             
             db.session.commit()
             
@@ -139,17 +248,132 @@ def create_shipment():
             'message': f'خطأ في إنشاء الشحنة: {str(e)}'
         }), 500
 
+@delivery_integration_bp.route('/delivery/create-shipments', methods=['POST'])
+def create_shipments():
+    """إنشاء شحنات عدة طلبات دفعة واحدة (قائمة order_ids أو فلتر)"""
+    try:
+        data = request.get_json() or {}
+        
+        if 'order_ids' in data:
+            if not isinstance(data['order_ids'], list):
+                return jsonify({
+                    'success': False,
+                    'message': 'order_ids يجب أن تكون مصفوفة'
+                }), 400
+            order_ids = data['order_ids']
+        else:
+            order_ids = select_orders(data.get('filter', {}))
+        
+        runner = ShipmentJobRunner(delivery_manager)
+        job = runner.create_job(order_ids, data.get('service_name'), data.get('options', {}))
+        job = runner.run(job)
+        
+        return jsonify({
+            'success': job.status != ShipmentJob.FAILED,
+            'job': job.to_dict()
+        }), 201 if job.status != ShipmentJob.FAILED else 400
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في إنشاء الشحنات: {str(e)}'
+        }), 500
+
+@delivery_integration_bp.route('/delivery/shipment-jobs/<int:job_id>', methods=['GET'])
+def get_shipment_job(job_id):
+    """حالة مهمة إنشاء الشحنات ونتيجة كل طلب"""
+    try:
+        job = db.session.get(ShipmentJob, job_id)
+        if not job:
+            return jsonify({
+                'success': False,
+                'message': 'المهمة غير موجودة'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'job': job.to_dict()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في جلب المهمة: {str(e)}'
+        }), 500
+
+@delivery_integration_bp.route('/delivery/shipment-jobs/<int:job_id>/resume', methods=['POST'])
+def resume_shipment_job(job_id):
+    """إعادة محاولة الطلبات الفاشلة في مهمة إنشاء الشحنات
+
+    resubmit_order_ids: طلبات انقطع إرسالها يعاد إرسالها دون البحث عنها لدى الشركة
+    (للشركات التي لا تدعم البحث برقم الطلب، بعد التحقق يدوياً أنها لم تنشأ).
+    """
+    try:
+        job = db.session.get(ShipmentJob, job_id)
+        if not job:
+            return jsonify({
+                'success': False,
+                'message': 'المهمة غير موجودة'
+            }), 404
+        
+        if job.status == ShipmentJob.COMPLETED:
+            return jsonify({
+                'success': True,
+                'message': 'المهمة مكتملة',
+                'job': job.to_dict()
+            }), 200
+        
+        data = request.get_json(silent=True) or {}
+        resubmit = data.get('resubmit_order_ids', [])
+        if not isinstance(resubmit, list):
+            return jsonify({
+                'success': False,
+                'message': 'resubmit_order_ids يجب أن تكون مصفوفة'
+            }), 400
+        
+        job = ShipmentJobRunner(delivery_manager).run(job, resubmit=resubmit)
+        
+        return jsonify({
+            'success': job.status != ShipmentJob.FAILED,
+            'job': job.to_dict()
+        }), 200
+        
+    except ShipmentJobRunningError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 409
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'قيمة غير صحيحة: {str(e)}'
+        }), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في استئناف المهمة: {str(e)}'
+        }), 500
+
 @delivery_integration_bp.route('/delivery/track/<tracking_number>', methods=['GET'])
 def track_shipment(tracking_number):
     """تتبع شحنة"""
     try:
         service_name = request.args.get('service_name')
         
+        order, order_service = resolve_tracking_numbers([tracking_number]).get(tracking_number, (None, None))
+        
         if not service_name:
             # محاولة العثور على الخدمة من قاعدة البيانات
-            order = Order.query.filter_by(tracking_number=tracking_number).first()
-            if order and order.delivery_company:
-                service_name = order.delivery_company.company_name.lower()
+            if order_service:
+                service_name = order_service
             else:
                 return jsonify({
                     'success': False,
@@ -160,32 +384,18 @@ def track_shipment(tracking_number):
         result = delivery_manager.track_shipment_with_service(service_name, tracking_number)
         
         if result['success']:
-            # تحديث حالة الطلب إذا كان موجوداً
-            order = Order.query.filter_by(tracking_number=tracking_number).first()
-            if order:
-                # تحديث حالة الطلب بناءً على حالة الشحنة
-                status_mapping = {
-                    'delivered': 'تم التسليم',
-                    'in_transit': 'في الطريق',
-                    'out_for_delivery': 'خرج للتسليم',
-                    'returned': 'مرتجع',
-                    'cancelled': 'ملغي'
-                }
-                
-                shipment_status = result.get('status', '').lower()
-                new_order_status = status_mapping.get(shipment_status, order.order_status)
-                
-                if new_order_status != order.order_status:
-                    order.order_status = new_order_status
-                    order.last_status_update = datetime.utcnow()
-                    db.session.commit()
+            # تحديث حالة الطلب بناءً على حالة الشحنة إذا كان موجوداً
+            order_updated = False
+            if order and apply_shipment_status(order, result.get('status', '')):
+                db.session.commit()
+                order_updated = True
             
             return jsonify({
                 'success': True,
                 'tracking_number': tracking_number,
                 'service_name': service_name,
                 'tracking_data': result,
-                'order_updated': order is not None
+                'order_updated': order_updated
             }), 200
         else:
             return jsonify({
@@ -195,6 +405,7 @@ def track_shipment(tracking_number):
             }), 400
             
     except Exception as e:
+        db.session.rollback()
         return jsonify({
             'success': False,
             'message': f'خطأ في تتبع الشحنة: {str(e)}'
@@ -240,7 +451,8 @@ def calculate_shipping_cost():
                 'message': f'خدمة التوصيل {service_name} غير متاحة'
             }), 404
         
-        result = service.get_shipping_cost(cost_data)
+        # الأسعار المتطابقة في الشريحة نفسها تؤخذ من الذاكرة المؤقتة
+        result = quote_cache.get_shipping_cost(service_name, service, cost_data)
         
         return jsonify({
             'success': result['success'],
@@ -255,6 +467,53 @@ def calculate_shipping_cost():
             'message': f'خطأ في حساب تكلفة الشحن: {str(e)}'
         }), 500
 
+@delivery_integration_bp.route('/delivery/rate-shop', methods=['POST'])
+def rate_shop_shipping():
+    """مقارنة أسعار جميع شركات التوصيل وإرجاع الأرخص"""
+    try:
+        data = request.get_json() or {}
+        
+        cost_data = {
+            'from_wilaya': data.get('from_wilaya', 'الجزائر'),
+            'to_wilaya': data.get('to_wilaya', ''),
+            'weight': data.get('weight', 1),
+            'length': data.get('length', 10),
+            'width': data.get('width', 10),
+            'height': data.get('height', 10),
+            'declared_value': float(data.get('declared_value', 0)),
+            'sender_address': data.get('sender_address', ''),
+            'sender_city': data.get('sender_city', 'Algiers'),
+            'customer_address': data.get('customer_address', ''),
+            'customer_city': data.get('customer_city', ''),
+            'product_description': data.get('product_description', '')
+        }
+        
+        product_id = data.get('product_id')
+        result = rate_shop(
+            delivery_manager,
+            cost_data,
+            product_id=int(product_id) if product_id is not None else None,
+            quantity=int(data.get('quantity', 1)),
+            region=data.get('region', cost_data['to_wilaya']),
+            budget_ms=float(data['budget_ms']) if 'budget_ms' in data else None
+        )
+        
+        return jsonify({
+            'success': result['cheapest'] is not None,
+            **result
+        }), 200 if result['cheapest'] is not None else 404
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': f'قيمة غير صحيحة: {str(e)}'
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في مقارنة أسعار الشحن: {str(e)}'
+        }), 500
+
 @delivery_integration_bp.route('/delivery/bulk-track', methods=['POST'])
 def bulk_track_shipments():
     """تتبع عدة شحنات دفعة واحدة"""
@@ -270,57 +529,22 @@ def bulk_track_shipments():
         tracking_numbers = data['tracking_numbers']
         service_name = data.get('service_name')
         
-        results = []
-        
-        for tracking_number in tracking_numbers:
-            try:
-                # تحديد خدمة التوصيل إذا لم تكن محددة
-                current_service = service_name
-                if not current_service:
-                    order = Order.query.filter_by(tracking_number=tracking_number).first()
-                    if order and order.delivery_company:
-                        current_service = order.delivery_company.company_name.lower()
-                
-                if current_service:
-                    result = delivery_manager.track_shipment_with_service(current_service, tracking_number)
-                    results.append({
-                        'tracking_number': tracking_number,
-                        'service_name': current_service,
-                        'result': result
-                    })
-                else:
-                    results.append({
-                        'tracking_number': tracking_number,
-                        'service_name': None,
-                        'result': {
-                            'success': False,
-                            'message': 'لا يمكن تحديد خدمة التوصيل'
-                        }
-                    })
-                    
-            except Exception as e:
-                results.append({
-                    'tracking_number': tracking_number,
-                    'service_name': current_service,
-                    'result': {
-                        'success': False,
-                        'message': f'خطأ في التتبع: {str(e)}'
-                    }
-                })
-        
-        # إحصائيات
-        successful_tracks = sum(1 for r in results if r['result']['success'])
-        failed_tracks = len(results) - successful_tracks
+        if not isinstance(tracking_numbers, list):
+            return jsonify({
+                'success': False,
+                'message': 'قائمة أرقام التتبع يجب أن تكون مصفوفة'
+            }), 400
+        
+        # التتبع يتم بالتوازي وتحديث الطلبات في معاملة واحدة
+        summary = ShipmentTracker(delivery_manager).track_many(tracking_numbers, service_name)
         
         return jsonify({
             'success': True,
-            'total_shipments': len(tracking_numbers),
-            'successful_tracks': successful_tracks,
-            'failed_tracks': failed_tracks,
-            'results': results
+            **summary
         }), 200
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({
             'success': False,
             'message': f'خطأ في التتبع المجمع: {str(e)}'
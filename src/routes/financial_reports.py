@@ -1,10 +1,60 @@
 from flask import Blueprint, request, jsonify
-from src.models import db, Order, Product, Expense, DeliveryPriceList
+from src.models import db, Order, Product, Expense
+from src.services.order_snapshots import backfill_order_snapshots
+from src.services.order_archive import get_order_archive
+from src.services.order_profit import listed_delivery_prices
+from src.services.order_metrics import OrderMetricsRecorder
 from datetime import datetime, timedelta
-from sqlalchemy import func, and_
+from sqlalchemy import func, and_, case
 
 financial_reports_bp = Blueprint('financial_reports', __name__)
 
+PROFITABILITY_SORT_FIELDS = ['net_profit', 'gross_profit', 'total_revenue', 'total_quantity_sold', 'profit_margin']
+
+def _sales_totals(start, end):
+    """إجماليات المبيعات في فترة محددة باستعلام تجميعي واحد"""
+    orders_count, quantity, revenue, cogs = db.session.query(
+        func.count(Order.order_id),
+        func.coalesce(func.sum(Order.quantity), 0),
+        func.coalesce(func.sum(Order.total_amount), 0),
+        func.coalesce(func.sum(Order.unit_cost * Order.quantity), 0)
+    ).filter(
+        Order.order_date >= start,
+        Order.order_date <= end,
+        Order.order_status.in_(Order.SOLD_STATUSES)
+    ).one()
+    
+    # إضافة الطلبات المؤرشفة في نفس الفترة
+    archived = get_order_archive().sales_totals(start, end, Order.SOLD_STATUSES)
+    
+    return {
+        'orders': orders_count + archived['orders'],
+        'quantity': int(quantity) + archived['quantity'],
+        'revenue': float(revenue) + archived['revenue'],
+        'cogs': float(cogs) + archived['cogs']
+    }
+
+def _profitability_entry(product_id, product_name, sku, quantity, orders, revenue, cogs, delivery_costs, product_expenses):
+    """بناء سطر ربحية منتج من الإجماليات"""
+    gross_profit = revenue - cogs
+    net_profit = gross_profit - delivery_costs - product_expenses
+    
+    return {
+        'product_id': product_id,
+        'product_name': product_name,
+        'sku': sku,
+        'total_quantity_sold': quantity,
+        'total_orders': orders,
+        'total_revenue': revenue,
+        'total_cogs': cogs,
+        'delivery_costs': delivery_costs,
+        'product_expenses': product_expenses,
+        'gross_profit': gross_profit,
+        'net_profit': net_profit,
+        'profit_margin': (net_profit / revenue * 100) if revenue else 0,
+        'average_order_value': revenue / orders if orders > 0 else 0
+    }
+
 @financial_reports_bp.route('/financial/profit-loss', methods=['GET'])
 def get_profit_loss_report():
     """تقرير الأرباح والخسائر"""
@@ -23,27 +73,15 @@ def get_profit_loss_report():
         end_date_obj = datetime.fromisoformat(end_date)
         
         # الطلبات المؤكدة والمسلمة في الفترة المحددة
-        confirmed_orders = Order.query.filter(
-            Order.order_date >= start_date_obj,
-            Order.order_date <= end_date_obj,
-            Order.order_status.in_(['مؤكد', 'تم الشحن', 'تم التسليم'])
-        ).all()
+        sales = _sales_totals(start_date_obj, end_date_obj)
         
         # حساب الإيرادات
-        total_revenue = 0
-        total_orders = len(confirmed_orders)
-        total_quantity_sold = 0
-        
-        for order in confirmed_orders:
-            if order.total_amount:
-                total_revenue += float(order.total_amount)
-            total_quantity_sold += order.quantity
+        total_revenue = sales['revenue']
+        total_orders = sales['orders']
+        total_quantity_sold = sales['quantity']
         
         # حساب تكلفة البضاعة المباعة (COGS)
-        total_cogs = 0
-        for order in confirmed_orders:
-            if order.product and order.product.cost_price:
-                total_cogs += float(order.product.cost_price) * order.quantity
+        total_cogs = sales['cogs']
         
         # إجمالي المصاريف في الفترة
         total_expenses = db.session.query(
@@ -126,56 +164,138 @@ def get_product_profitability():
         start_date_obj = datetime.fromisoformat(start_date)
         end_date_obj = datetime.fromisoformat(end_date)
         
-        # جلب بيانات المبيعات حسب المنتج
-        product_sales = db.session.query(
-            Order.product_id,
-            func.sum(Order.quantity).label('total_quantity'),
-            func.sum(Order.total_amount).label('total_revenue'),
-            func.count(Order.order_id).label('total_orders')
+        top = request.args.get('top')
+        sort_by = request.args.get('sort_by', 'net_profit')
+        sort_order = request.args.get('order', 'desc')
+        
+        if sort_by not in PROFITABILITY_SORT_FIELDS:
+            return jsonify({
+                'success': False,
+                'message': f'sort_by يجب أن يكون أحد القيم التالية: {", ".join(PROFITABILITY_SORT_FIELDS)}'
+            }), 400
+        
+        # مصاريف كل طلب مجمعة مسبقاً حتى لا تتكرر صفوف الطلب في الربط
+        order_expenses = db.session.query(
+            Expense.order_id.label('order_id'),
+            func.sum(Expense.amount).label('amount')
+        ).filter(
+            Expense.order_id.isnot(None)
+        ).group_by(Expense.order_id).subquery()
+        
+        # سعر التوصيل من قائمة الأسعار للطلبات التي لم يسجل لها سعر توصيل
+        listed_prices = listed_delivery_prices()
+        
+        total_quantity = func.coalesce(func.sum(Order.quantity), 0)
+        total_revenue = func.coalesce(func.sum(Order.total_amount), 0)
+        total_cogs = func.coalesce(func.sum(Order.unit_cost * Order.quantity), 0)
+        delivery_costs = func.coalesce(func.sum(func.coalesce(
+            Order.delivery_price,
+            listed_prices.c.price_per_unit * Order.quantity,
+            0
+        )), 0)
+        product_expenses = func.coalesce(func.sum(order_expenses.c.amount), 0)
+        gross_profit = total_revenue - total_cogs
+        net_profit = gross_profit - delivery_costs - product_expenses
+        profit_margin = func.coalesce(net_profit * 100.0 / func.nullif(total_revenue, 0), 0)
+        
+        sort_columns = {
+            'net_profit': net_profit,
+            'gross_profit': gross_profit,
+            'total_revenue': total_revenue,
+            'total_quantity_sold': total_quantity,
+            'profit_margin': profit_margin
+        }
+        sort_column = sort_columns[sort_by]
+        
+        # جلب بيانات الربحية حسب المنتج في استعلام واحد
+        query = db.session.query(
+            Product.product_id,
+            Product.product_name,
+            Product.sku,
+            total_quantity.label('total_quantity'),
+            func.count(Order.order_id).label('total_orders'),
+            total_revenue.label('total_revenue'),
+            total_cogs.label('total_cogs'),
+            delivery_costs.label('delivery_costs'),
+            product_expenses.label('product_expenses'),
+            gross_profit.label('gross_profit'),
+            net_profit.label('net_profit'),
+            profit_margin.label('profit_margin'),
+            func.count().over().label('total_products')
+        ).join(
+            Order, Order.product_id == Product.product_id
+        ).outerjoin(
+            order_expenses, order_expenses.c.order_id == Order.order_id
+        ).outerjoin(
+            listed_prices, and_(
+                listed_prices.c.product_id == Order.product_id,
+                listed_prices.c.delivery_company_id == Order.delivery_company_id
+            )
         ).filter(
             Order.order_date >= start_date_obj,
             Order.order_date <= end_date_obj,
-            Order.order_status.in_(['مؤكد', 'تم الشحن', 'تم التسليم'])
-        ).group_by(Order.product_id).all()
-        
-        product_profitability = []
-        
-        for product_id, total_quantity, total_revenue, total_orders in product_sales:
-            product = Product.query.get(product_id)
+            Order.order_status.in_(Order.SOLD_STATUSES)
+        ).group_by(
+            Product.product_id,
+            Product.product_name,
+            Product.sku
+        ).order_by(
+            sort_column.asc() if sort_order == 'asc' else sort_column.desc(),
+            Product.product_id
+        )
+        
+        # الطلبات المؤرشفة في الفترة تدمج مع نتائج قاعدة البيانات
+        archive = get_order_archive()
+        archived_sales = {}
+        if archive.overlaps(start_date_obj, end_date_obj):
+            archived_sales = archive.sales_by_product(start_date_obj, end_date_obj, Order.SOLD_STATUSES)
+        
+        if top and not archived_sales:
+            query = query.limit(int(top))
+        
+        rows = query.all()
+        
+        product_profitability = [
+            _profitability_entry(
+                row.product_id, row.product_name, row.sku,
+                int(row.total_quantity), row.total_orders, float(row.total_revenue),
+                float(row.total_cogs), float(row.delivery_costs), float(row.product_expenses)
+            )
+            for row in rows
+        ]
+        total_products = rows[0].total_products if rows else 0
+        
+        if archived_sales:
+            entries = {entry['product_id']: entry for entry in product_profitability}
+            missing_ids = [product_id for product_id in archived_sales if product_id not in entries]
+            products = {
+                product.product_id: product
+                for product in Product.query.filter(Product.product_id.in_(missing_ids)).all()
+            } if missing_ids else {}
             
-            if not product:
-                continue
+            for product_id, archived in archived_sales.items():
+                entry = entries.get(product_id)
+                product = products.get(product_id)
+                entries[product_id] = _profitability_entry(
+                    product_id,
+                    entry['product_name'] if entry else (product.product_name if product else 'منتج محذوف'),
+                    entry['sku'] if entry else (product.sku if product else ''),
+                    (entry['total_quantity_sold'] if entry else 0) + int(archived['quantity']),
+                    (entry['total_orders'] if entry else 0) + archived['orders'],
+                    (entry['total_revenue'] if entry else 0) + archived['total_amount'],
+                    (entry['total_cogs'] if entry else 0) + archived['cogs'],
+                    (entry['delivery_costs'] if entry else 0) + archived['delivery_price'],
+                    (entry['product_expenses'] if entry else 0) + archived['order_expenses']
+                )
             
-            # حساب التكاليف
-            total_cogs = float(product.cost_price or 0) * total_quantity
-            
-            # حساب مصاريف التوصيل (إذا كانت متاحة)
-            delivery_costs = 0
-            # يمكن إضافة حساب تكاليف التوصيل هنا إذا كانت متاحة
-            
-            # حساب الأرباح
-            gross_profit = float(total_revenue or 0) - total_cogs
-            net_profit = gross_profit - delivery_costs
-            
-            # نسب الربحية
-            profit_margin = (net_profit / float(total_revenue or 1) * 100) if total_revenue else 0
-            
-            product_profitability.append({
-                'product_id': product_id,
-                'product_name': product.product_name,
-                'sku': product.sku,
-                'total_quantity_sold': total_quantity,
-                'total_orders': total_orders,
-                'total_revenue': float(total_revenue or 0),
-                'total_cogs': total_cogs,
-                'gross_profit': gross_profit,
-                'net_profit': net_profit,
-                'profit_margin': profit_margin,
-                'average_order_value': float(total_revenue or 0) / total_orders if total_orders > 0 else 0
-            })
-        
-        # ترتيب حسب الربح الصافي (الأعلى أولاً)
-        product_profitability.sort(key=lambda x: x['net_profit'], reverse=True)
+            product_profitability = sorted(
+                entries.values(),
+                key=lambda entry: (entry[sort_by], -entry['product_id']),
+                reverse=sort_order != 'asc'
+            )
+            total_products = len(product_profitability)
+            if top:
+                product_profitability = product_profitability[:int(top)]
         
         return jsonify({
             'success': True,
@@ -185,7 +305,8 @@ def get_product_profitability():
                     'end_date': end_date
                 },
                 'products': product_profitability,
-                'total_products': len(product_profitability)
+                'total_products': total_products,
+                'returned_products': len(product_profitability)
             }
         }), 200
         
@@ -212,20 +333,24 @@ def get_daily_financial_summary():
         start_of_day = target_date_obj.replace(hour=0, minute=0, second=0, microsecond=0)
         end_of_day = target_date_obj.replace(hour=23, minute=59, second=59, microsecond=999999)
         
-        # الطلبات في هذا اليوم
-        daily_orders = Order.query.filter(
+        # إحصائيات الطلبات في هذا اليوم
+        total_orders, pending_count, cancelled_count = db.session.query(
+            func.count(Order.order_id),
+            func.coalesce(func.sum(case((Order.order_status == 'جديد', 1), else_=0)), 0),
+            func.coalesce(func.sum(case((Order.order_status.in_(['ملغى', 'ملغي']), 1), else_=0)), 0)
+        ).filter(
             Order.order_date >= start_of_day,
             Order.order_date <= end_of_day
-        ).all()
+        ).one()
+        
+        archived_counts = get_order_archive().count_by_status(start_of_day, end_of_day)
+        total_orders += sum(archived_counts.values())
+        cancelled_count += archived_counts.get('ملغى', 0) + archived_counts.get('ملغي', 0)
         
-        # إحصائيات الطلبات
-        total_orders = len(daily_orders)
-        confirmed_orders = [o for o in daily_orders if o.order_status in ['مؤكد', 'تم الشحن', 'تم التسليم']]
-        pending_orders = [o for o in daily_orders if o.order_status == 'جديد']
-        cancelled_orders = [o for o in daily_orders if o.order_status == 'ملغي']
+        sales = _sales_totals(start_of_day, end_of_day)
         
         # الإيرادات
-        daily_revenue = sum(float(order.total_amount or 0) for order in confirmed_orders)
+        daily_revenue = sales['revenue']
         
         # المصاريف اليومية
         daily_expenses = db.session.query(
@@ -236,10 +361,7 @@ def get_daily_financial_summary():
         ).scalar() or 0
         
         # الربح الصافي التقديري
-        estimated_cogs = 0
-        for order in confirmed_orders:
-            if order.product and order.product.cost_price:
-                estimated_cogs += float(order.product.cost_price) * order.quantity
+        estimated_cogs = sales['cogs']
         
         estimated_net_profit = daily_revenue - estimated_cogs - float(daily_expenses)
         
@@ -247,17 +369,13 @@ def get_daily_financial_summary():
         previous_day = start_of_day - timedelta(days=1)
         previous_day_end = end_of_day - timedelta(days=1)
         
-        previous_orders = Order.query.filter(
-            Order.order_date >= previous_day,
-            Order.order_date <= previous_day_end,
-            Order.order_status.in_(['مؤكد', 'تم الشحن', 'تم التسليم'])
-        ).all()
-        
-        previous_revenue = sum(float(order.total_amount or 0) for order in previous_orders)
+        previous_sales = _sales_totals(previous_day, previous_day_end)
+        previous_revenue = previous_sales['revenue']
+        previous_orders_count = previous_sales['orders']
         
         # نسبة التغيير
         revenue_change = ((daily_revenue - previous_revenue) / previous_revenue * 100) if previous_revenue > 0 else 0
-        orders_change = ((len(confirmed_orders) - len(previous_orders)) / len(previous_orders) * 100) if len(previous_orders) > 0 else 0
+        orders_change = ((sales['orders'] - previous_orders_count) / previous_orders_count * 100) if previous_orders_count > 0 else 0
         
         return jsonify({
             'success': True,
@@ -265,9 +383,9 @@ def get_daily_financial_summary():
                 'date': target_date,
                 'orders': {
                     'total_orders': total_orders,
-                    'confirmed_orders': len(confirmed_orders),
-                    'pending_orders': len(pending_orders),
-                    'cancelled_orders': len(cancelled_orders),
+                    'confirmed_orders': sales['orders'],
+                    'pending_orders': int(pending_count),
+                    'cancelled_orders': int(cancelled_count),
                     'orders_change_percentage': orders_change
                 },
                 'financial': {
@@ -279,7 +397,7 @@ def get_daily_financial_summary():
                 },
                 'comparison': {
                     'previous_day_revenue': previous_revenue,
-                    'previous_day_orders': len(previous_orders)
+                    'previous_day_orders': previous_orders_count
                 }
             }
         }), 200
@@ -316,14 +434,10 @@ def get_monthly_financial_trend():
             month_end = next_month - timedelta(days=1)
             
             # الطلبات المؤكدة في هذا الشهر
-            monthly_orders = Order.query.filter(
-                Order.order_date >= current_date,
-                Order.order_date <= month_end,
-                Order.order_status.in_(['مؤكد', 'تم الشحن', 'تم التسليم'])
-            ).all()
+            monthly_sales = _sales_totals(current_date, month_end)
             
             # الإيرادات الشهرية
-            monthly_revenue = sum(float(order.total_amount or 0) for order in monthly_orders)
+            monthly_revenue = monthly_sales['revenue']
             
             # المصاريف الشهرية
             monthly_expenses = db.session.query(
@@ -334,10 +448,7 @@ def get_monthly_financial_trend():
             ).scalar() or 0
             
             # تكلفة البضاعة المباعة
-            monthly_cogs = 0
-            for order in monthly_orders:
-                if order.product and order.product.cost_price:
-                    monthly_cogs += float(order.product.cost_price) * order.quantity
+            monthly_cogs = monthly_sales['cogs']
             
             # الربح الصافي
             monthly_net_profit = monthly_revenue - monthly_cogs - float(monthly_expenses)
@@ -345,7 +456,7 @@ def get_monthly_financial_trend():
             monthly_data.append({
                 'month': current_date.strftime('%Y-%m'),
                 'month_name': current_date.strftime('%B %Y'),
-                'total_orders': len(monthly_orders),
+                'total_orders': monthly_sales['orders'],
                 'revenue': monthly_revenue,
                 'expenses': float(monthly_expenses),
                 'cogs': monthly_cogs,
@@ -471,3 +582,133 @@ def get_expense_analysis():
             'message': f'خطأ في تحليل المصاريف: {str(e)}'
         }), 500
 
+
+@financial_reports_bp.route('/financial/backfill-snapshots', methods=['POST'])
+def backfill_snapshots():
+    """تعبئة لقطات الأسعار والتكاليف للطلبات القديمة"""
+    try:
+        result = backfill_order_snapshots()
+        
+        return jsonify({
+            'success': True,
+            'message': 'تمت تعبئة لقطات الطلبات بنجاح',
+            'data': result
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في تعبئة لقطات الطلبات: {str(e)}'
+        }), 500
+
+def _date_range_args():
+    """قراءة فترة التقرير (افتراضياً الشهر الحالي)"""
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    
+    if not start_date or not end_date:
+        now = datetime.utcnow()
+        start_date = now.replace(day=1).isoformat()
+        end_date = now.isoformat()
+    
+    return start_date, end_date
+
+@financial_reports_bp.route('/financial/distribution', methods=['GET'])
+def get_order_distribution():
+    """توزيع قيمة الطلب وأزمنة التأكيد والتسليم (مئينات تقريبية)"""
+    try:
+        metric = request.args.get('metric', 'order_value')
+        start_date, end_date = _date_range_args()
+        fractions = [float(q) for q in request.args.get('quantiles', '0.5,0.9,0.99').split(',') if q.strip()]
+        
+        if any(q < 0 or q > 1 for q in fractions):
+            return jsonify({
+                'success': False,
+                'message': 'المئينات يجب أن تكون بين 0 و 1'
+            }), 400
+        
+        distribution = OrderMetricsRecorder().distribution(
+            metric,
+            datetime.fromisoformat(start_date).date(),
+            datetime.fromisoformat(end_date).date(),
+            fractions
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'period': {
+                    'start_date': start_date,
+                    'end_date': end_date
+                },
+                **distribution
+            }
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في حساب التوزيع: {str(e)}'
+        }), 500
+
+@financial_reports_bp.route('/financial/unique-customers', methods=['GET'])
+def get_unique_customers():
+    """عدد العملاء المميزين (تقديري) في فترة"""
+    try:
+        start_date, end_date = _date_range_args()
+        granularity = request.args.get('granularity', 'total')
+        
+        result = OrderMetricsRecorder().unique_customers(
+            datetime.fromisoformat(start_date).date(),
+            datetime.fromisoformat(end_date).date(),
+            granularity
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'period': {
+                    'start_date': start_date,
+                    'end_date': end_date
+                },
+                **result
+            }
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في حساب العملاء المميزين: {str(e)}'
+        }), 500
+
+@financial_reports_bp.route('/financial/sketches/rebuild', methods=['POST'])
+def rebuild_order_sketches():
+    """إعادة بناء ملخصات مقاييس الطلبات من السجل"""
+    try:
+        processed = OrderMetricsRecorder().rebuild()
+        
+        return jsonify({
+            'success': True,
+            'message': 'تمت إعادة بناء الملخصات بنجاح',
+            'data': {
+                'processed_orders': processed
+            }
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في إعادة بناء الملخصات: {str(e)}'
+        }), 500
@@ -1,43 +1,78 @@
-from flask import Blueprint, request, jsonify
-from src.models import db, Product, Order
-from sqlalchemy import func
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from src.models import db, Product, Order, StockLot, InventoryMovement, InventoryAlert
+from src.services.cost_lots import FifoCostEngine
+from src.services.inventory_ledger import InventoryLedger
+from src.services.sales_velocity import SalesVelocityTracker
+from src.services.bulk_inventory import BulkInventoryUpdate
+from src.services.stock_alerts import StockAlertService, alert_dispatcher
+from sqlalchemy import func, case
 from datetime import datetime, timedelta
+import json
+import queue
 
 inventory_bp = Blueprint('inventory', __name__)
 
+INVENTORY_FLAGGED_LIMIT = 100
+
+def _inventory_summary(low_stock_threshold, include_products=True, limit=INVENTORY_FLAGGED_LIMIT):
+    """إحصائيات المخزون في استعلام واحد مع جلب محدود للمنتجات المنخفضة والنافدة"""
+    is_out = Product.current_stock <= 0
+    is_low = Product.current_stock <= low_stock_threshold
+    
+    totals = db.session.query(
+        func.count(Product.product_id).label('total_products'),
+        func.coalesce(func.sum(case((is_low, 1), else_=0)), 0).label('low_stock_count'),
+        func.coalesce(func.sum(case((is_out, 1), else_=0)), 0).label('out_of_stock_count'),
+        func.coalesce(func.sum(Product.current_stock * Product.price), 0).label('total_inventory_value')
+    ).one()
+    
+    summary = {
+        'total_products': totals.total_products,
+        'low_stock_count': int(totals.low_stock_count),
+        'out_of_stock_count': int(totals.out_of_stock_count),
+        'total_inventory_value': float(totals.total_inventory_value)
+    }
+    
+    if not include_products:
+        return summary, [], []
+    
+    # المنتجات النافدة أولاً ثم الأقل مخزوناً
+    flagged = Product.query.filter(is_low).order_by(
+        Product.current_stock, Product.product_id
+    ).limit(limit).all()
+    
+    low_stock_products = [p for p in flagged if p.current_stock > 0]
+    out_of_stock_products = [p for p in flagged if p.current_stock <= 0]
+    summary['truncated'] = summary['low_stock_count'] > len(flagged)
+    
+    return summary, low_stock_products, out_of_stock_products
+
+def _summary_args():
+    low_stock_threshold = int(request.args.get('low_stock_threshold', 10))
+    counts_only = request.args.get('counts_only', 'false').lower() == 'true'
+    limit = int(request.args.get('limit', INVENTORY_FLAGGED_LIMIT))
+    return low_stock_threshold, counts_only, limit
+
 @inventory_bp.route('/inventory/status', methods=['GET'])
 def get_inventory_status():
     """جلب حالة المخزون العامة"""
     try:
-        # إحصائيات عامة
-        total_products = Product.query.count()
-        low_stock_threshold = int(request.args.get('low_stock_threshold', 10))
+        low_stock_threshold, counts_only, limit = _summary_args()
         
-        # المنتجات منخفضة المخزون
-        low_stock_products = Product.query.filter(
-            Product.current_stock <= low_stock_threshold
-        ).all()
-        
-        # المنتجات نفدت من المخزون
-        out_of_stock_products = Product.query.filter(
-            Product.current_stock <= 0
-        ).all()
+        summary, low_stock_products, out_of_stock_products = _inventory_summary(
+            low_stock_threshold, include_products=not counts_only, limit=limit
+        )
         
-        # إجمالي قيمة المخزون
-        total_inventory_value = db.session.query(
-            func.sum(Product.current_stock * Product.price)
-        ).scalar() or 0
+        if not counts_only:
+            # قائمة المخزون المنخفض تشمل النافد كما في السابق
+            summary['low_stock_products'] = [
+                product.to_dict() for product in out_of_stock_products + low_stock_products
+            ]
+            summary['out_of_stock_products'] = [product.to_dict() for product in out_of_stock_products]
         
         return jsonify({
             'success': True,
-            'data': {
-                'total_products': total_products,
-                'low_stock_count': len(low_stock_products),
-                'out_of_stock_count': len(out_of_stock_products),
-                'total_inventory_value': float(total_inventory_value),
-                'low_stock_products': [product.to_dict() for product in low_stock_products],
-                'out_of_stock_products': [product.to_dict() for product in out_of_stock_products]
-            }
+            'data': summary
         }), 200
         
     except Exception as e:
@@ -46,53 +81,125 @@ def get_inventory_status():
             'message': f'خطأ في جلب حالة المخزون: {str(e)}'
         }), 500
 
+def _alert_message(alert_type, product_name, current_stock):
+    if alert_type == InventoryAlert.OUT_OF_STOCK:
+        return f'نفد المخزون للمنتج {product_name}'
+    return f'المخزون منخفض للمنتج {product_name} (متبقي: {current_stock})'
+
 @inventory_bp.route('/inventory/alerts', methods=['GET'])
 def get_inventory_alerts():
-    """جلب تنبيهات المخزون"""
+    """جلب تنبيهات المخزون النشطة من جدول التنبيهات"""
     try:
-        low_stock_threshold = int(request.args.get('low_stock_threshold', 10))
-        
-        alerts = []
-        
-        # تنبيهات المخزون المنخفض
-        low_stock_products = Product.query.filter(
-            Product.current_stock <= low_stock_threshold,
-            Product.current_stock > 0
-        ).all()
-        
-        for product in low_stock_products:
-            alerts.append({
-                'type': 'low_stock',
-                'severity': 'warning',
-                'product_id': product.product_id,
-                'product_name': product.product_name,
-                'sku': product.sku,
-                'current_stock': product.current_stock,
-                'message': f'المخزون منخفض للمنتج {product.product_name} (متبقي: {product.current_stock})'
-            })
-        
-        # تنبيهات نفاد المخزون
-        out_of_stock_products = Product.query.filter(
-            Product.current_stock <= 0
-        ).all()
-        
-        for product in out_of_stock_products:
-            alerts.append({
-                'type': 'out_of_stock',
-                'severity': 'critical',
-                'product_id': product.product_id,
-                'product_name': product.product_name,
-                'sku': product.sku,
-                'current_stock': product.current_stock,
-                'message': f'نفد المخزون للمنتج {product.product_name}'
-            })
+        # حد موحد مؤقت: فحص مباشر للمنتجات كما في السابق
+        if 'low_stock_threshold' in request.args:
+            return _scan_inventory_alerts()
+        
+        counts_only = request.args.get('counts_only', 'false').lower() == 'true'
+        limit = int(request.args.get('limit', INVENTORY_FLAGGED_LIMIT))
+        
+        counts = dict(db.session.query(
+            InventoryAlert.alert_type, func.count(InventoryAlert.alert_id)
+        ).filter(
+            InventoryAlert.is_active.is_(True)
+        ).group_by(InventoryAlert.alert_type).all())
+        
+        low_count = counts.get(InventoryAlert.LOW_STOCK, 0)
+        out_count = counts.get(InventoryAlert.OUT_OF_STOCK, 0)
+        
+        data = {
+            'low_stock_count': low_count,
+            'out_of_stock_count': out_count,
+            'total_alerts': low_count + out_count
+        }
+        
+        if not counts_only:
+            rows = db.session.query(InventoryAlert, Product.product_name, Product.sku).join(
+                Product, Product.product_id == InventoryAlert.product_id
+            ).filter(
+                InventoryAlert.is_active.is_(True)
+            ).order_by(
+                InventoryAlert.current_stock, InventoryAlert.product_id
+            ).limit(limit).all()
+            
+            data['alerts'] = [
+                {
+                    'alert_id': alert.alert_id,
+                    'type': alert.alert_type,
+                    'severity': 'critical' if alert.alert_type == InventoryAlert.OUT_OF_STOCK else 'warning',
+                    'product_id': alert.product_id,
+                    'product_name': product_name,
+                    'sku': sku,
+                    'current_stock': alert.current_stock,
+                    'threshold': alert.threshold,
+                    'triggered_at': alert.triggered_at.isoformat() if alert.triggered_at else None,
+                    'message': _alert_message(alert.alert_type, product_name, alert.current_stock)
+                }
+                for alert, product_name, sku in rows
+            ]
+            data['truncated'] = data['total_alerts'] > len(rows)
         
         return jsonify({
             'success': True,
-            'data': {
-                'alerts': alerts,
-                'total_alerts': len(alerts)
-            }
+            'data': data
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في جلب تنبيهات المخزون: {str(e)}'
+        }), 500
+
+def _scan_inventory_alerts():
+    """تنبيهات المخزون بحد موحد عبر فحص جدول المنتجات"""
+    try:
+        low_stock_threshold, counts_only, limit = _summary_args()
+        
+        summary, low_stock_products, out_of_stock_products = _inventory_summary(
+            low_stock_threshold, include_products=not counts_only, limit=limit
+        )
+        
+        low_count = summary['low_stock_count'] - summary['out_of_stock_count']
+        out_count = summary['out_of_stock_count']
+        
+        data = {
+            'low_stock_count': low_count,
+            'out_of_stock_count': out_count,
+            'total_alerts': low_count + out_count
+        }
+        
+        if not counts_only:
+            alerts = []
+            
+            # تنبيهات المخزون المنخفض
+            for product in low_stock_products:
+                alerts.append({
+                    'type': InventoryAlert.LOW_STOCK,
+                    'severity': 'warning',
+                    'product_id': product.product_id,
+                    'product_name': product.product_name,
+                    'sku': product.sku,
+                    'current_stock': product.current_stock,
+                    'message': _alert_message(InventoryAlert.LOW_STOCK, product.product_name, product.current_stock)
+                })
+            
+            # تنبيهات نفاد المخزون
+            for product in out_of_stock_products:
+                alerts.append({
+                    'type': InventoryAlert.OUT_OF_STOCK,
+                    'severity': 'critical',
+                    'product_id': product.product_id,
+                    'product_name': product.product_name,
+                    'sku': product.sku,
+                    'current_stock': product.current_stock,
+                    'message': _alert_message(InventoryAlert.OUT_OF_STOCK, product.product_name, product.current_stock)
+                })
+            
+            data['alerts'] = alerts
+            data['truncated'] = summary['truncated']
+        
+        return jsonify({
+            'success': True,
+            'data': data
         }), 200
         
     except Exception as e:
@@ -105,49 +212,92 @@ def get_inventory_alerts():
 def get_inventory_movement():
     """جلب تقرير حركة المخزون"""
     try:
-        # فترة التقرير
+        # فترة التقرير الأساسية، ويمكن طلب عدة فترات معاً (windows=7,30,90)
         days = int(request.args.get('days', 30))
-        start_date = datetime.utcnow() - timedelta(days=days)
-        
-        # الطلبات في الفترة المحددة
-        orders = Order.query.filter(
-            Order.order_date >= start_date,
-            Order.order_status.in_(['مؤكد', 'تم الشحن', 'تم التسليم'])
-        ).all()
-        
-        # تجميع البيانات حسب المنتج
-        movement_data = {}
-        
-        for order in orders:
-            product_id = order.product_id
-            if product_id not in movement_data:
-                product = Product.query.get(product_id)
-                movement_data[product_id] = {
-                    'product_id': product_id,
-                    'product_name': product.product_name if product else 'منتج محذوف',
-                    'sku': product.sku if product else '',
-                    'total_sold': 0,
-                    'orders_count': 0,
-                    'current_stock': product.current_stock if product else 0
-                }
-            
-            movement_data[product_id]['total_sold'] += order.quantity
-            movement_data[product_id]['orders_count'] += 1
-        
-        # ترتيب حسب الأكثر مبيعاً
-        sorted_movement = sorted(
-            movement_data.values(),
-            key=lambda x: x['total_sold'],
-            reverse=True
+        windows_arg = request.args.get('windows')
+        windows = sorted({int(w) for w in windows_arg.split(',') if w.strip()}) if windows_arg else [days]
+        if 'days' not in request.args:
+            days = windows[-1]
+        elif days not in windows:
+            return jsonify({
+                'success': False,
+                'message': 'days يجب أن تكون إحدى الفترات في windows'
+            }), 400
+        limit = request.args.get('limit')
+        
+        if any(window <= 0 for window in windows):
+            return jsonify({
+                'success': False,
+                'message': 'الفترات يجب أن تكون أكبر من صفر'
+            }), 400
+        
+        now = datetime.utcnow()
+        window_starts = {window: now - timedelta(days=window) for window in windows}
+        start_date = window_starts[days]
+        
+        # مجموع الكمية وعدد الطلبات لكل فترة في نفس الاستعلام
+        columns = []
+        for window in windows:
+            in_window = Order.order_date >= window_starts[window]
+            columns.append(func.coalesce(func.sum(case((in_window, Order.quantity), else_=0)), 0).label(f'sold_{window}'))
+            columns.append(func.sum(case((in_window, 1), else_=0)).label(f'orders_{window}'))
+        
+        sold_primary = columns[windows.index(days) * 2]
+        in_primary = func.sum(case((Order.order_date >= start_date, 1), else_=0))
+        
+        query = db.session.query(
+            Order.product_id,
+            Product.product_name,
+            Product.sku,
+            Product.current_stock,
+            *columns,
+            func.count().over().label('total_products')
+        ).outerjoin(
+            Product, Product.product_id == Order.product_id
+        ).filter(
+            Order.order_date >= window_starts[windows[-1]],
+            Order.order_status.in_(Order.SOLD_STATUSES)
+        ).group_by(
+            Order.product_id, Product.product_name, Product.sku, Product.current_stock
+        ).having(
+            # المنتجات التي لم تبع في الفترة الأساسية لا تظهر فيها كما في طلب فترة واحدة
+            in_primary > 0
+        ).order_by(
+            sold_primary.desc(), Order.product_id
         )
         
+        if limit:
+            query = query.limit(int(limit))
+        
+        rows = query.all()
+        movement = []
+        for row in rows:
+            entry = {
+                'product_id': row.product_id,
+                'product_name': row.product_name or 'منتج محذوف',
+                'sku': row.sku or '',
+                'total_sold': int(getattr(row, f'sold_{days}')),
+                'orders_count': int(getattr(row, f'orders_{days}')),
+                'current_stock': row.current_stock or 0
+            }
+            if len(windows) > 1:
+                entry['windows'] = {
+                    str(window): {
+                        'total_sold': int(getattr(row, f'sold_{window}')),
+                        'orders_count': int(getattr(row, f'orders_{window}'))
+                    }
+                    for window in windows
+                }
+            movement.append(entry)
+        
         return jsonify({
             'success': True,
             'data': {
                 'period_days': days,
+                'windows': windows,
                 'start_date': start_date.isoformat(),
-                'movement': sorted_movement,
-                'total_products': len(sorted_movement)
+                'movement': movement,
+                'total_products': rows[0].total_products if rows else 0
             }
         }), 200
         
@@ -188,9 +338,24 @@ def restock_product():
                 'message': 'المنتج غير موجود'
             }), 404
         
+        # تسجيل دفعة الشراء بسعرها لحساب التكلفة بطريقة FIFO
+        lot = None
+        if data.get('unit_cost') is not None:
+            unit_cost = float(data['unit_cost'])
+            if unit_cost < 0:
+                return jsonify({
+                    'success': False,
+                    'message': 'سعر الشراء لا يمكن أن يكون سالباً'
+                }), 400
+            lot = FifoCostEngine().receive(product, quantity, unit_cost, reference=data.get('reference'))
+        
         # تحديث المخزون
         old_stock = product.current_stock
-        product.current_stock += quantity
+        if lot is not None:
+            db.session.flush()
+        InventoryLedger().apply(product, quantity, InventoryMovement.RESTOCK,
+                                'lot' if lot else None, lot.lot_id if lot else None,
+                                note=data.get('reference'))
         
         db.session.commit()
         
@@ -201,7 +366,8 @@ def restock_product():
                 'product_id': product_id,
                 'old_stock': old_stock,
                 'added_quantity': quantity,
-                'new_stock': product.current_stock
+                'new_stock': product.current_stock,
+                'lot': lot.to_dict() if lot else None
             }
         }), 200
         
@@ -212,6 +378,34 @@ def restock_product():
             'message': f'خطأ في تعبئة المخزون: {str(e)}'
         }), 500
 
+@inventory_bp.route('/inventory/lots', methods=['GET'])
+def get_stock_lots():
+    """جلب دفعات الشراء المفتوحة"""
+    try:
+        product_id = request.args.get('product_id')
+        include_closed = request.args.get('include_closed', 'false').lower() == 'true'
+        
+        query = StockLot.query
+        
+        if product_id:
+            query = query.filter_by(product_id=int(product_id))
+        if not include_closed:
+            query = query.filter(StockLot.remaining_quantity > 0)
+        
+        lots = query.order_by(StockLot.product_id, StockLot.received_at, StockLot.lot_id).all()
+        
+        return jsonify({
+            'success': True,
+            'data': [lot.to_dict() for lot in lots],
+            'total_lots': len(lots)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في جلب دفعات الشراء: {str(e)}'
+        }), 500
+
 @inventory_bp.route('/inventory/adjust', methods=['POST'])
 def adjust_inventory():
     """تعديل المخزون (زيادة أو نقصان)"""
@@ -248,7 +442,7 @@ def adjust_inventory():
         
         # تحديث المخزون
         old_stock = product.current_stock
-        product.current_stock = new_stock
+        InventoryLedger().apply(product, adjustment, InventoryMovement.ADJUSTMENT, note=reason)
         
         db.session.commit()
         
@@ -271,3 +465,301 @@ def adjust_inventory():
             'message': f'خطأ في تعديل المخزون: {str(e)}'
         }), 500
 
+
+@inventory_bp.route('/inventory/movements', methods=['GET'])
+def get_inventory_movements():
+    """جلب سجل حركات المخزون"""
+    try:
+        product_id = request.args.get('product_id')
+        reason = request.args.get('reason')
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        limit = int(request.args.get('limit', 100))
+        
+        query = InventoryMovement.query
+        
+        if product_id:
+            query = query.filter(InventoryMovement.product_id == int(product_id))
+        if reason:
+            query = query.filter(InventoryMovement.reason == reason)
+        if start_date:
+            query = query.filter(InventoryMovement.created_at >= datetime.fromisoformat(start_date))
+        if end_date:
+            query = query.filter(InventoryMovement.created_at <= datetime.fromisoformat(end_date))
+        
+        movements = query.order_by(
+            InventoryMovement.created_at.desc(), InventoryMovement.movement_id.desc()
+        ).limit(limit).all()
+        
+        return jsonify({
+            'success': True,
+            'data': [movement.to_dict() for movement in movements],
+            'total_movements': len(movements)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في جلب حركات المخزون: {str(e)}'
+        }), 500
+
+@inventory_bp.route('/inventory/movements/by-reason', methods=['GET'])
+def get_inventory_movements_by_reason():
+    """ملخص حركات المخزون حسب السبب"""
+    try:
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        product_id = request.args.get('product_id')
+        
+        summary = InventoryLedger().movement_by_reason(
+            start=datetime.fromisoformat(start_date) if start_date else None,
+            end=datetime.fromisoformat(end_date) if end_date else None,
+            product_id=int(product_id) if product_id else None
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'start_date': start_date,
+                'end_date': end_date,
+                'reasons': summary
+            }
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في جلب ملخص الحركات: {str(e)}'
+        }), 500
+
+@inventory_bp.route('/inventory/stock-at', methods=['GET'])
+def get_stock_at():
+    """المخزون في تاريخ معين"""
+    try:
+        date_arg = request.args.get('date')
+        if not date_arg:
+            return jsonify({
+                'success': False,
+                'message': 'date مطلوب'
+            }), 400
+        
+        at = datetime.fromisoformat(date_arg)
+        product_ids = [int(p) for p in request.args.get('product_id', '').split(',') if p.strip()]
+        
+        stock = InventoryLedger().stock_at(at, product_ids or None)
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'date': at.isoformat(),
+                'stock': [
+                    {'product_id': product_id, 'stock': quantity}
+                    for product_id, quantity in sorted(stock.items())
+                ]
+            }
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في حساب المخزون في التاريخ: {str(e)}'
+        }), 500
+
+@inventory_bp.route('/inventory/forecast', methods=['GET'])
+def get_inventory_forecast():
+    """توقع نفاد المخزون وكميات إعادة الطلب"""
+    try:
+        horizon_days = int(request.args.get('days', 30))
+        lead_time_days = int(request.args.get('lead_time_days', 7))
+        cover_days = int(request.args.get('cover_days', 30))
+        at_risk_only = request.args.get('at_risk_only', 'false').lower() == 'true'
+        
+        forecast = SalesVelocityTracker().forecast(
+            horizon_days=horizon_days,
+            lead_time_days=lead_time_days,
+            cover_days=cover_days,
+            at_risk_only=at_risk_only
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'horizon_days': horizon_days,
+                'lead_time_days': lead_time_days,
+                'cover_days': cover_days,
+                'products': forecast,
+                'at_risk_count': sum(1 for item in forecast if item['at_risk'])
+            }
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في حساب توقع المخزون: {str(e)}'
+        }), 500
+
+@inventory_bp.route('/inventory/forecast/rebuild', methods=['POST'])
+def rebuild_inventory_forecast():
+    """إعادة بناء سرعات البيع من سجل الطلبات"""
+    try:
+        products = SalesVelocityTracker().rebuild()
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'message': 'تمت إعادة بناء سرعات البيع بنجاح',
+            'data': {
+                'products': products
+            }
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في إعادة بناء سرعات البيع: {str(e)}'
+        }), 500
+
+def _bulk_request_items():
+    """قراءة أسطر العملية الجماعية من JSON أو من ملف CSV"""
+    uploaded = request.files.get('file')
+    if uploaded:
+        return BulkInventoryUpdate.parse_csv(uploaded.read().decode('utf-8')), request.form
+    
+    if request.mimetype == 'text/csv':
+        return BulkInventoryUpdate.parse_csv(request.get_data(as_text=True)), request.args
+    
+    data = request.get_json() or {}
+    return data.get('items'), data
+
+def _run_bulk(mode):
+    items, options = _bulk_request_items()
+    
+    if not isinstance(items, list) or not items:
+        return jsonify({
+            'success': False,
+            'message': 'قائمة items مطلوبة'
+        }), 400
+    
+    allow_partial = str(options.get('allow_partial', 'false')).lower() == 'true'
+    
+    result = BulkInventoryUpdate(mode).run(
+        items,
+        reference=options.get('reference'),
+        reason=options.get('reason'),
+        allow_partial=allow_partial
+    )
+    
+    if not result['applied']:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'لم يتم تطبيق أي سطر. الأسطر الخاطئة: {result["failed_rows"]}',
+            'data': result
+        }), 400
+    
+    db.session.commit()
+    
+    return jsonify({
+        'success': True,
+        'message': f'تم تطبيق {result["applied_rows"]} سطر، فشل {result["failed_rows"]} سطر',
+        'data': result
+    }), 200
+
+@inventory_bp.route('/inventory/restock/bulk', methods=['POST'])
+def bulk_restock_products():
+    """تعبئة مخزون عدة منتجات دفعة واحدة"""
+    try:
+        return _run_bulk(BulkInventoryUpdate.RESTOCK)
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في تعبئة المخزون: {str(e)}'
+        }), 500
+
+@inventory_bp.route('/inventory/adjust/bulk', methods=['POST'])
+def bulk_adjust_inventory():
+    """تعديل مخزون عدة منتجات دفعة واحدة"""
+    try:
+        return _run_bulk(BulkInventoryUpdate.ADJUST)
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في تعديل المخزون: {str(e)}'
+        }), 500
+
+@inventory_bp.route('/inventory/alerts/stream', methods=['GET'])
+def stream_inventory_alerts():
+    """بث تنبيهات المخزون لحظياً (Server-Sent Events)"""
+    stream = alert_dispatcher.open_stream()
+    heartbeat = float(request.args.get('heartbeat', 15))
+    
+    def generate():
+        try:
+            yield ': connected\n\n'
+            while True:
+                try:
+                    alert_event = stream.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f"event: {alert_event['event']}\ndata: {json.dumps(alert_event, ensure_ascii=False)}\n\n"
+        finally:
+            alert_dispatcher.close_stream(stream)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@inventory_bp.route('/inventory/alerts/history', methods=['GET'])
+def get_inventory_alerts_history():
+    """سجل التنبيهات (النشطة والمغلقة)"""
+    try:
+        product_id = request.args.get('product_id')
+        limit = int(request.args.get('limit', 100))
+        
+        query = InventoryAlert.query
+        if product_id:
+            query = query.filter(InventoryAlert.product_id == int(product_id))
+        
+        alerts = query.order_by(InventoryAlert.triggered_at.desc(), InventoryAlert.alert_id.desc()).limit(limit).all()
+        
+        return jsonify({
+            'success': True,
+            'data': [alert.to_dict() for alert in alerts],
+            'total_alerts': len(alerts)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في جلب سجل التنبيهات: {str(e)}'
+        }), 500
+
+@inventory_bp.route('/inventory/alerts/rebuild', methods=['POST'])
+def rebuild_inventory_alerts():
+    """مطابقة جدول التنبيهات مع المخزون الحالي لجميع المنتجات"""
+    try:
+        products = StockAlertService().rebuild()
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'message': 'تمت مطابقة التنبيهات بنجاح',
+            'data': {
+                'products': products
+            }
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في مطابقة التنبيهات: {str(e)}'
+        }), 500
@@ -1,6 +1,11 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from datetime import datetime
-from src.models import db, Order, Product, Staff, DeliveryCompany
+from src.models import db, Order, Product, Staff, DeliveryCompany, InventoryMovement
+from src.services.order_profit import iter_order_profits
+from src.services.order_metrics import OrderMetricsRecorder
+from src.services.inventory_ledger import InventoryLedger
+from src.services.order_status import change_order_status
+import json
 
 order_bp = Blueprint('order', __name__)
 
@@ -40,6 +45,30 @@ def get_orders():
             'message': f'خطأ في جلب الطلبات: {str(e)}'
         }), 500
 
+@order_bp.route('/orders/profit', methods=['GET'])
+def get_orders_profit():
+    """حساب ربح الطلبات دفعة واحدة (بث بصيغة NDJSON)"""
+    try:
+        start_date = request.args.get('from')
+        end_date = request.args.get('to')
+        status = request.args.get('status')
+        
+        start_date_obj = datetime.fromisoformat(start_date) if start_date else None
+        end_date_obj = datetime.fromisoformat(end_date) if end_date else None
+        statuses = [s.strip() for s in status.split(',') if s.strip()] if status else None
+        
+        def generate():
+            for row in iter_order_profits(start_date_obj, end_date_obj, statuses):
+                yield json.dumps(row, ensure_ascii=False) + '\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson'), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في حساب أرباح الطلبات: {str(e)}'
+        }), 500
+
 @order_bp.route('/orders/<int:order_id>', methods=['GET'])
 def get_order(order_id):
     """جلب طلب محدد"""
@@ -84,29 +113,38 @@ def create_order():
                 'message': 'المنتج غير موجود'
             }), 404
         
-        # التحقق من توفر المخزون
-        quantity = int(data.get('quantity', 1))
-        if product.current_stock < quantity:
+        if product.is_active is False:
             return jsonify({
                 'success': False,
-                'message': 'المخزون غير كافي'
+                'message': 'المنتج غير متاح للطلب'
             }), 400
         
+        quantity = int(data.get('quantity', 1))
+        
         # إنشاء الطلب الجديد
         order = Order(
             customer_name=data['customer_name'],
             customer_phone=data['customer_phone'],
             customer_address=data['customer_address'],
+            wilaya=data.get('wilaya'),
             product_id=data['product_id'],
             quantity=quantity,
             order_source=data['order_source'],
             notes=data.get('notes', '')
         )
-        
-        # تقليل المخزون
-        product.current_stock -= quantity
+        order.apply_product_snapshot(product)
         
         db.session.add(order)
+        db.session.flush()
+        
+        # حجز المخزون بتحديث مشروط
+        if not InventoryLedger().reserve(product.product_id, quantity, InventoryMovement.ORDER, 'order', order.order_id):
+            db.session.rollback()
+            return jsonify({
+                'success': False,
+                'message': 'المخزون غير كافي'
+            }), 400
+        OrderMetricsRecorder().record_created(order)
         db.session.commit()
         
         return jsonify({
@@ -141,38 +179,8 @@ def update_order_status(order_id):
                 'message': 'order_status مطلوب'
             }), 400
         
-        new_status = data['order_status']
-        old_status = order.order_status
-        
-        # تحديث الحالة والتواريخ المناسبة
-        order.order_status = new_status
-        
-        current_time = datetime.utcnow()
-        
-        if new_status == 'اتصال أول' and not order.first_call_date:
-            order.first_call_date = current_time
-        elif new_status == 'اتصال ثانٍ' and not order.second_call_date:
-            order.second_call_date = current_time
-        elif new_status == 'مؤكد' and not order.confirmed_date:
-            order.confirmed_date = current_time
-        elif new_status == 'تم الشحن' and not order.shipped_date:
-            order.shipped_date = current_time
-        elif new_status == 'تم التسليم' and not order.delivered_date:
-            order.delivered_date = current_time
-        elif new_status == 'ملغى' and not order.cancelled_date:
-            order.cancelled_date = current_time
-            # إرجاع المخزون في حالة الإلغاء
-            if old_status not in ['ملغى', 'مرتجع']:
-                product = Product.query.get(order.product_id)
-                if product:
-                    product.current_stock += order.quantity
-        elif new_status == 'مرتجع' and not order.returned_date:
-            order.returned_date = current_time
-            # إرجاع المخزون في حالة الإرجاع
-            if old_status not in ['ملغى', 'مرتجع']:
-                product = Product.query.get(order.product_id)
-                if product:
-                    product.current_stock += order.quantity
+        # تحديث الحالة والتواريخ والمخزون والتكلفة
+        change_order_status(order, data['order_status'])
         
         # تحديث موظف التأكيد إذا تم تمريره
         if 'confirmation_staff_id' in data:
@@ -202,6 +210,12 @@ def update_order_status(order_id):
             'data': order.to_dict()
         }), 200
         
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({
@@ -0,0 +1,80 @@
+from flask import Blueprint, request, jsonify
+from src.models import db
+from src.services.order_archive import get_order_archive
+
+order_archive_bp = Blueprint('order_archive', __name__)
+
+@order_archive_bp.route('/archive/orders', methods=['POST'])
+def archive_orders():
+    """أرشفة الطلبات المغلقة القديمة"""
+    try:
+        data = request.get_json() or {}
+        
+        older_than_months = int(data.get('older_than_months', 12))
+        limit = data.get('limit')
+        
+        if older_than_months < 1:
+            return jsonify({
+                'success': False,
+                'message': 'older_than_months يجب أن يكون 1 على الأقل'
+            }), 400
+        
+        result = get_order_archive().archive_closed_orders(
+            older_than_months,
+            limit=int(limit) if limit else None
+        )
+        
+        return jsonify({
+            'success': True,
+            'message': f'تمت أرشفة {result["archived_orders"]} طلب',
+            'data': result
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في أرشفة الطلبات: {str(e)}'
+        }), 500
+
+@order_archive_bp.route('/archive/status', methods=['GET'])
+def get_archive_status():
+    """حالة أرشيف الطلبات"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': get_order_archive().status()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في جلب حالة الأرشيف: {str(e)}'
+        }), 500
+
+@order_archive_bp.route('/archive/orders/<int:order_id>', methods=['GET'])
+def get_archived_order(order_id):
+    """جلب طلب مؤرشف"""
+    try:
+        record = get_order_archive().find_order(order_id)
+        if not record:
+            return jsonify({
+                'success': False,
+                'message': 'الطلب غير موجود في الأرشيف'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'data': record
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في جلب الطلب المؤرشف: {str(e)}'
+        }), 500
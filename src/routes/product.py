@@ -1,17 +1,87 @@
-from flask import Blueprint, request, jsonify
-from src.models import db, Product
+from flask import Blueprint, request, jsonify, Response
+from src.models import db, Product, InventoryMovement
+from src.services.inventory_ledger import InventoryLedger
+from src.services.stock_alerts import StockAlertService
+from src.services.product_cache import product_cache, current_catalog_version
+from src.services.product_import import ProductImporter, parse_flag
+from sqlalchemy import func
+import gzip
+import io
+import json
 
 product_bp = Blueprint('product', __name__)
 
+PRODUCTS_MAX_PAGE_SIZE = 500
+
+def _prefix_filter(column, prefix):
+    """بحث بالبادئة كمدى على الفهرس (column >= prefix AND column < prefix + أعلى محرف)"""
+    return db.and_(column >= prefix, column < prefix + '\U0010ffff')
+
+def _catalog_etag():
+    """وسم الكتالوج: إصدار الكتالوج + آخر تعديل على المنتجات (يشمل المخزون)"""
+    last_update, total = db.session.query(func.max(Product.updated_at), func.count(Product.product_id)).one()
+    stamp = last_update.isoformat() if last_update else '0'
+    return f'catalog-{current_catalog_version()}-{total}-{stamp}'
+
 @product_bp.route('/products', methods=['GET'])
 def get_products():
-    """جلب جميع المنتجات"""
+    """جلب المنتجات (صفحات بالمؤشر، بحث بالبادئة، وتصفية المتوفر)"""
     try:
-        products = Product.query.all()
-        return jsonify({
-            'success': True,
-            'data': [product.to_dict() for product in products]
-        }), 200
+        etag = _catalog_etag()
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+            response.set_etag(etag, weak=True)
+            return response
+        
+        limit = request.args.get('limit')
+        after = request.args.get('after')
+        search = request.args.get('q', '').strip()
+        in_stock = request.args.get('in_stock', 'false').lower() == 'true'
+        
+        query = Product.query
+        
+        if search:
+            query = query.filter(db.or_(
+                _prefix_filter(Product.sku, search),
+                _prefix_filter(Product.product_name, search)
+            ))
+        if in_stock:
+            query = query.filter(Product.current_stock > 0)
+        if after:
+            query = query.filter(Product.product_id > int(after))
+        
+        query = query.order_by(Product.product_id)
+        
+        payload = {'success': True}
+        
+        if limit:
+            limit = min(max(int(limit), 1), PRODUCTS_MAX_PAGE_SIZE)
+            products = query.limit(limit + 1).all()
+            has_more = len(products) > limit
+            products = products[:limit]
+            payload['data'] = [product.to_dict() for product in products]
+            payload['pagination'] = {
+                'limit': limit,
+                'has_more': has_more,
+                'next_cursor': products[-1].product_id if has_more else None
+            }
+        else:
+            payload['data'] = [product.to_dict() for product in query.all()]
+        
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        response = Response(body, status=200, mimetype='application/json')
+        
+        # ضغط الكتالوج الكامل فقط؛ الصفحات الصغيرة لا تستحق كلفة الضغط
+        if not limit and 'gzip' in request.headers.get('Accept-Encoding', '') and len(body) > 1024:
+            response.set_data(gzip.compress(body, compresslevel=6))
+            response.headers['Content-Encoding'] = 'gzip'
+        
+        response.set_etag(etag, weak=True)
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'no-cache'
+        
+        return response
+        
     except Exception as e:
         return jsonify({
             'success': False,
@@ -68,11 +138,17 @@ def create_product():
             sku=data['sku'],
             description=data.get('description', ''),
             price=float(data['price']),
-            current_stock=int(data.get('current_stock', 0)),
-            initial_stock=int(data.get('initial_stock', 0))
+            cost_price=float(data['cost_price']) if data.get('cost_price') is not None else None,
+            current_stock=0,
+            initial_stock=int(data.get('initial_stock', 0)),
+            is_active=parse_flag(data.get('is_active', True)),
+            low_stock_threshold=int(data['low_stock_threshold']) if data.get('low_stock_threshold') is not None else None
         )
         
         db.session.add(product)
+        InventoryLedger().set_stock(product, int(data.get('current_stock', 0)), InventoryMovement.INITIAL)
+        StockAlertService().sync(product)
+        product_cache.invalidate()
         db.session.commit()
         
         return jsonify({
@@ -81,6 +157,12 @@ def create_product():
             'data': product.to_dict()
         }), 201
         
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'قيمة غير صحيحة: {str(e)}'
+        }), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({
@@ -108,11 +190,19 @@ def update_product(sku):
             product.description = data['description']
         if 'price' in data:
             product.price = float(data['price'])
+        if 'cost_price' in data:
+            product.cost_price = float(data['cost_price']) if data['cost_price'] is not None else None
         if 'current_stock' in data:
-            product.current_stock = int(data['current_stock'])
+            InventoryLedger().set_stock(product, int(data['current_stock']), note=data.get('reason'))
         if 'initial_stock' in data:
             product.initial_stock = int(data['initial_stock'])
+        if 'low_stock_threshold' in data:
+            product.low_stock_threshold = int(data['low_stock_threshold']) if data['low_stock_threshold'] is not None else None
+            StockAlertService().sync(product)
+        if 'is_active' in data:
+            product.is_active = parse_flag(data['is_active'])
         
+        product_cache.invalidate()
         db.session.commit()
         
         return jsonify({
@@ -121,6 +211,12 @@ def update_product(sku):
             'data': product.to_dict()
         }), 200
         
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'قيمة غير صحيحة: {str(e)}'
+        }), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({
@@ -147,7 +243,7 @@ def update_product_stock(sku):
                 'message': 'current_stock مطلوب'
             }), 400
         
-        product.current_stock = int(data['current_stock'])
+        InventoryLedger().set_stock(product, int(data['current_stock']), note=data.get('reason'))
         db.session.commit()
         
         return jsonify({
@@ -175,6 +271,7 @@ def delete_product(sku):
             }), 404
         
         db.session.delete(product)
+        product_cache.invalidate()
         db.session.commit()
         
         return jsonify({
@@ -189,3 +286,55 @@ def delete_product(sku):
             'message': f'خطأ في حذف المنتج: {str(e)}'
         }), 500
 
+
+@product_bp.route('/products/import', methods=['POST'])
+def import_products():
+    """استيراد المنتجات وتحديثها حسب SKU من ملف CSV أو NDJSON"""
+    try:
+        uploaded = request.files.get('file')
+        if uploaded:
+            stream = uploaded.stream
+            filename = uploaded.filename or ''
+        else:
+            stream = request.stream
+            filename = ''
+        
+        file_format = request.args.get('format')
+        if not file_format:
+            if filename.endswith('.ndjson') or filename.endswith('.jsonl') or request.mimetype == 'application/x-ndjson':
+                file_format = 'ndjson'
+            else:
+                file_format = 'csv'
+        
+        if file_format not in ('csv', 'ndjson'):
+            return jsonify({
+                'success': False,
+                'message': 'الصيغة يجب أن تكون csv أو ndjson'
+            }), 400
+        
+        importer = ProductImporter(
+            chunk_size=int(request.args['chunk_size']) if request.args.get('chunk_size') else None
+        )
+        lines = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+        records = importer.iter_csv(lines) if file_format == 'csv' else importer.iter_ndjson(lines)
+        
+        report = importer.run(records)
+        
+        return jsonify({
+            'success': True,
+            'message': f'تم استيراد {report["inserted"]} منتج جديد وتحديث {report["updated"]} منتج، فشل {report["failed"]} سطر',
+            'data': report
+        }), 200
+        
+    except (ValueError, json.JSONDecodeError) as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'ملف غير صالح: {str(e)}'
+        }), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في استيراد المنتجات: {str(e)}'
+        }), 500
@@ -0,0 +1,166 @@
+from flask import Blueprint, request, jsonify, current_app, send_file, Response
+from src.services.report_jobs import ReportJobRunner
+from src.routes.financial_reports import (
+    get_profit_loss_report,
+    get_product_profitability,
+    get_daily_financial_summary,
+    get_monthly_financial_trend,
+    get_expense_analysis
+)
+import gzip
+import os
+
+report_jobs_bp = Blueprint('report_jobs', __name__)
+
+# التقارير التي يمكن تشغيلها في الخلفية
+REPORTS = {
+    'profit-loss': get_profit_loss_report,
+    'product-profitability': get_product_profitability,
+    'daily-summary': get_daily_financial_summary,
+    'monthly-trend': get_monthly_financial_trend,
+    'expense-analysis': get_expense_analysis
+}
+
+report_job_runner = ReportJobRunner()
+
+def _build_compute(app, view, params):
+    """تجهيز دالة تنفيذ التقرير داخل سياق طلب مستقل في خيط العمل"""
+    def compute():
+        with app.test_request_context(query_string=params):
+            response, status_code = view()
+            result = response.get_json()
+            if status_code >= 400 or not result.get('success'):
+                raise RuntimeError(result.get('message', 'فشل في تنفيذ التقرير'))
+            return result
+    return compute
+
+@report_jobs_bp.route('/reports/jobs', methods=['POST'])
+def create_report_job():
+    """إنشاء مهمة تقرير في الخلفية"""
+    try:
+        data = request.get_json()
+        
+        if not data or 'report' not in data:
+            return jsonify({
+                'success': False,
+                'message': 'الحقل report مطلوب'
+            }), 400
+        
+        report = data['report']
+        params = data.get('params', {})
+        
+        view = REPORTS.get(report)
+        if not view:
+            return jsonify({
+                'success': False,
+                'message': f'التقرير يجب أن يكون أحد القيم التالية: {", ".join(REPORTS)}'
+            }), 400
+        
+        if not isinstance(params, dict):
+            return jsonify({
+                'success': False,
+                'message': 'params يجب أن يكون كائناً'
+            }), 400
+        
+        params = {key: str(value) for key, value in params.items()}
+        app = current_app._get_current_object()
+        
+        job = report_job_runner.submit(report, params, _build_compute(app, view, params))
+        
+        return jsonify({
+            'success': True,
+            'message': 'تم استلام مهمة التقرير',
+            'data': job
+        }), 202
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في إنشاء مهمة التقرير: {str(e)}'
+        }), 500
+
+@report_jobs_bp.route('/reports/jobs', methods=['GET'])
+def get_report_jobs():
+    """جلب مهام التقارير الحالية"""
+    try:
+        jobs = report_job_runner.list_jobs()
+        
+        return jsonify({
+            'success': True,
+            'data': jobs,
+            'total_jobs': len(jobs)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في جلب مهام التقارير: {str(e)}'
+        }), 500
+
+@report_jobs_bp.route('/reports/jobs/<job_id>', methods=['GET'])
+def get_report_job(job_id):
+    """جلب حالة مهمة تقرير"""
+    try:
+        job = report_job_runner.get_job(job_id)
+        if not job:
+            return jsonify({
+                'success': False,
+                'message': 'مهمة التقرير غير موجودة أو انتهت صلاحيتها'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'data': job
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في جلب مهمة التقرير: {str(e)}'
+        }), 500
+
+@report_jobs_bp.route('/reports/jobs/<job_id>/result', methods=['GET'])
+def download_report_result(job_id):
+    """تحميل نتيجة مهمة تقرير"""
+    try:
+        job = report_job_runner.get_job(job_id)
+        if not job:
+            return jsonify({
+                'success': False,
+                'message': 'مهمة التقرير غير موجودة أو انتهت صلاحيتها'
+            }), 404
+        
+        if job['status'] == ReportJobRunner.FAILED:
+            return jsonify({
+                'success': False,
+                'message': f'فشل تنفيذ التقرير: {job["error"]}'
+            }), 500
+        
+        if job['status'] != ReportJobRunner.COMPLETED:
+            return jsonify({
+                'success': False,
+                'message': 'التقرير لم يكتمل بعد',
+                'data': job
+            }), 202
+        
+        path = report_job_runner.result_path(job_id)
+        if not os.path.exists(path):
+            return jsonify({
+                'success': False,
+                'message': 'ملف النتيجة غير موجود'
+            }), 404
+        
+        # إرسال الملف المضغوط كما هو إذا كان العميل يدعم gzip
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response = send_file(path, mimetype='application/json')
+            response.headers['Content-Encoding'] = 'gzip'
+            return response
+        
+        with gzip.open(path, 'rb') as f:
+            return Response(f.read(), mimetype='application/json')
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في تحميل نتيجة التقرير: {str(e)}'
+        }), 500
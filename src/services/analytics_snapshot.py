@@ -0,0 +1,457 @@
+import threading
+import time
+from datetime import datetime, date, timedelta
+from typing import Dict, Any, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select
+
+from src.models import db, Order, Expense
+
+EPOCH = date(1970, 1, 1)
+
+def to_day(value) -> int:
+    """تحويل التاريخ إلى عدد الأيام منذ 1970-01-01"""
+    if value is None:
+        return 0
+    if isinstance(value, datetime):
+        value = value.date()
+    return (value - EPOCH).days
+
+def from_day(day: int) -> str:
+    """تحويل رقم اليوم إلى تاريخ ISO"""
+    return (EPOCH + timedelta(days=int(day))).isoformat()
+
+class _Dictionary:
+    """ترميز القيم النصية إلى أرقام متتالية"""
+
+    def __init__(self):
+        self.values: List[Any] = []
+        self.codes: Dict[Any, int] = {}
+
+    def encode(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def encode_many(self, values: Sequence) -> np.ndarray:
+        return np.fromiter((self.encode(v) for v in values), dtype=np.int32, count=len(values))
+
+    def lookup(self, values: Sequence) -> np.ndarray:
+        """أكواد القيم الموجودة فقط (لاستخدامها في التصفية)"""
+        return np.array([self.codes[v] for v in values if v in self.codes], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.values)
+
+class _ColumnTable:
+    """جدول أعمدة NumPy مرتب حسب المفتاح الأساسي"""
+
+    def __init__(self, dtypes: Dict[str, Any], key: str):
+        self.dtypes = dtypes
+        self.key = key
+        self.columns = {name: np.empty(0, dtype=dtype) for name, dtype in dtypes.items()}
+
+    def __len__(self):
+        return len(self.columns[self.key])
+
+    def upsert(self, batch: Dict[str, np.ndarray]):
+        """تحديث الصفوف الموجودة وإضافة الجديدة مع الحفاظ على الترتيب"""
+        keys = batch[self.key]
+        if len(keys) == 0:
+            return
+
+        current_keys = self.columns[self.key]
+        positions = np.searchsorted(current_keys, keys)
+        exists = positions < len(current_keys)
+        exists[exists] = current_keys[positions[exists]] == keys[exists]
+
+        if exists.any():
+            for name, column in self.columns.items():
+                column[positions[exists]] = batch[name][exists]
+
+        new_rows = ~exists
+        if new_rows.any():
+            merged = {
+                name: np.concatenate([column, batch[name][new_rows].astype(column.dtype)])
+                for name, column in self.columns.items()
+            }
+            merged_keys = merged[self.key]
+            if len(merged_keys) > 1 and not np.all(merged_keys[1:] > merged_keys[:-1]):
+                order = np.argsort(merged_keys, kind='stable')
+                merged = {name: column[order] for name, column in merged.items()}
+            self.columns = merged
+
+    def retain(self, live_keys: np.ndarray):
+        """حذف الصفوف التي لم تعد مفاتيحها موجودة في المصدر"""
+        keep = np.isin(self.columns[self.key], live_keys, assume_unique=True)
+        if not keep.all():
+            self.columns = {name: column[keep] for name, column in self.columns.items()}
+
+class OrderAnalyticsSnapshot:
+    """لقطة عمودية في الذاكرة للطلبات والمصاريف للتجميعات السريعة
+
+    تُحمّل الطلبات والمصاريف إلى مصفوفات NumPy (التواريخ أيام int، والحالة والمنتج
+    والمصدر والولاية مرمزة بالقاموس)، وتُحسب التجميعات بعمليات متجهة مثل bincount
+    والأقنعة المنطقية. التحديث تدريجي: لا تُقرأ إلا الصفوف التي تغير updated_at لها،
+    ثم تُحذف من اللقطة الطلبات والمصاريف التي حُذفت أو أُرشفت منذ التحديث السابق.
+    اللقطة للبيانات الحية فقط: الطلبات المؤرشفة لا تدخلها (إجماليات الأرشيف في التقارير المالية).
+    """
+
+    ORDER_DIMENSIONS = ['product', 'wilaya', 'status', 'source', 'day', 'week', 'month']
+    ORDER_METRICS = ['revenue', 'quantity', 'orders', 'cogs', 'delivery_cost', 'gross_profit']
+    EXPENSE_DIMENSIONS = ['expense_type', 'day', 'week', 'month']
+
+    def __init__(self, chunk_size: int = 20000):
+        self.chunk_size = chunk_size
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.products = _Dictionary()
+        self.wilayas = _Dictionary()
+        self.statuses = _Dictionary()
+        self.sources = _Dictionary()
+        self.expense_types = _Dictionary()
+
+        self.orders = _ColumnTable({
+            'order_id': np.int64,
+            'day': np.int32,
+            'product': np.int32,
+            'wilaya': np.int32,
+            'status': np.int32,
+            'source': np.int32,
+            'quantity': np.int32,
+            'revenue': np.float64,
+            'cogs': np.float64,
+            'delivery_cost': np.float64
+        }, key='order_id')
+
+        self.expenses = _ColumnTable({
+            'expense_id': np.int64,
+            'day': np.int32,
+            'expense_type': np.int32,
+            'amount': np.float64,
+            'order_id': np.int64
+        }, key='expense_id')
+
+        self.orders_watermark: Optional[datetime] = None
+        self.expenses_watermark: Optional[datetime] = None
+        self.refreshed_at: Optional[float] = None
+        self.full_refreshed_at: Optional[float] = None
+
+    # ------------------------------------------------------------------ التحميل
+
+    def _load_orders(self, since: Optional[datetime]) -> Optional[datetime]:
+        statement = select(
+            Order.order_id, Order.order_date, Order.product_id, Order.wilaya,
+            Order.order_status, Order.order_source, Order.quantity,
+            Order.total_amount, Order.unit_cost, Order.delivery_price, Order.updated_at
+        ).order_by(Order.order_id)
+        if since is not None:
+            statement = statement.where(Order.updated_at >= since)
+
+        watermark = since
+        result = db.session.execute(statement.execution_options(yield_per=self.chunk_size))
+
+        for rows in result.partitions():
+            quantity = np.array([r.quantity or 0 for r in rows], dtype=np.int32)
+            unit_cost = np.array([r.unit_cost or 0 for r in rows], dtype=np.float64)
+
+            self.orders.upsert({
+                'order_id': np.array([r.order_id for r in rows], dtype=np.int64),
+                'day': np.array([to_day(r.order_date) for r in rows], dtype=np.int32),
+                'product': self.products.encode_many([r.product_id for r in rows]),
+                'wilaya': self.wilayas.encode_many([r.wilaya for r in rows]),
+                'status': self.statuses.encode_many([r.order_status for r in rows]),
+                'source': self.sources.encode_many([r.order_source for r in rows]),
+                'quantity': quantity,
+                'revenue': np.array([r.total_amount or 0 for r in rows], dtype=np.float64),
+                'cogs': unit_cost * quantity,
+                'delivery_cost': np.array([r.delivery_price or 0 for r in rows], dtype=np.float64)
+            })
+
+            latest = max((r.updated_at for r in rows if r.updated_at), default=None)
+            if latest and (watermark is None or latest > watermark):
+                watermark = latest
+
+        return watermark
+
+    def _load_expenses(self, since: Optional[datetime]) -> Optional[datetime]:
+        statement = select(
+            Expense.expense_id, Expense.expense_date, Expense.expense_type,
+            Expense.amount, Expense.order_id, Expense.updated_at
+        ).order_by(Expense.expense_id)
+        if since is not None:
+            statement = statement.where(Expense.updated_at >= since)
+
+        watermark = since
+        result = db.session.execute(statement.execution_options(yield_per=self.chunk_size))
+
+        for rows in result.partitions():
+            self.expenses.upsert({
+                'expense_id': np.array([r.expense_id for r in rows], dtype=np.int64),
+                'day': np.array([to_day(r.expense_date) for r in rows], dtype=np.int32),
+                'expense_type': self.expense_types.encode_many([r.expense_type for r in rows]),
+                'amount': np.array([r.amount or 0 for r in rows], dtype=np.float64),
+                'order_id': np.array([r.order_id or 0 for r in rows], dtype=np.int64)
+            })
+
+            latest = max((r.updated_at for r in rows if r.updated_at), default=None)
+            if latest and (watermark is None or latest > watermark):
+                watermark = latest
+
+        return watermark
+
+    @staticmethod
+    def _live_keys(column) -> np.ndarray:
+        return np.fromiter(db.session.execute(select(column)).scalars(), dtype=np.int64)
+
+    def refresh(self, full: bool = False):
+        """تحديث اللقطة (كاملة أو تدريجية حسب updated_at)"""
+        with self._lock:
+            incremental = not full and self.full_refreshed_at is not None
+            if not incremental:
+                self._reset()
+                self.full_refreshed_at = time.time()
+
+            self.orders_watermark = self._load_orders(self.orders_watermark)
+            self.expenses_watermark = self._load_expenses(self.expenses_watermark)
+            if incremental:
+                # الحذف والأرشفة لا يتركان updated_at، فتُقارن المفاتيح بالجدول الحي
+                self.orders.retain(self._live_keys(Order.order_id))
+                self.expenses.retain(self._live_keys(Expense.expense_id))
+            self.refreshed_at = time.time()
+
+    def ensure_fresh(self, max_age: float, full_refresh_age: Optional[float] = None):
+        """تحديث اللقطة إذا تجاوز عمرها الحد المسموح"""
+        now = time.time()
+        if full_refresh_age and self.full_refreshed_at and now - self.full_refreshed_at > full_refresh_age:
+            self.refresh(full=True)
+        elif self.refreshed_at is None or now - self.refreshed_at > max_age:
+            self.refresh()
+
+    def start_background_refresh(self, app, interval: float):
+        """تحديث دوري في خيط خلفي"""
+        def loop():
+            while True:
+                try:
+                    with app.app_context():
+                        self.refresh()
+                except Exception as e:
+                    print(f"خطأ في تحديث لقطة التحليلات: {str(e)}")
+                time.sleep(interval)
+
+        thread = threading.Thread(target=loop, name='analytics-refresh', daemon=True)
+        thread.start()
+        return thread
+
+    # ------------------------------------------------------------------ التجميع
+
+    @staticmethod
+    def _time_codes(day: np.ndarray, dimension: str):
+        if dimension == 'day':
+            return day
+        if dimension == 'week':
+            # 1970-01-01 يوم خميس، فالإزاحة 3 تجعل الأسبوع يبدأ يوم الإثنين
+            return (day + 3) // 7
+        if dimension == 'month':
+            months = day.astype('datetime64[D]').astype('datetime64[M]')
+            return months.astype(np.int64)
+        raise ValueError(dimension)
+
+    @staticmethod
+    def _time_label(code: int, dimension: str) -> str:
+        if dimension == 'day':
+            return from_day(code)
+        if dimension == 'week':
+            return from_day(code * 7 - 3)
+        return str(np.datetime64(int(code), 'M'))
+
+    @staticmethod
+    def _group(dimension_codes: List[np.ndarray], weights_by_metric: Dict[str, np.ndarray]):
+        """تجميع متجه بمفتاح مركب وbincount"""
+        rows_count = len(next(iter(weights_by_metric.values())))
+        offsets = []
+        cardinalities = []
+        for codes in dimension_codes:
+            low = codes.min() if len(codes) else 0
+            offsets.append(low)
+            cardinalities.append(int(codes.max() - low + 1) if len(codes) else 1)
+
+        total = int(np.prod(cardinalities, dtype=np.float64))
+        key = np.zeros(rows_count, dtype=np.int64)
+        for codes, low, cardinality in zip(dimension_codes, offsets, cardinalities):
+            key = key * cardinality + (codes - low)
+
+        if total > 4 * len(key) + 1024:
+            # مفاتيح متفرقة: ضغطها أولاً لتجنب مصفوفة ضخمة
+            unique_keys, key = np.unique(key, return_inverse=True)
+            size = len(unique_keys)
+        else:
+            unique_keys = None
+            size = total
+
+        counts = np.bincount(key, minlength=size)
+        sums = {m: np.bincount(key, weights=w, minlength=size) for m, w in weights_by_metric.items()}
+        present = np.nonzero(counts)[0]
+
+        group_keys = unique_keys[present] if unique_keys is not None else present
+        decoded = []
+        for low, cardinality in reversed(list(zip(offsets, cardinalities))):
+            decoded.append(group_keys % cardinality + low)
+            group_keys = group_keys // cardinality
+        decoded.reverse()
+
+        return decoded, {m: values[present] for m, values in sums.items()}, counts[present]
+
+    def aggregate_orders(self, group_by: List[str], metrics: List[str],
+                         start_day: Optional[int] = None, end_day: Optional[int] = None,
+                         statuses: Optional[List[str]] = None, product_ids: Optional[List[int]] = None,
+                         wilayas: Optional[List[str]] = None, sources: Optional[List[str]] = None,
+                         limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """تجميع الطلبات حسب الأبعاد المطلوبة مع التصفية"""
+        for dimension in group_by:
+            if dimension not in self.ORDER_DIMENSIONS:
+                raise ValueError(f'بعد غير مدعوم: {dimension}')
+        for metric in metrics:
+            if metric not in self.ORDER_METRICS:
+                raise ValueError(f'مقياس غير مدعوم: {metric}')
+
+        with self._lock:
+            columns = self.orders.columns
+            mask = np.ones(len(self.orders), dtype=bool)
+
+            if start_day is not None:
+                mask &= columns['day'] >= start_day
+            if end_day is not None:
+                mask &= columns['day'] <= end_day
+            if statuses:
+                mask &= np.isin(columns['status'], self.statuses.lookup(statuses))
+            if product_ids:
+                mask &= np.isin(columns['product'], self.products.lookup(product_ids))
+            if wilayas:
+                mask &= np.isin(columns['wilaya'], self.wilayas.lookup(wilayas))
+            if sources:
+                mask &= np.isin(columns['source'], self.sources.lookup(sources))
+
+            selected = {name: column[mask] for name, column in columns.items()}
+            dictionaries = {
+                'product': self.products.values,
+                'wilaya': self.wilayas.values,
+                'status': self.statuses.values,
+                'source': self.sources.values
+            }
+
+        if len(selected['order_id']) == 0:
+            return []
+
+        dimension_codes = []
+        for dimension in group_by:
+            if dimension in ('day', 'week', 'month'):
+                dimension_codes.append(self._time_codes(selected['day'], dimension).astype(np.int64))
+            else:
+                dimension_codes.append(selected[dimension].astype(np.int64))
+
+        weights = {}
+        for metric in metrics:
+            if metric == 'orders':
+                continue
+            if metric == 'gross_profit':
+                weights[metric] = selected['revenue'] - selected['cogs']
+            elif metric == 'quantity':
+                weights[metric] = selected['quantity'].astype(np.float64)
+            else:
+                weights[metric] = selected[metric]
+        if not weights:
+            weights['_count'] = np.ones(len(selected['order_id']))
+
+        decoded, sums, counts = self._group(dimension_codes, weights)
+
+        order = np.arange(len(counts))
+        sort_metric = next((m for m in metrics if m in sums), None)
+        if sort_metric:
+            order = np.argsort(-sums[sort_metric], kind='stable')
+        elif 'orders' in metrics:
+            order = np.argsort(-counts, kind='stable')
+        if limit:
+            order = order[:limit]
+
+        rows = []
+        for i in order:
+            row = {}
+            for dimension, codes in zip(group_by, decoded):
+                code = int(codes[i])
+                if dimension in ('day', 'week', 'month'):
+                    row[dimension] = self._time_label(code, dimension)
+                else:
+                    row[dimension] = dictionaries[dimension][code]
+            for metric in metrics:
+                row[metric] = int(counts[i]) if metric == 'orders' else float(sums[metric][i])
+            rows.append(row)
+
+        return rows
+
+    def aggregate_expenses(self, group_by: List[str], start_day: Optional[int] = None,
+                           end_day: Optional[int] = None,
+                           expense_types: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """تجميع المصاريف حسب النوع أو الفترة"""
+        for dimension in group_by:
+            if dimension not in self.EXPENSE_DIMENSIONS:
+                raise ValueError(f'بعد غير مدعوم: {dimension}')
+
+        with self._lock:
+            columns = self.expenses.columns
+            mask = np.ones(len(self.expenses), dtype=bool)
+
+            if start_day is not None:
+                mask &= columns['day'] >= start_day
+            if end_day is not None:
+                mask &= columns['day'] <= end_day
+            if expense_types:
+                mask &= np.isin(columns['expense_type'], self.expense_types.lookup(expense_types))
+
+            selected = {name: column[mask] for name, column in columns.items()}
+            type_values = self.expense_types.values
+
+        if len(selected['expense_id']) == 0:
+            return []
+
+        dimension_codes = []
+        for dimension in group_by:
+            if dimension == 'expense_type':
+                dimension_codes.append(selected['expense_type'].astype(np.int64))
+            else:
+                dimension_codes.append(self._time_codes(selected['day'], dimension).astype(np.int64))
+
+        decoded, sums, counts = self._group(dimension_codes, {'amount': selected['amount']})
+
+        rows = []
+        for i in np.argsort(-sums['amount'], kind='stable'):
+            row = {}
+            for dimension, codes in zip(group_by, decoded):
+                code = int(codes[i])
+                row[dimension] = type_values[code] if dimension == 'expense_type' else self._time_label(code, dimension)
+            row['amount'] = float(sums['amount'][i])
+            row['count'] = int(counts[i])
+            rows.append(row)
+
+        return rows
+
+    def status(self) -> Dict[str, Any]:
+        """معلومات عن حالة اللقطة"""
+        with self._lock:
+            return {
+                'orders': len(self.orders),
+                'expenses': len(self.expenses),
+                'products': len(self.products),
+                'wilayas': len(self.wilayas),
+                'orders_watermark': self.orders_watermark.isoformat() if self.orders_watermark else None,
+                'expenses_watermark': self.expenses_watermark.isoformat() if self.expenses_watermark else None,
+                'refreshed_at': datetime.utcfromtimestamp(self.refreshed_at).isoformat() if self.refreshed_at else None,
+                'memory_bytes': sum(c.nbytes for c in self.orders.columns.values()) +
+                                sum(c.nbytes for c in self.expenses.columns.values())
+            }
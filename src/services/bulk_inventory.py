@@ -0,0 +1,168 @@
+from src.models import db, Product, InventoryMovement
+from src.services.cost_lots import FifoCostEngine
+from src.services.inventory_ledger import InventoryLedger
+from typing import Dict, Any, List, Optional
+import csv
+import io
+
+class BulkInventoryUpdate:
+    """تعبئة أو تعديل مخزون عدة منتجات في معاملة واحدة
+
+    تُحل كل المنتجات باستعلام واحد، وتُفحص جميع الأسطر قبل التطبيق، ثم يُطبق
+    صافي التغيير لكل منتج مرة واحدة (تحديث واحد وحركة واحدة في الدفتر).
+    """
+
+    RESTOCK = 'restock'
+    ADJUST = 'adjust'
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.quantity_field = 'quantity' if mode == self.RESTOCK else 'adjustment'
+
+    @staticmethod
+    def parse_csv(content: str) -> List[Dict[str, Any]]:
+        """تحويل ملف CSV إلى أسطر (الأعمدة: product_id أو sku، quantity/adjustment، ...)"""
+        reader = csv.DictReader(io.StringIO(content.lstrip('﻿')))
+        return [
+            {key.strip(): value.strip() for key, value in row.items() if key and value not in (None, '')}
+            for row in reader
+        ]
+
+    def _resolve(self, items: List[Dict[str, Any]]) -> Dict[str, Product]:
+        product_ids = {int(item['product_id']) for item in items if str(item.get('product_id', '')).strip().isdigit()}
+        skus = {str(item['sku']) for item in items if item.get('sku')}
+
+        if not product_ids and not skus:
+            return {}
+
+        query = Product.query.filter(
+            db.or_(Product.product_id.in_(product_ids), Product.sku.in_(skus))
+        ).with_for_update()
+
+        products = {}
+        for product in query.all():
+            products[f'id:{product.product_id}'] = product
+            products[f'sku:{product.sku}'] = product
+        return products
+
+    def _validate_row(self, item: Dict[str, Any], products: Dict[str, Product]):
+        """التحقق من سطر واحد وإرجاع (المنتج، الكمية، سعر الشراء)"""
+        if item.get('product_id') not in (None, ''):
+            product = products.get(f'id:{int(item["product_id"])}')
+        elif item.get('sku'):
+            product = products.get(f'sku:{item["sku"]}')
+        else:
+            raise ValueError('product_id أو sku مطلوب')
+
+        if not product:
+            raise ValueError('المنتج غير موجود')
+
+        if item.get(self.quantity_field) in (None, ''):
+            raise ValueError(f'الحقل {self.quantity_field} مطلوب')
+
+        quantity = int(item[self.quantity_field])
+
+        unit_cost = None
+        if self.mode == self.RESTOCK:
+            if quantity <= 0:
+                raise ValueError('الكمية يجب أن تكون أكبر من صفر')
+            if item.get('unit_cost') not in (None, ''):
+                unit_cost = float(item['unit_cost'])
+                if unit_cost < 0:
+                    raise ValueError('سعر الشراء لا يمكن أن يكون سالباً')
+        elif quantity == 0:
+            raise ValueError('التعديل يجب ألا يكون صفراً')
+
+        return product, quantity, unit_cost
+
+    def run(self, items: List[Dict[str, Any]], reference: Optional[str] = None,
+            reason: Optional[str] = None, allow_partial: bool = False) -> Dict[str, Any]:
+        """فحص الأسطر وتطبيقها؛ بدون allow_partial لا يطبق شيء إذا فشل أي سطر"""
+        products = self._resolve(items)
+
+        report = []
+        valid_rows = []
+        running_stock: Dict[int, int] = {}
+
+        for index, item in enumerate(items, start=1):
+            entry = {
+                'row': index,
+                'product_id': item.get('product_id'),
+                'sku': item.get('sku')
+            }
+            report.append(entry)
+
+            try:
+                product, quantity, unit_cost = self._validate_row(item, products)
+                row_reason = item.get('reason') or reason
+                if self.mode == self.ADJUST and not row_reason:
+                    raise ValueError('الحقل reason مطلوب')
+
+                old_stock = running_stock.get(product.product_id, product.current_stock or 0)
+                new_stock = old_stock + quantity
+                if new_stock < 0:
+                    raise ValueError(f'لا يمكن تقليل المخزون إلى {new_stock}. المخزون الحالي: {old_stock}')
+
+                running_stock[product.product_id] = new_stock
+                entry.update({
+                    'product_id': product.product_id,
+                    'sku': product.sku,
+                    'status': 'valid',
+                    'old_stock': old_stock,
+                    'new_stock': new_stock
+                })
+                valid_rows.append((entry, item, product, quantity, unit_cost, row_reason))
+
+            except (ValueError, TypeError) as e:
+                entry.update({'status': 'error', 'error': str(e)})
+
+        failed = [entry for entry in report if entry['status'] == 'error']
+        if failed and not allow_partial:
+            for entry, *_ in valid_rows:
+                entry['status'] = 'skipped'
+            return self._result(report, applied=False)
+
+        # صافي التغيير لكل منتج
+        net_changes: Dict[int, Dict[str, Any]] = {}
+        engine = FifoCostEngine()
+
+        for entry, item, product, quantity, unit_cost, row_reason in valid_rows:
+            change = net_changes.setdefault(product.product_id, {'product': product, 'quantity': 0, 'notes': []})
+            change['quantity'] += quantity
+
+            note = item.get('reference') or reference or row_reason
+            if note and note not in change['notes']:
+                change['notes'].append(note)
+
+            if unit_cost is not None:
+                lot = engine.receive(product, quantity, unit_cost,
+                                     reference=item.get('reference') or reference)
+                entry['unit_cost'] = unit_cost
+                entry['lot'] = lot
+
+            entry['status'] = 'applied'
+
+        ledger = InventoryLedger()
+        movement_reason = InventoryMovement.RESTOCK if self.mode == self.RESTOCK else InventoryMovement.ADJUSTMENT
+        for change in net_changes.values():
+            ledger.apply(change['product'], change['quantity'], movement_reason,
+                         note='; '.join(change['notes']) or None)
+
+        db.session.flush()
+        for entry in report:
+            lot = entry.pop('lot', None)
+            if lot is not None:
+                entry['lot_id'] = lot.lot_id
+
+        return self._result(report, applied=bool(valid_rows), products_updated=len(net_changes))
+
+    @staticmethod
+    def _result(report: List[Dict[str, Any]], applied: bool, products_updated: int = 0) -> Dict[str, Any]:
+        return {
+            'applied': applied,
+            'total_rows': len(report),
+            'applied_rows': sum(1 for entry in report if entry['status'] == 'applied'),
+            'failed_rows': sum(1 for entry in report if entry['status'] == 'error'),
+            'products_updated': products_updated,
+            'rows': report
+        }
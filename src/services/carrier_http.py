@@ -0,0 +1,431 @@
+import email.utils
+import os
+import random
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeout
+from typing import Dict, Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from src.services.sketches import KLLSketch
+
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'])
+RETRYABLE_STATUSES = frozenset([429, 502, 503, 504])
+
+class CircuitOpenError(requests.ConnectionError):
+    """رفض فوري للطلب لأن قاطع الدائرة مفتوح لهذه الشركة"""
+
+# إذن القاطع لطلب واحد: probe لطلبات الاختبار في حالة نصف الفتح، و generation
+# رقم دورة نصف الفتح التي سمحت به
+Admission = namedtuple('Admission', ['probe', 'generation'])
+
+class CircuitBreaker:
+    """قاطع دائرة يعتمد على نسبة الفشل في نافذة آخر الطلبات
+
+    - مغلق: الطلبات تمر، ويفتح إذا بلغت نسبة الفشل failure_rate في آخر window
+      طلب (بعد min_calls طلب على الأقل). الطلب الأبطأ من slow_call_seconds يعد فشلاً.
+    - مفتوح: الطلبات ترفض فوراً لمدة open_seconds.
+    - نصف مفتوح: يسمح بعدد half_open_probes من طلبات الاختبار؛ نجاحها كلها يغلق
+      الدائرة وفشل أي منها يعيد فتحها. نتائج الطلبات التي سُمح بها قبل ذلك لا
+      تحسب اختباراً، لذلك يمرر allow() إذناً يعاد مع النتيجة إلى record().
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, window: Optional[int] = None, min_calls: Optional[int] = None,
+                 failure_rate: Optional[float] = None, open_seconds: Optional[float] = None,
+                 half_open_probes: Optional[int] = None, slow_call_seconds: Optional[float] = None):
+        self.window = window or int(os.getenv('CARRIER_BREAKER_WINDOW', 20))
+        self.min_calls = min_calls or int(os.getenv('CARRIER_BREAKER_MIN_CALLS', 10))
+        self.failure_rate = failure_rate or float(os.getenv('CARRIER_BREAKER_FAILURE_RATE', 0.5))
+        self.open_seconds = open_seconds or float(os.getenv('CARRIER_BREAKER_OPEN_SECONDS', 30))
+        self.half_open_probes = half_open_probes or int(os.getenv('CARRIER_BREAKER_HALF_OPEN_PROBES', 2))
+        self.slow_call_seconds = slow_call_seconds or float(os.getenv('CARRIER_BREAKER_SLOW_CALL_SECONDS', 10))
+
+        self.state = self.CLOSED
+        self._outcomes = deque(maxlen=self.window)
+        self._opened_at = None
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.opened_count = 0
+
+    def _open(self, now: float):
+        self.state = self.OPEN
+        self._opened_at = now
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self.opened_count += 1
+
+    def allow(self) -> Optional[Admission]:
+        """إذن بإرسال طلب الآن، أو None إذا كان مرفوضاً"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.OPEN:
+                if now - self._opened_at < self.open_seconds:
+                    self.rejected += 1
+                    return None
+                self.state = self.HALF_OPEN
+                self._probes_in_flight = 0
+                self._probe_successes = 0
+                self._generation += 1
+
+            if self.state == self.HALF_OPEN:
+                if self._probes_in_flight + self._probe_successes >= self.half_open_probes:
+                    self.rejected += 1
+                    return None
+                self._probes_in_flight += 1
+                return Admission(True, self._generation)
+
+            return Admission(False, self._generation)
+
+    def record(self, success: bool, elapsed: Optional[float] = None, admission: Optional[Admission] = None):
+        """تسجيل نتيجة طلب سُمح به مع الإذن الذي أرجعه allow()"""
+        if success and elapsed is not None and elapsed >= self.slow_call_seconds:
+            success = False
+
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.HALF_OPEN:
+                if admission is None or not admission.probe or admission.generation != self._generation:
+                    # نتيجة طلب سُمح به قبل نصف الفتح أو في دورة سابقة
+                    return
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if not success:
+                    self._open(now)
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                return
+
+            if self.state == self.OPEN:
+                # نتيجة طلب بدأ قبل فتح الدائرة
+                return
+
+            self._outcomes.append(success)
+            if len(self._outcomes) >= self.min_calls:
+                failures = self._outcomes.count(False)
+                if failures / len(self._outcomes) >= self.failure_rate:
+                    self._open(now)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """حالة القاطع للعرض"""
+        with self._lock:
+            state = self.state
+            retry_in = None
+            if state == self.OPEN:
+                retry_in = max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+                if retry_in == 0:
+                    state = self.HALF_OPEN
+            outcomes = list(self._outcomes)
+            return {
+                'state': state,
+                'failure_rate': round(outcomes.count(False) / len(outcomes), 3) if outcomes else 0.0,
+                'window_calls': len(outcomes),
+                'threshold': self.failure_rate,
+                'retry_in_seconds': round(retry_in, 1) if retry_in is not None else None,
+                'opened_count': self.opened_count,
+                'rejected': self.rejected
+            }
+
+class CarrierHttpClient:
+    """عميل HTTP لشركة توصيل واحدة: جلسة دائمة بمجمع اتصالات وإعادة محاولة آمنة
+
+    - الاتصالات تبقى مفتوحة (keep-alive) ويعاد استخدامها بين الطلبات.
+    - مهلة الاتصال منفصلة عن مهلة القراءة.
+    - فشل الاتصال يعاد دائماً (الطلب لم يصل)، أما انتهاء مهلة القراءة وأخطاء
+      5xx/429 فتعاد فقط للطلبات المتكررة بأمان (GET أو ما يُعلم كـ idempotent).
+    - الانتظار بين المحاولات أسي مع عشوائية كاملة (full jitter).
+    - قاطع دائرة لكل شركة يرفض الطلبات فوراً (CircuitOpenError) عندما تتعطل.
+    - الطلبات المعلمة hedge باسم نوعها (تتبع وأسعار) يرسل لها طلب مكرر إذا
+      تجاوزت زمن p95 المقاس لهذا النوع وحده، ويؤخذ أول رد (يفعل بـ CARRIER_HEDGING=1).
+    """
+
+    def __init__(self, name: str, base_url: str, headers: Optional[Dict[str, str]] = None,
+                 pool_size: Optional[int] = None, connect_timeout: Optional[float] = None,
+                 read_timeout: Optional[float] = None, max_retries: Optional[int] = None,
+                 backoff_base: Optional[float] = None, backoff_max: Optional[float] = None):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size or int(os.getenv('CARRIER_POOL_SIZE', 10))
+        self.connect_timeout = connect_timeout or float(os.getenv('CARRIER_CONNECT_TIMEOUT', 3.05))
+        self.read_timeout = read_timeout or float(os.getenv('CARRIER_READ_TIMEOUT', 30))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('CARRIER_MAX_RETRIES', 3))
+        self.backoff_base = backoff_base or float(os.getenv('CARRIER_BACKOFF_BASE', 0.2))
+        self.backoff_max = backoff_max or float(os.getenv('CARRIER_BACKOFF_MAX', 5))
+        self.hedging = os.getenv('CARRIER_HEDGING', '0').lower() in ('1', 'true', 'yes')
+        self.hedge_min_delay = float(os.getenv('CARRIER_HEDGE_MIN_DELAY_MS', 50)) / 1000.0
+        self.hedge_min_samples = int(os.getenv('CARRIER_HEDGE_MIN_SAMPLES', 20))
+        self.breaker = CircuitBreaker()
+        self._hedge_executor = ThreadPoolExecutor(max_workers=self.pool_size * 2, thread_name_prefix=f'{name}-hedge')
+
+        self.session = requests.Session()
+        # إعادة المحاولة تُدار هنا وليس في urllib3 لتطبيق قواعد التكرار الآمن
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0, pool_block=False)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._adapter = adapter
+        if headers:
+            self.session.headers.update(headers)
+
+        self._lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'attempts': 0,
+            'retries': 0,
+            'failures': 0,
+            'hedged': 0,
+            'hedge_wins': 0,
+            'status_codes': {},
+            'errors': {}
+        }
+        self._latency = KLLSketch(k=100)
+        self._latency_total = 0.0
+        # زمن الردود لكل نوع طلب قابل للتكرار؛ إنشاء الشحنات لا يدخل في مهلة التكرار
+        self._hedge_latency: Dict[str, KLLSketch] = {}
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+        # احترام Retry-After إن كان قصيراً
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                seconds = float(retry_after)
+            except ValueError:
+                try:
+                    parsed = email.utils.parsedate_to_datetime(retry_after)
+                    seconds = parsed.timestamp() - time.time() if parsed else 0
+                except (TypeError, ValueError):
+                    # قيمة غير قياسية (مثل "soon"): نكتفي بالانتظار الأسي
+                    seconds = 0
+            if 0 < seconds <= self.backoff_max:
+                delay = max(delay, seconds)
+
+        return delay
+
+    def _record(self, elapsed: Optional[float] = None, status: Optional[int] = None,
+                error: Optional[str] = None, retried: bool = False, hedge: Optional[str] = None):
+        with self._lock:
+            self._stats['attempts'] += 1
+            if retried:
+                self._stats['retries'] += 1
+            if status is not None:
+                key = str(status)
+                self._stats['status_codes'][key] = self._stats['status_codes'].get(key, 0) + 1
+            if error:
+                self._stats['errors'][error] = self._stats['errors'].get(error, 0) + 1
+            if elapsed is not None:
+                self._latency.add(elapsed * 1000)
+                self._latency_total += elapsed * 1000
+            if hedge and elapsed is not None and status is not None:
+                self._hedge_latency.setdefault(hedge, KLLSketch(k=100)).add(elapsed * 1000)
+
+    @staticmethod
+    def _request_not_sent(error: Exception) -> bool:
+        """هل فشل الطلب قبل إرساله (تعذر فتح الاتصال)"""
+        if isinstance(error, requests.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+
+    @classmethod
+    def not_sent(cls, error: Exception) -> bool:
+        """هل تأكد أن الطلب لم يصل إلى الشركة (قاطع الدائرة مفتوح أو تعذر فتح الاتصال)"""
+        return isinstance(error, CircuitOpenError) or (
+            isinstance(error, requests.RequestException) and cls._request_not_sent(error)
+        )
+
+    def _hedge_delay(self, hedge: str) -> Optional[float]:
+        """مهلة إرسال الطلب المكرر: زمن p95 المقاس لنوع الطلب (None إذا لم تكف العينات)"""
+        with self._lock:
+            sketch = self._hedge_latency.get(hedge)
+            if sketch is None or sketch.n < self.hedge_min_samples:
+                return None
+            p95 = sketch.quantiles([0.95])[0]
+        return max(self.hedge_min_delay, p95 / 1000.0)
+
+    def _send(self, method: str, url: str, timeout, hedge: Optional[str], **kwargs) -> requests.Response:
+        """محاولة واحدة، مع طلب مكرر إذا تأخر الرد عن p95"""
+        delay = self._hedge_delay(hedge) if hedge and self.hedging else None
+        if delay is None:
+            return self.session.request(method, url, timeout=timeout, **kwargs)
+
+        primary = self._hedge_executor.submit(self.session.request, method, url, timeout=timeout, **kwargs)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeout:
+            pass
+
+        with self._lock:
+            self._stats['hedged'] += 1
+        backup = self._hedge_executor.submit(self.session.request, method, url, timeout=timeout, **kwargs)
+
+        error = None
+        for future in as_completed([primary, backup]):
+            try:
+                response = future.result()
+            except Exception as e:
+                error = e
+                continue
+
+            # الرد الخاسر يغلق عند وصوله ليعود اتصاله إلى المجمع
+            loser = backup if future is primary else primary
+            loser.add_done_callback(lambda other: other.exception() is None and other.result().close())
+            if future is backup:
+                with self._lock:
+                    self._stats['hedge_wins'] += 1
+            return response
+
+        raise error
+
+    @staticmethod
+    def budget(seconds: Optional[float]) -> Dict[str, Any]:
+        """وسائط طلب لا يتجاوز seconds: مهلة واحدة دون إعادة محاولة (لا شيء إذا لم تحدد)"""
+        if seconds is None:
+            return {}
+        return {'timeout': seconds, 'max_retries': 0}
+
+    def request(self, method: str, path: str, idempotent: Optional[bool] = None,
+                timeout: Optional[Any] = None, hedge: Optional[str] = None,
+                max_retries: Optional[int] = None, **kwargs) -> requests.Response:
+        """إرسال طلب مع إعادة المحاولة حسب قواعد التكرار الآمن
+
+        hedge اسم نوع الطلب (مثل 'tracking') إذا كان قابلاً للتكرار المتحوط، و
+        max_retries يستبدل عدد المحاولات الافتراضي للعميل.
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        hedge = hedge if idempotent else None
+
+        url = path if path.startswith('http') else f'{self.base_url}{path}'
+        timeout = (self.connect_timeout, self.read_timeout) if timeout is None else timeout
+        max_retries = self.max_retries if max_retries is None else max_retries
+
+        with self._lock:
+            self._stats['requests'] += 1
+
+        attempt = 0
+        while True:
+            admission = self.breaker.allow()
+            if admission is None:
+                raise CircuitOpenError(f'خدمة {self.name} متوقفة مؤقتاً (قاطع الدائرة مفتوح)')
+
+            started = time.perf_counter()
+            try:
+                response = self._send(method, url, timeout, hedge, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                elapsed = time.perf_counter() - started
+                self.breaker.record(False, admission=admission)
+                # فشل الاتصال يعني أن الطلب لم يُرسل فيمكن إعادته دائماً
+                not_sent = self._request_not_sent(e)
+                can_retry = attempt < max_retries and (idempotent or not_sent)
+                self._record(elapsed, error=type(e).__name__, retried=can_retry)
+                if not can_retry:
+                    with self._lock:
+                        self._stats['failures'] += 1
+                    raise
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            except Exception:
+                # أي خطأ آخر يسجل فشلاً حتى لا يبقى طلب الاختبار معلقاً
+                self.breaker.record(False, admission=admission)
+                raise
+
+            elapsed = time.perf_counter() - started
+            self.breaker.record(
+                response.status_code < 500 and response.status_code != 429, elapsed, admission
+            )
+            can_retry = (
+                response.status_code in RETRYABLE_STATUSES
+                and idempotent
+                and attempt < max_retries
+            )
+            self._record(elapsed, status=response.status_code, retried=can_retry, hedge=hedge)
+            if not can_retry:
+                if response.status_code >= 500:
+                    with self._lock:
+                        self._stats['failures'] += 1
+                return response
+
+            response.close()
+            time.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request('POST', path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        return self.request('DELETE', path, **kwargs)
+
+    def _connection_stats(self) -> Dict[str, int]:
+        """عدد الاتصالات المفتوحة فعلياً مقابل الطلبات المرسلة عبر المجمع
+
+        تعتمد على خصائص داخلية في urllib3، فإذا تغيرت في إصدار آخر لا تظهر هذه الأرقام.
+        """
+        opened = 0
+        pooled_requests = 0
+        idle = 0
+        try:
+            for pool in list(self._adapter.poolmanager.pools._container.values()):
+                opened += pool.num_connections
+                pooled_requests += pool.num_requests
+                idle += sum(1 for conn in pool.pool.queue if conn is not None) if pool.pool else 0
+        except (AttributeError, TypeError):
+            return {}
+        return {
+            'connections_opened': opened,
+            'pooled_requests': pooled_requests,
+            'idle_connections': idle
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """إحصائيات الاتصالات وزمن الاستجابة"""
+        with self._lock:
+            stats = {
+                'carrier': self.name,
+                'base_url': self.base_url,
+                'pool_size': self.pool_size,
+                'timeouts': {'connect': self.connect_timeout, 'read': self.read_timeout},
+                'max_retries': self.max_retries,
+                'requests': self._stats['requests'],
+                'attempts': self._stats['attempts'],
+                'retries': self._stats['retries'],
+                'failures': self._stats['failures'],
+                'hedging': self.hedging,
+                'hedged': self._stats['hedged'],
+                'hedge_wins': self._stats['hedge_wins'],
+                'status_codes': dict(self._stats['status_codes']),
+                'errors': dict(self._stats['errors'])
+            }
+            p50, p95, p99 = self._latency.quantiles([0.5, 0.95, 0.99])
+            stats['latency_ms'] = {
+                'count': self._latency.n,
+                'mean': round(self._latency_total / self._latency.n, 2) if self._latency.n else None,
+                'p50': round(p50, 2) if p50 is not None else None,
+                'p95': round(p95, 2) if p95 is not None else None,
+                'p99': round(p99, 2) if p99 is not None else None,
+                'max': round(self._latency.max_value, 2) if self._latency.max_value is not None else None
+            }
+
+        stats['circuit_breaker'] = self.breaker.snapshot()
+        stats.update(self._connection_stats())
+        if stats['attempts'] and 'connections_opened' in stats:
+            stats['connection_reuse_ratio'] = round(1 - stats['connections_opened'] / stats['attempts'], 3)
+
+        return stats
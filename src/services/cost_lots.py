@@ -0,0 +1,179 @@
+from src.models import db, Order, Product, InventoryMovement, StockLot, StockLotConsumption
+from src.services.product_cache import product_cache
+from sqlalchemy import func
+from datetime import datetime, timedelta
+from typing import Optional
+
+OPENING_LOT_REFERENCE = 'رصيد افتتاحي'
+
+class FifoCostEngine:
+    """محرك تكلفة البضاعة المباعة بطريقة الوارد أولاً صادر أولاً (FIFO)
+
+    كل عملية تعبئة تنشئ دفعة شراء بسعرها، وكل خصم من المخزون يستهلك من أقدم
+    الدفعات المفتوحة (عبر فهرس جزئي على remaining_quantity > 0)، فيبقى مجموع
+    remaining_quantity مساوياً لـ current_stock. خصم الطلب يثبت التكلفة الناتجة في
+    الطلب، فلا تحتاج التقارير إلى أي حساب وقت العرض.
+    """
+
+    def _open_lots(self, product_id: int):
+        return StockLot.query.filter(
+            StockLot.product_id == product_id,
+            StockLot.remaining_quantity > 0
+        ).order_by(
+            StockLot.received_at, StockLot.lot_id
+        ).with_for_update()
+
+    def _open_quantity(self, product_id: int) -> int:
+        return int(db.session.query(
+            func.coalesce(func.sum(StockLot.remaining_quantity), 0)
+        ).filter(
+            StockLot.product_id == product_id,
+            StockLot.remaining_quantity > 0
+        ).scalar())
+
+    def seed_opening_lot(self, product: Product, on_hand: int,
+                         fallback_cost: Optional[float] = None) -> Optional[StockLot]:
+        """تحويل المخزون غير المغطى بدفعات إلى دفعة افتتاحية أقدم من كل الدفعات"""
+        missing = (on_hand or 0) - self._open_quantity(product.product_id)
+        unit_cost = product.cost_price if product.cost_price is not None else fallback_cost
+        if missing <= 0 or unit_cost is None:
+            return None
+
+        oldest = db.session.query(func.min(StockLot.received_at)).filter(
+            StockLot.product_id == product.product_id
+        ).scalar()
+        received_at = product.created_at or datetime.utcnow()
+        if oldest and oldest <= received_at:
+            received_at = oldest - timedelta(seconds=1)
+
+        lot = StockLot(
+            product_id=product.product_id,
+            quantity=missing,
+            remaining_quantity=missing,
+            unit_cost=unit_cost,
+            reference=OPENING_LOT_REFERENCE,
+            received_at=received_at
+        )
+        db.session.add(lot)
+        return lot
+
+    def receive(self, product: Product, quantity: int, unit_cost: float,
+                reference: Optional[str] = None, received_at: Optional[datetime] = None) -> StockLot:
+        """تسجيل دفعة شراء جديدة"""
+        # المخزون السابق يثبت بتكلفته قبل أن يتغير سعر الشراء
+        self.seed_opening_lot(product, product.current_stock, fallback_cost=unit_cost)
+
+        lot = StockLot(
+            product_id=product.product_id,
+            quantity=quantity,
+            remaining_quantity=quantity,
+            unit_cost=unit_cost,
+            reference=reference,
+            received_at=received_at or datetime.utcnow()
+        )
+        db.session.add(lot)
+
+        # آخر سعر شراء هو التكلفة التقديرية للطلبات الجديدة
+        if product.cost_price != unit_cost:
+            product.cost_price = unit_cost
+            product_cache.invalidate()
+
+        return lot
+
+    def on_stock_change(self, product: Product, opening_stock: int, change: int, reason: str,
+                        reference_type: Optional[str] = None, reference_id: Optional[int] = None):
+        """مزامنة الدفعات مع حركة مخزون يسجلها InventoryLedger"""
+        self.seed_opening_lot(product, opening_stock)
+
+        order = None
+        if reference_type == 'order' and reference_id is not None:
+            order = db.session.get(Order, reference_id)
+
+        if change < 0:
+            if order is not None and reason == InventoryMovement.ORDER:
+                self.consume(order)
+            else:
+                self._write_off(product.product_id, -change)
+            return
+
+        if order is not None and reason in (InventoryMovement.ORDER_CANCELLED, InventoryMovement.ORDER_RETURNED):
+            self.release(order)
+
+        # الوحدات المضافة دون دفعة (تعديل، ضبط، إلغاء طلب سابق للدفعات) بالتكلفة الحالية
+        missing = opening_stock + change - self._open_quantity(product.product_id)
+        if missing > 0 and product.cost_price is not None:
+            db.session.add(StockLot(
+                product_id=product.product_id,
+                quantity=missing,
+                remaining_quantity=missing,
+                unit_cost=product.cost_price,
+                reference=reason,
+                received_at=datetime.utcnow()
+            ))
+
+    def _write_off(self, product_id: int, quantity: int) -> int:
+        """خصم كمية من أقدم الدفعات دون طلب (تعديل أو ضبط مخزون)"""
+        remaining = quantity
+        for lot in self._open_lots(product_id).all():
+            if remaining <= 0:
+                break
+            taken = min(lot.remaining_quantity, remaining)
+            lot.remaining_quantity -= taken
+            remaining -= taken
+        return quantity - remaining
+
+    def is_consumed(self, order: Order) -> bool:
+        """هل تم احتساب تكلفة هذا الطلب من الدفعات مسبقاً"""
+        return db.session.query(
+            StockLotConsumption.query.filter_by(order_id=order.order_id).exists()
+        ).scalar()
+
+    def consume(self, order: Order) -> Optional[float]:
+        """استهلاك كمية الطلب من أقدم الدفعات وتثبيت تكلفة الوحدة في الطلب
+
+        إذا لم تكفِ الدفعات ولم تكن للطلب تكلفة مثبتة وقت إنشائه تبقى unit_cost
+        فارغة (تكلفة غير معروفة) بدلاً من احتساب الوحدات الناقصة بصفر.
+        """
+        if self.is_consumed(order):
+            return order.unit_cost
+
+        remaining = order.quantity
+        total_cost = 0.0
+
+        for lot in self._open_lots(order.product_id).all():
+            if remaining <= 0:
+                break
+
+            taken = min(lot.remaining_quantity, remaining)
+            lot.remaining_quantity -= taken
+            remaining -= taken
+            total_cost += taken * lot.unit_cost
+
+            db.session.add(StockLotConsumption(
+                lot_id=lot.lot_id,
+                order_id=order.order_id,
+                quantity=taken,
+                unit_cost=lot.unit_cost
+            ))
+
+        if remaining > 0:
+            # وحدات لا تغطيها أي دفعة: تكلفة الطلب المثبتة وقت إنشائه إن وجدت
+            if order.unit_cost is None:
+                print(f"تكلفة غير معروفة لـ {remaining} وحدة من الطلب {order.order_id}")
+                return None
+            total_cost += remaining * order.unit_cost
+
+        order.unit_cost = total_cost / order.quantity if order.quantity else 0
+        return order.unit_cost
+
+    def release(self, order: Order) -> int:
+        """إرجاع الكميات المستهلكة إلى دفعاتها عند الإلغاء أو الإرجاع"""
+        consumptions = StockLotConsumption.query.filter_by(order_id=order.order_id).all()
+
+        released = 0
+        for consumption in consumptions:
+            consumption.lot.remaining_quantity += consumption.quantity
+            released += consumption.quantity
+            db.session.delete(consumption)
+
+        return released
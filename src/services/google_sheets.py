@@ -69,6 +69,7 @@ class GoogleSheetsService:
                 'customer_name': raw_data.get('اسم العميل', raw_data.get('Customer Name', '')),
                 'customer_phone': raw_data.get('رقم الهاتف', raw_data.get('Phone', '')),
                 'customer_address': raw_data.get('العنوان', raw_data.get('Address', '')),
+                'wilaya': raw_data.get('الولاية', raw_data.get('Wilaya', '')),
                 'product_sku': raw_data.get('رمز المنتج', raw_data.get('Product SKU', '')),
                 'quantity': int(raw_data.get('الكمية', raw_data.get('Quantity', 1))),
                 'order_source': 'Google Sheet',
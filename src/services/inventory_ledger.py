@@ -0,0 +1,203 @@
+from src.models import db, Product, InventoryMovement, InventorySnapshot
+from src.services.cost_lots import FifoCostEngine
+from src.services.sales_velocity import SalesVelocityTracker
+from src.services.stock_alerts import StockAlertService
+from src.services.upsert import insert_if_missing
+from sqlalchemy import func, and_, case, update
+from datetime import datetime, date
+from typing import Dict, Any, List, Optional
+
+class InventoryLedger:
+    """كل تغيير على المخزون يمر من هنا ويُسجل في دفتر الحركات
+
+    مع أول حركة لكل منتج في اليوم يُكتب رصيد الافتتاح لذلك اليوم، فحساب المخزون
+    في تاريخ معين هو رصيد آخر يوم قبله + مجموع حركات ذلك اليوم فقط.
+    """
+
+    SALES_REASONS = (
+        InventoryMovement.ORDER,
+        InventoryMovement.ORDER_CANCELLED,
+        InventoryMovement.ORDER_RETURNED
+    )
+
+    def _ensure_snapshot(self, product_id: int, day: date, opening_stock: int):
+        # أول حركة في اليوم تكتب الرصيد؛ إذا سبقتها معاملة متزامنة يبقى رصيدها
+        insert_if_missing(InventorySnapshot, {
+            'product_id': product_id,
+            'day': day,
+            'opening_stock': opening_stock
+        }, ['product_id', 'day'])
+
+    def _record(self, product: Product, opening_stock: int, change: int, reason: str, now: datetime,
+                reference_type: Optional[str], reference_id: Optional[int], note: Optional[str]) -> InventoryMovement:
+        movement = InventoryMovement(
+            product_id=product.product_id,
+            quantity_change=change,
+            balance_after=opening_stock + change,
+            reason=reason,
+            reference_type=reference_type,
+            reference_id=reference_id,
+            note=note,
+            created_at=now
+        )
+        db.session.add(movement)
+
+        # دفعات الشراء تتبع المخزون: كل خصم يستهلك من أقدمها وكل إرجاع يعيد إليها
+        FifoCostEngine().on_stock_change(product, opening_stock, change, reason, reference_type, reference_id)
+
+        StockAlertService().on_stock_change(product, opening_stock, opening_stock + change)
+
+        # صافي الوحدات المباعة يغذي سرعة البيع لتوقع النفاد
+        if reason in self.SALES_REASONS:
+            SalesVelocityTracker().record(product.product_id, -change, now)
+
+        return movement
+
+    def apply(self, product: Product, change: int, reason: str, reference_type: Optional[str] = None,
+              reference_id: Optional[int] = None, note: Optional[str] = None) -> Optional[InventoryMovement]:
+        """تطبيق تغيير على مخزون المنتج وتسجيله"""
+        if not change:
+            return None
+
+        if product.product_id is None:
+            db.session.flush()
+
+        now = datetime.utcnow()
+        opening_stock = product.current_stock or 0
+        self._ensure_snapshot(product.product_id, now.date(), opening_stock)
+
+        product.current_stock = opening_stock + change
+
+        return self._record(product, opening_stock, change, reason, now, reference_type, reference_id, note)
+
+    def reserve(self, product_id: int, quantity: int, reason: str = InventoryMovement.ORDER,
+                reference_type: Optional[str] = None, reference_id: Optional[int] = None,
+                note: Optional[str] = None) -> Optional[InventoryMovement]:
+        """خصم كمية بتحديث مشروط في قاعدة البيانات؛ يرجع None إذا لم يكفِ المخزون
+
+        الشرط current_stock >= quantity داخل جملة UPDATE نفسها يمنع بيع نفس
+        الوحدات لطلبين متزامنين دون الحاجة لقفل الصف مسبقاً.
+        """
+        reserved = db.session.execute(
+            update(Product).where(
+                Product.product_id == product_id,
+                Product.current_stock >= quantity
+            ).values(
+                current_stock=Product.current_stock - quantity
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        if not reserved:
+            return None
+
+        product = db.session.get(Product, product_id)
+        db.session.refresh(product, attribute_names=['current_stock'])
+
+        now = datetime.utcnow()
+        opening_stock = product.current_stock + quantity
+        self._ensure_snapshot(product_id, now.date(), opening_stock)
+
+        return self._record(product, opening_stock, -quantity, reason, now, reference_type, reference_id, note)
+
+    def set_stock(self, product: Product, new_stock: int, reason: str = InventoryMovement.STOCK_SET,
+                  note: Optional[str] = None) -> Optional[InventoryMovement]:
+        """ضبط المخزون على قيمة محددة وتسجيل الفرق كحركة"""
+        return self.apply(product, new_stock - (product.current_stock or 0), reason, note=note)
+
+    def stock_at(self, at: datetime, product_ids: Optional[List[int]] = None) -> Dict[int, int]:
+        """المخزون لكل منتج في لحظة معينة"""
+        latest_day = db.session.query(
+            InventorySnapshot.product_id,
+            func.max(InventorySnapshot.day).label('day')
+        ).filter(
+            InventorySnapshot.day <= at.date()
+        ).group_by(InventorySnapshot.product_id)
+
+        first_day = db.session.query(
+            InventorySnapshot.product_id,
+            func.min(InventorySnapshot.day).label('day')
+        ).filter(
+            InventorySnapshot.day > at.date()
+        ).group_by(InventorySnapshot.product_id)
+
+        products = db.session.query(Product.product_id, Product.current_stock, Product.created_at)
+
+        if product_ids:
+            latest_day = latest_day.filter(InventorySnapshot.product_id.in_(product_ids))
+            first_day = first_day.filter(InventorySnapshot.product_id.in_(product_ids))
+            products = products.filter(Product.product_id.in_(product_ids))
+
+        latest_day = latest_day.subquery()
+        first_day = first_day.subquery()
+
+        # رصيد الافتتاح لآخر يوم فيه حركة قبل التاريخ
+        openings = dict(db.session.query(
+            InventorySnapshot.product_id, InventorySnapshot.opening_stock
+        ).join(
+            latest_day,
+            and_(InventorySnapshot.product_id == latest_day.c.product_id,
+                 InventorySnapshot.day == latest_day.c.day)
+        ).all())
+
+        # حركات ذلك اليوم حتى اللحظة المطلوبة
+        day_movements = dict(db.session.query(
+            InventoryMovement.product_id,
+            func.sum(InventoryMovement.quantity_change)
+        ).join(
+            latest_day, InventoryMovement.product_id == latest_day.c.product_id
+        ).filter(
+            InventoryMovement.created_at >= latest_day.c.day,
+            InventoryMovement.created_at <= at
+        ).group_by(InventoryMovement.product_id).all())
+
+        # منتجات لم تتحرك قبل التاريخ: رصيدها هو رصيد افتتاح أول يوم بعده
+        later_openings = dict(db.session.query(
+            InventorySnapshot.product_id, InventorySnapshot.opening_stock
+        ).join(
+            first_day,
+            and_(InventorySnapshot.product_id == first_day.c.product_id,
+                 InventorySnapshot.day == first_day.c.day)
+        ).all())
+
+        stock = {}
+        for product_id, current_stock, created_at in products.all():
+            if product_id in openings:
+                stock[product_id] = openings[product_id] + int(day_movements.get(product_id) or 0)
+            elif created_at and created_at > at:
+                stock[product_id] = 0
+            elif product_id in later_openings:
+                stock[product_id] = later_openings[product_id]
+            else:
+                stock[product_id] = current_stock or 0
+
+        return stock
+
+    def movement_by_reason(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                           product_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """مجموع الحركات حسب السبب في فترة"""
+        query = db.session.query(
+            InventoryMovement.reason,
+            func.count(InventoryMovement.movement_id).label('movements'),
+            func.coalesce(func.sum(InventoryMovement.quantity_change), 0).label('net_change'),
+            func.coalesce(func.sum(case((InventoryMovement.quantity_change > 0, InventoryMovement.quantity_change), else_=0)), 0).label('added'),
+            func.coalesce(func.sum(case((InventoryMovement.quantity_change < 0, InventoryMovement.quantity_change), else_=0)), 0).label('removed')
+        )
+
+        if start:
+            query = query.filter(InventoryMovement.created_at >= start)
+        if end:
+            query = query.filter(InventoryMovement.created_at <= end)
+        if product_id:
+            query = query.filter(InventoryMovement.product_id == product_id)
+
+        rows = query.group_by(InventoryMovement.reason).order_by(InventoryMovement.reason).all()
+
+        return [
+            {
+                'reason': row.reason,
+                'movements': row.movements,
+                'net_change': int(row.net_change),
+                'added': int(row.added),
+                'removed': -int(row.removed)
+            }
+            for row in rows
+        ]
@@ -0,0 +1,445 @@
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterator, List, Optional
+
+import numpy as np
+from sqlalchemy import func, update, delete, and_
+
+from src.models import db, Order, Expense, StockLotConsumption, CarrierEvent
+from src.services.order_profit import listed_delivery_prices
+
+EPOCH = datetime(1970, 1, 1)
+
+def to_timestamp(value: datetime) -> int:
+    """ثواني منذ 1970 لتاريخ بتوقيت UTC دون منطقة زمنية"""
+    return int((value - EPOCH).total_seconds())
+
+def _fsync_path(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class OrderArchive:
+    """أرشيف عمودي للطلبات المغلقة القديمة على القرص
+
+    كل مقطع مجلد يحتوي عموداً لكل حقل رقمي بصيغة .npy (يُقرأ عبر memmap فلا يستهلك
+    ذاكرة) وملف records.ndjson.gz يحفظ الطلب كاملاً للرجوع إليه، ويصف manifest.json
+    المقاطع (عدد الصفوف، المدى الزمني، قاموس الحالات) لتجاوز غير المعنية منها. المقاطع إضافية فقط
+    (append-only)، والتقارير المالية تجمع نتائجها مع الصفوف الحية في قاعدة البيانات.
+
+    المقطع يكتب على القرص ويسجل في البيان كمقطع معلق (committed=false) قبل حذف
+    الطلبات، ثم يعلّم كمكتمل بعد تأكيد الحذف. القراءة تتجاهل المقاطع المعلقة، و
+    reconcile() يكمل أو يلغي ما تركه توقف العملية بين الخطوتين.
+    """
+
+    CLOSED_STATUSES = ['تم التسليم', 'ملغى', 'ملغي', 'مرتجع']
+
+    NUMERIC_COLUMNS = {
+        'order_id': np.int64,
+        'product_id': np.int64,
+        'order_ts': np.int64,  # ثواني منذ 1970
+        'status': np.int16,
+        'quantity': np.int32,
+        'total_amount': np.float64,
+        'cogs': np.float64,
+        'delivery_price': np.float64,
+        'order_expenses': np.float64
+    }
+
+    def __init__(self, base_dir: Optional[str] = None, reconcile_age: Optional[float] = None):
+        # لا مسار افتراضياً: الأرشيف يحذف الطلبات من قاعدة البيانات فيجب أن يكون على قرص دائم
+        self.base_dir = base_dir or os.getenv('ORDER_ARCHIVE_DIR') or None
+        self.reconcile_age = reconcile_age or float(os.getenv('ORDER_ARCHIVE_RECONCILE_AGE', 3600))
+        if self.base_dir:
+            os.makedirs(self.base_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._manifest_cache = None
+        self._manifest_mtime = None
+
+    # ------------------------------------------------------------------ البيان
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.base_dir)
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.base_dir, 'manifest.json')
+
+    def manifest(self) -> Dict[str, Any]:
+        """قراءة البيان مع تخزينه مؤقتاً حتى يتغير الملف"""
+        if not self.configured:
+            return {'segments': []}
+        try:
+            mtime = os.path.getmtime(self.manifest_path)
+        except FileNotFoundError:
+            return {'segments': []}
+
+        if self._manifest_cache is None or mtime != self._manifest_mtime:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                self._manifest_cache = json.load(f)
+            self._manifest_mtime = mtime
+
+        return self._manifest_cache
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.manifest_path)
+        _fsync_path(self.base_dir)
+        self._manifest_cache = manifest
+        self._manifest_mtime = os.path.getmtime(self.manifest_path)
+
+    def _set_segment(self, name: str, segment: Optional[Dict[str, Any]]):
+        """إضافة مقطع إلى البيان أو تحديثه أو حذفه (segment=None)"""
+        manifest = dict(self.manifest())
+        segments = [existing for existing in manifest['segments'] if existing['name'] != name]
+        if segment is not None:
+            segments.append(segment)
+        manifest['segments'] = segments
+        self._write_manifest(manifest)
+
+    def committed_segments(self) -> List[Dict[str, Any]]:
+        return [segment for segment in self.manifest()['segments'] if segment.get('committed', True)]
+
+    def _segments_in_range(self, start: Optional[datetime], end: Optional[datetime]) -> List[Dict[str, Any]]:
+        start_ts = to_timestamp(start) if start else None
+        end_ts = to_timestamp(end) if end else None
+
+        segments = []
+        for segment in self.committed_segments():
+            if start_ts is not None and segment['max_ts'] < start_ts:
+                continue
+            if end_ts is not None and segment['min_ts'] > end_ts:
+                continue
+            segments.append(segment)
+        return segments
+
+    def overlaps(self, start: Optional[datetime], end: Optional[datetime]) -> bool:
+        """هل يحتوي الأرشيف على بيانات في هذه الفترة"""
+        return bool(self._segments_in_range(start, end))
+
+    def _open_columns(self, segment: Dict[str, Any]) -> Dict[str, np.ndarray]:
+        segment_dir = os.path.join(self.base_dir, segment['name'])
+        return {
+            name: np.load(os.path.join(segment_dir, f'{name}.npy'), mmap_mode='r')
+            for name in self.NUMERIC_COLUMNS
+        }
+
+    # ------------------------------------------------------------------ الأرشفة
+
+    def archive_closed_orders(self, older_than_months: int, limit: Optional[int] = None) -> Dict[str, Any]:
+        """نقل الطلبات المغلقة الأقدم من عدد الأشهر المحدد إلى مقطع جديد"""
+        if not self.configured:
+            raise ValueError('ORDER_ARCHIVE_DIR غير محدد؛ حدد مجلداً دائماً للأرشيف قبل الأرشفة')
+
+        cutoff = datetime.utcnow() - timedelta(days=older_than_months * 30)
+
+        with self._lock:
+            order_expenses = db.session.query(
+                Expense.order_id.label('order_id'),
+                func.sum(Expense.amount).label('amount')
+            ).filter(
+                Expense.order_id.isnot(None)
+            ).group_by(Expense.order_id).subquery()
+
+            # تكلفة التوصيل كما في تقرير ربحية المنتجات الحي
+            listed_prices = listed_delivery_prices()
+
+            query = db.session.query(
+                Order,
+                func.coalesce(order_expenses.c.amount, 0),
+                func.coalesce(Order.delivery_price, listed_prices.c.price_per_unit * Order.quantity, 0)
+            ).outerjoin(
+                order_expenses, order_expenses.c.order_id == Order.order_id
+            ).outerjoin(
+                listed_prices, and_(
+                    listed_prices.c.product_id == Order.product_id,
+                    listed_prices.c.delivery_company_id == Order.delivery_company_id
+                )
+            ).filter(
+                Order.order_date < cutoff,
+                Order.order_status.in_(self.CLOSED_STATUSES)
+            ).order_by(Order.order_id)
+
+            if limit:
+                query = query.limit(limit)
+
+            rows = query.all()
+            if not rows:
+                return {'archived_orders': 0, 'segment': None, 'cutoff': cutoff.isoformat()}
+
+            # المقطع والبيان على القرص قبل حذف أي طلب
+            segment = self._write_segment(rows)
+            order_ids = [order.order_id for order, _, _ in rows]
+            try:
+                self._set_segment(segment['name'], {**segment, 'committed': False})
+            except Exception:
+                shutil.rmtree(os.path.join(self.base_dir, segment['name']), ignore_errors=True)
+                raise
+
+            try:
+                self._delete_orders(order_ids)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self._set_segment(segment['name'], None)
+                shutil.rmtree(os.path.join(self.base_dir, segment['name']), ignore_errors=True)
+                raise
+
+            segment['committed'] = True
+            self._set_segment(segment['name'], segment)
+
+            return {
+                'archived_orders': len(order_ids),
+                'segment': segment,
+                'cutoff': cutoff.isoformat()
+            }
+
+    def _delete_orders(self, order_ids: List[int]):
+        """حذف الطلبات المؤرشفة وفك ارتباط الجداول التابعة في المعاملة الحالية"""
+        for i in range(0, len(order_ids), 500):
+            chunk = order_ids[i:i + 500]
+            # المصاريف تبقى في جدولها (للتقارير حسب تاريخ المصروف) مع فك ارتباطها بالطلب
+            db.session.execute(
+                update(Expense).where(Expense.order_id.in_(chunk)).values(order_id=None)
+                .execution_options(synchronize_session=False)
+            )
+            # أحداث التتبع تبقى لمنع تكرار تطبيقها، دون الإشارة إلى الطلب المحذوف
+            db.session.execute(
+                update(CarrierEvent).where(CarrierEvent.order_id.in_(chunk)).values(order_id=None)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.execute(
+                delete(StockLotConsumption).where(StockLotConsumption.order_id.in_(chunk))
+                .execution_options(synchronize_session=False)
+            )
+            db.session.execute(
+                delete(Order).where(Order.order_id.in_(chunk))
+                .execution_options(synchronize_session=False)
+            )
+
+    def reconcile(self) -> Dict[str, int]:
+        """معالجة ما تركته أرشفة توقفت قبل اكتمالها
+
+        مقطع معلق لم يحذف أي من طلباته يلغى (الطلبات ما زالت حية)، وإلا يكمل حذف
+        الباقي ويعلّم كمكتمل. مجلدات المقاطع غير المسجلة في البيان تحذف. لا يلمس
+        إلا ما هو أقدم من ORDER_ARCHIVE_RECONCILE_AGE حتى لا يتدخل في أرشفة جارية.
+        """
+        result = {'rolled_back': 0, 'completed': 0, 'orphans_removed': 0}
+        if not self.configured:
+            return result
+
+        cutoff_ts = time.time() - self.reconcile_age
+        cutoff = datetime.utcfromtimestamp(cutoff_ts).isoformat()
+
+        with self._lock:
+            for segment in list(self.manifest()['segments']):
+                if segment.get('committed', True) or segment['created_at'] > cutoff:
+                    continue
+
+                columns = self._open_columns(segment)
+                order_ids = [int(order_id) for order_id in columns['order_id']]
+                live_ids = []
+                for i in range(0, len(order_ids), 500):
+                    live_ids.extend(
+                        order_id for (order_id,) in db.session.query(Order.order_id).filter(
+                            Order.order_id.in_(order_ids[i:i + 500])
+                        )
+                    )
+
+                if len(live_ids) == len(order_ids):
+                    self._set_segment(segment['name'], None)
+                    shutil.rmtree(os.path.join(self.base_dir, segment['name']), ignore_errors=True)
+                    result['rolled_back'] += 1
+                    continue
+
+                if live_ids:
+                    self._delete_orders(live_ids)
+                    db.session.commit()
+                self._set_segment(segment['name'], {**segment, 'committed': True})
+                result['completed'] += 1
+
+            known = {segment['name'] for segment in self.manifest()['segments']}
+            for name in os.listdir(self.base_dir):
+                path = os.path.join(self.base_dir, name)
+                if name in known or not os.path.isdir(path) or os.path.getmtime(path) > cutoff_ts:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                result['orphans_removed'] += 1
+
+        return result
+
+    def _write_segment(self, rows) -> Dict[str, Any]:
+        """كتابة مقطع جديد (أعمدة .npy + السجلات الكاملة)"""
+        name = datetime.utcnow().strftime('%Y%m%d%H%M%S') + '-' + uuid.uuid4().hex[:8]
+        segment_dir = os.path.join(self.base_dir, name)
+        os.makedirs(segment_dir)
+
+        statuses: List[str] = []
+        status_codes: Dict[str, int] = {}
+
+        columns = {name: [] for name in self.NUMERIC_COLUMNS}
+        with gzip.open(os.path.join(segment_dir, 'records.ndjson.gz'), 'wt', encoding='utf-8') as records:
+            for order, expenses_amount, delivery_cost in rows:
+                if order.order_status not in status_codes:
+                    status_codes[order.order_status] = len(statuses)
+                    statuses.append(order.order_status)
+
+                order_ts = to_timestamp(order.order_date) if order.order_date else 0
+                columns['order_id'].append(order.order_id)
+                columns['product_id'].append(order.product_id)
+                columns['order_ts'].append(order_ts)
+                columns['status'].append(status_codes[order.order_status])
+                columns['quantity'].append(order.quantity or 0)
+                columns['total_amount'].append(order.total_amount or 0)
+                columns['cogs'].append((order.unit_cost or 0) * (order.quantity or 0))
+                columns['delivery_price'].append(float(delivery_cost or 0))
+                columns['order_expenses'].append(float(expenses_amount or 0))
+
+                record = order.to_dict()
+                record['order_expenses'] = float(expenses_amount or 0)
+                record['delivery_cost'] = float(delivery_cost or 0)
+                records.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+        for column_name, dtype in self.NUMERIC_COLUMNS.items():
+            np.save(os.path.join(segment_dir, f'{column_name}.npy'), np.array(columns[column_name], dtype=dtype))
+
+        for file_name in os.listdir(segment_dir):
+            _fsync_path(os.path.join(segment_dir, file_name))
+        _fsync_path(segment_dir)
+
+        return {
+            'name': name,
+            'rows': len(rows),
+            'min_ts': int(min(columns['order_ts'])),
+            'max_ts': int(max(columns['order_ts'])),
+            'min_order_id': int(min(columns['order_id'])),
+            'max_order_id': int(max(columns['order_id'])),
+            'statuses': statuses,
+            'created_at': datetime.utcnow().isoformat()
+        }
+
+    # ------------------------------------------------------------------ القراءة
+
+    def _segment_mask(self, segment, columns, start, end, statuses):
+        mask = np.ones(segment['rows'], dtype=bool)
+        if start:
+            mask &= columns['order_ts'] >= to_timestamp(start)
+        if end:
+            mask &= columns['order_ts'] <= to_timestamp(end)
+        if statuses is not None:
+            codes = [i for i, status in enumerate(segment['statuses']) if status in statuses]
+            mask &= np.isin(columns['status'], codes)
+        return mask
+
+    def sales_totals(self, start: Optional[datetime], end: Optional[datetime],
+                     statuses: Optional[List[str]] = None) -> Dict[str, float]:
+        """إجماليات المبيعات المؤرشفة في فترة"""
+        totals = {'orders': 0, 'quantity': 0, 'revenue': 0.0, 'cogs': 0.0}
+
+        for segment in self._segments_in_range(start, end):
+            columns = self._open_columns(segment)
+            mask = self._segment_mask(segment, columns, start, end, statuses)
+
+            totals['orders'] += int(mask.sum())
+            totals['quantity'] += int(columns['quantity'][mask].sum())
+            totals['revenue'] += float(columns['total_amount'][mask].sum())
+            totals['cogs'] += float(columns['cogs'][mask].sum())
+
+        return totals
+
+    def count_by_status(self, start: Optional[datetime], end: Optional[datetime]) -> Dict[str, int]:
+        """عدد الطلبات المؤرشفة حسب الحالة"""
+        counts: Dict[str, int] = {}
+
+        for segment in self._segments_in_range(start, end):
+            columns = self._open_columns(segment)
+            mask = self._segment_mask(segment, columns, start, end, None)
+            per_code = np.bincount(columns['status'][mask], minlength=len(segment['statuses']))
+            for code, status in enumerate(segment['statuses']):
+                counts[status] = counts.get(status, 0) + int(per_code[code])
+
+        return counts
+
+    def sales_by_product(self, start: Optional[datetime], end: Optional[datetime],
+                         statuses: Optional[List[str]] = None) -> Dict[int, Dict[str, float]]:
+        """المبيعات المؤرشفة مجمعة حسب المنتج"""
+        metrics = ['quantity', 'total_amount', 'cogs', 'delivery_price', 'order_expenses']
+        result: Dict[int, Dict[str, float]] = {}
+
+        for segment in self._segments_in_range(start, end):
+            columns = self._open_columns(segment)
+            mask = self._segment_mask(segment, columns, start, end, statuses)
+            if not mask.any():
+                continue
+
+            product_ids, inverse = np.unique(columns['product_id'][mask], return_inverse=True)
+            counts = np.bincount(inverse, minlength=len(product_ids))
+            sums = {
+                metric: np.bincount(inverse, weights=columns[metric][mask].astype(np.float64),
+                                    minlength=len(product_ids))
+                for metric in metrics
+            }
+
+            for i, product_id in enumerate(product_ids.tolist()):
+                entry = result.setdefault(product_id, {'orders': 0, **{m: 0.0 for m in metrics}})
+                entry['orders'] += int(counts[i])
+                for metric in metrics:
+                    entry[metric] += float(sums[metric][i])
+
+        return result
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        """السجلات الكاملة لكل الطلبات المؤرشفة، مقطعاً مقطعاً"""
+        for segment in self.committed_segments():
+            path = os.path.join(self.base_dir, segment['name'], 'records.ndjson.gz')
+            with gzip.open(path, 'rt', encoding='utf-8') as records:
+                for line in records:
+                    yield json.loads(line)
+
+    def find_order(self, order_id: int) -> Optional[Dict[str, Any]]:
+        """جلب سجل طلب مؤرشف"""
+        for segment in self.committed_segments():
+            if not segment['min_order_id'] <= order_id <= segment['max_order_id']:
+                continue
+            path = os.path.join(self.base_dir, segment['name'], 'records.ndjson.gz')
+            with gzip.open(path, 'rt', encoding='utf-8') as records:
+                for line in records:
+                    record = json.loads(line)
+                    if record['order_id'] == order_id:
+                        return record
+        return None
+
+    def status(self) -> Dict[str, Any]:
+        """ملخص حالة الأرشيف"""
+        segments = self.committed_segments()
+        return {
+            'base_dir': self.base_dir,
+            'configured': self.configured,
+            'segments': len(segments),
+            'archived_orders': sum(segment['rows'] for segment in segments),
+            'oldest_order': datetime.utcfromtimestamp(min(s['min_ts'] for s in segments)).isoformat() if segments else None,
+            'newest_order': datetime.utcfromtimestamp(max(s['max_ts'] for s in segments)).isoformat() if segments else None
+        }
+
+_order_archive = None
+
+def get_order_archive() -> OrderArchive:
+    """الأرشيف المشترك لهذه العملية"""
+    global _order_archive
+    if _order_archive is None:
+        _order_archive = OrderArchive()
+    return _order_archive
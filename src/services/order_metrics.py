@@ -0,0 +1,224 @@
+from src.models import db, Order, OrderMetricSketch
+from src.services.sketches import KLLSketch, HyperLogLog, sketch_from_json, sketch_to_json
+from src.services.upsert import insert_if_missing
+from datetime import datetime, date, timedelta
+from typing import Dict, Any, List, Optional
+
+# سجلات HLL مقروءة من قاعدة البيانات لكل يوم في هذه العملية. السجلات لا تنقص أبداً،
+# فإذا لم تتجاوز رتبة العميل السجل المعروف هنا فلن تغير إضافته شيئاً في قاعدة البيانات
+_customer_registers: Dict[date, bytearray] = {}
+
+class OrderMetricsRecorder:
+    """تحديث الملخصات اليومية لمقاييس الطلبات عند كتابة الطلبات
+
+    كل يوم له ملخص مستقل لكل مقياس، والملخصات قابلة للدمج فيمكن حساب المئينات
+    وعدد العملاء المميزين لأي فترة بدمج ملخصات أيامها فقط دون قراءة الطلبات.
+    قيمة الطلب تسجل عند التسليم (في يوم إنشاء الطلب) حتى لا تبقى الطلبات
+    الملغاة في التوزيع، فالملخص لا يدعم الحذف.
+    """
+
+    QUANTILE_METRICS = ['order_value', 'time_to_confirm', 'time_to_deliver']
+    CUSTOMERS_METRIC = 'customers'
+
+    def __init__(self):
+        # استيراد محلي لأن OrderProcessor نفسه يسجل الطلبات عبر هذه الفئة
+        from src.services.order_processor import OrderProcessor
+        self._phone_normalizer = OrderProcessor()
+
+    @staticmethod
+    def _new_sketch(metric: str):
+        return HyperLogLog() if metric == OrderMetricsRecorder.CUSTOMERS_METRIC else KLLSketch()
+
+    def _locked_row(self, metric: str, day: date) -> OrderMetricSketch:
+        """صف ملخص اليوم مقفلاً للتعديل، ينشأ إذا لم يكن موجوداً"""
+        query = OrderMetricSketch.query.filter_by(metric=metric, day=day).with_for_update().populate_existing()
+        row = query.first()
+        if row is None:
+            insert_if_missing(OrderMetricSketch, {
+                'metric': metric,
+                'day': day,
+                'payload': sketch_to_json(self._new_sketch(metric)),
+                'observations': 0
+            }, ['metric', 'day'])
+            row = query.one()
+        return row
+
+    def _update(self, metric: str, day: date, value):
+        row = self._locked_row(metric, day)
+        sketch = sketch_from_json(row.payload)
+        sketch.add(value)
+        row.payload = sketch_to_json(sketch)
+        row.observations = (row.observations or 0) + 1
+
+    def _add_customer(self, day: date, phone: str):
+        """إضافة عميل لعداد اليوم؛ لا يعاد كتابة العداد (~5KB) إلا إذا تغير أحد سجلاته"""
+        known = _customer_registers.get(day)
+        if known is not None:
+            index, rank = HyperLogLog().position(phone)
+            if rank <= known[index]:
+                return
+
+        row = self._locked_row(self.CUSTOMERS_METRIC, day)
+        sketch = sketch_from_json(row.payload)
+
+        # تحفظ السجلات كما قرئت قبل الإضافة حتى لا تسبق الذاكرة معاملة قد تلغى
+        if day not in _customer_registers and len(_customer_registers) >= 3:
+            del _customer_registers[min(_customer_registers)]
+        _customer_registers[day] = bytearray(sketch.registers)
+
+        if sketch.add(phone):
+            row.payload = sketch_to_json(sketch)
+            row.observations = (row.observations or 0) + 1
+
+    @staticmethod
+    def _hours_between(start: Optional[datetime], end: Optional[datetime]) -> Optional[float]:
+        if not start or not end:
+            return None
+        return (end - start).total_seconds() / 3600.0
+
+    def record_created(self, order: Order):
+        """تسجيل العميل عند إنشاء الطلب"""
+        day = (order.order_date or datetime.utcnow()).date()
+
+        phone = self._phone_normalizer.normalize_phone_number(order.customer_phone or '')
+        if phone:
+            self._add_customer(day, phone)
+
+    def record_confirmed(self, order: Order):
+        """تسجيل زمن التأكيد بالساعات"""
+        hours = self._hours_between(order.order_date, order.confirmed_date)
+        if hours is not None:
+            self._update('time_to_confirm', order.confirmed_date.date(), hours)
+
+    def record_delivered(self, order: Order):
+        """تسجيل قيمة الطلب وزمن التسليم بالساعات منذ إنشاء الطلب"""
+        if order.order_date and order.total_amount is not None:
+            self._update('order_value', order.order_date.date(), order.total_amount)
+
+        hours = self._hours_between(order.order_date, order.delivered_date)
+        if hours is not None:
+            self._update('time_to_deliver', order.delivered_date.date(), hours)
+
+    # ------------------------------------------------------------------ القراءة
+
+    @staticmethod
+    def _rows(metric: str, start: date, end: date):
+        return OrderMetricSketch.query.filter(
+            OrderMetricSketch.metric == metric,
+            OrderMetricSketch.day >= start,
+            OrderMetricSketch.day <= end
+        ).order_by(OrderMetricSketch.day).all()
+
+    def distribution(self, metric: str, start: date, end: date, fractions: List[float]) -> Dict[str, Any]:
+        """المئينات المدمجة لمقياس في فترة"""
+        if metric not in self.QUANTILE_METRICS:
+            raise ValueError(f'المقياس يجب أن يكون أحد القيم التالية: {", ".join(self.QUANTILE_METRICS)}')
+
+        merged = KLLSketch()
+        for row in self._rows(metric, start, end):
+            merged.merge(sketch_from_json(row.payload))
+
+        values = merged.quantiles(fractions)
+        return {
+            'metric': metric,
+            'count': merged.n,
+            'min': merged.min_value,
+            'max': merged.max_value,
+            'quantiles': {f'p{round(f * 100, 2):g}': value for f, value in zip(fractions, values)}
+        }
+
+    def unique_customers(self, start: date, end: date, granularity: str = 'total') -> Dict[str, Any]:
+        """تقدير عدد العملاء المميزين للفترة أو لكل يوم/أسبوع/شهر"""
+        if granularity not in ['total', 'day', 'week', 'month']:
+            raise ValueError('granularity يجب أن يكون total أو day أو week أو month')
+
+        total = HyperLogLog()
+        buckets: Dict[str, HyperLogLog] = {}
+
+        for row in self._rows(self.CUSTOMERS_METRIC, start, end):
+            sketch = sketch_from_json(row.payload)
+            total.merge(sketch)
+
+            if granularity == 'day':
+                key = row.day.isoformat()
+            elif granularity == 'week':
+                key = (row.day - timedelta(days=row.day.weekday())).isoformat()
+            elif granularity == 'month':
+                key = row.day.strftime('%Y-%m')
+            else:
+                continue
+
+            if key not in buckets:
+                buckets[key] = HyperLogLog()
+            buckets[key].merge(sketch)
+
+        result = {'unique_customers': total.count()}
+        if granularity != 'total':
+            result['periods'] = [
+                {'period': key, 'unique_customers': buckets[key].count()}
+                for key in sorted(buckets)
+            ]
+        return result
+
+    def rebuild(self, archive=None) -> int:
+        """إعادة بناء الملخصات من سجل الطلبات الحية والمؤرشفة (مرة واحدة عند التفعيل)
+
+        الطلبات المؤرشفة حُذفت من قاعدة البيانات لكن ملخصات أيامها بنيت منها،
+        فتُقرأ سجلاتها الكاملة من الأرشيف حتى لا تنقص سجلات HLL بعد إعادة البناء.
+        """
+        if archive is None:
+            from src.services.order_archive import get_order_archive
+            archive = get_order_archive()
+
+        OrderMetricSketch.query.delete(synchronize_session=False)
+        _customer_registers.clear()
+
+        sketches: Dict[tuple, Any] = {}
+        counts: Dict[tuple, int] = {}
+
+        def add(metric, day, value):
+            key = (metric, day)
+            if key not in sketches:
+                sketches[key] = self._new_sketch(metric)
+                counts[key] = 0
+            sketches[key].add(value)
+            counts[key] += 1
+
+        def observe(order_date, confirmed_date, delivered_date, total_amount, customer_phone):
+            day = order_date.date() if order_date else None
+            if day and total_amount is not None and delivered_date:
+                add('order_value', day, total_amount)
+            phone = self._phone_normalizer.normalize_phone_number(customer_phone or '')
+            if day and phone:
+                add(self.CUSTOMERS_METRIC, day, phone)
+            hours = self._hours_between(order_date, confirmed_date)
+            if hours is not None:
+                add('time_to_confirm', confirmed_date.date(), hours)
+            hours = self._hours_between(order_date, delivered_date)
+            if hours is not None:
+                add('time_to_deliver', delivered_date.date(), hours)
+
+        processed = 0
+        for order in Order.query.yield_per(2000):
+            processed += 1
+            observe(order.order_date, order.confirmed_date, order.delivered_date,
+                    order.total_amount, order.customer_phone)
+
+        def parse(value):
+            return datetime.fromisoformat(value) if value else None
+
+        for record in archive.iter_records():
+            processed += 1
+            observe(parse(record.get('order_date')), parse(record.get('confirmed_date')),
+                    parse(record.get('delivered_date')), record.get('total_amount'), record.get('customer_phone'))
+
+        for (metric, day), sketch in sketches.items():
+            db.session.add(OrderMetricSketch(
+                metric=metric,
+                day=day,
+                payload=sketch_to_json(sketch),
+                observations=counts[(metric, day)]
+            ))
+
+        db.session.commit()
+        return processed
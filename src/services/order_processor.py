@@ -1,4 +1,7 @@
-from src.models import db, Order, Product
+from src.models import db, Order, Product, InventoryMovement
+from src.services.order_metrics import OrderMetricsRecorder
+from src.services.inventory_ledger import InventoryLedger
+from src.services.product_cache import product_cache
 from typing import Dict, Any
 import re
 
@@ -27,8 +30,8 @@ class OrderProcessor:
                     'message': validation_message
                 }
             
-            # البحث عن المنتج
-            product = Product.query.filter_by(sku=order_data['product_sku']).first()
+            # البحث عن المنتج في ذاكرة الكتالوج
+            product = product_cache.get(order_data['product_sku'])
             
             if not product:
                 return {
@@ -36,11 +39,10 @@ class OrderProcessor:
                     'message': f'المنتج برمز {order_data["product_sku"]} غير موجود'
                 }
             
-            # التحقق من توفر المخزون
-            if product.current_stock < order_data['quantity']:
+            if not product.is_active:
                 return {
                     'success': False,
-                    'message': f'المخزون غير كافي. المتوفر: {product.current_stock}, المطلوب: {order_data["quantity"]}'
+                    'message': f'المنتج برمز {order_data["product_sku"]} غير متاح للطلب'
                 }
             
             # إنشاء الطلب
@@ -48,16 +50,29 @@ class OrderProcessor:
                 customer_name=order_data['customer_name'],
                 customer_phone=order_data['customer_phone'],
                 customer_address=order_data['customer_address'],
+                wilaya=order_data.get('wilaya') or None,
                 product_id=product.product_id,
                 quantity=order_data['quantity'],
                 order_source=order_data['order_source'],
                 notes=order_data.get('notes', '')
             )
-            
-            # تقليل المخزون
-            product.current_stock -= order_data['quantity']
+            order.apply_product_snapshot(product)
             
             db.session.add(order)
+            db.session.flush()
+            
+            # حجز المخزون بتحديث مشروط
+            reserved = InventoryLedger().reserve(product.product_id, order_data['quantity'],
+                                                 InventoryMovement.ORDER, 'order', order.order_id)
+            if not reserved:
+                db.session.rollback()
+                available = db.session.query(Product.current_stock).filter_by(product_id=product.product_id).scalar()
+                return {
+                    'success': False,
+                    'message': f'المخزون غير كافي. المتوفر: {available}, المطلوب: {order_data["quantity"]}'
+                }
+            
+            OrderMetricsRecorder().record_created(order)
             db.session.commit()
             
             return {
@@ -101,6 +116,7 @@ class OrderProcessor:
                 'customer_name': data.get('customer_name', data.get('name', '')),
                 'customer_phone': data.get('customer_phone', data.get('phone', '')),
                 'customer_address': data.get('customer_address', data.get('address', '')),
+                'wilaya': data.get('wilaya', data.get('state', '')),
                 'product_sku': data.get('product_sku', data.get('sku', '')),
                 'quantity': int(data.get('quantity', 1)),
                 'order_source': 'Webhook',
@@ -120,6 +136,7 @@ class OrderProcessor:
                 'customer_name': data.get('اسم العميل', data.get('Customer Name', '')),
                 'customer_phone': data.get('رقم الهاتف', data.get('Phone', '')),
                 'customer_address': data.get('العنوان', data.get('Address', '')),
+                'wilaya': data.get('الولاية', data.get('Wilaya', '')),
                 'product_sku': data.get('رمز المنتج', data.get('Product SKU', '')),
                 'quantity': int(data.get('الكمية', data.get('Quantity', 1))),
                 'order_source': 'Google Sheet',
@@ -0,0 +1,81 @@
+from src.models import db, Order, Product, Expense, DeliveryPriceList
+from datetime import datetime
+from sqlalchemy import func
+from typing import Dict, Any, Iterator, List, Optional
+
+def listed_delivery_prices():
+    """أقل سعر توصيل نشط لكل (منتج، شركة) للطلبات التي لم يسجل لها سعر توصيل"""
+    return db.session.query(
+        DeliveryPriceList.product_id.label('product_id'),
+        DeliveryPriceList.delivery_company_id.label('delivery_company_id'),
+        func.min(DeliveryPriceList.price_per_unit).label('price_per_unit')
+    ).filter(
+        DeliveryPriceList.is_active.is_(True)
+    ).group_by(
+        DeliveryPriceList.product_id,
+        DeliveryPriceList.delivery_company_id
+    ).subquery()
+
+def iter_order_profits(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                       statuses: Optional[List[str]] = None,
+                       batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+    """حساب ربح مجموعة من الطلبات دفعة واحدة
+
+    الربح = الإيرادات - مصاريف الطلب - تكلفة التوصيل لكل طلب في الفلتر مهما كانت
+    حالته، بخلاف Order.calculate_profit الذي يرجع 0 لغير الطلبات المسلمة؛ لمطابقته
+    تمرر statuses=['تم التسليم']. يحسب باستعلام واحد يربط المنتجات ومصاريف الطلبات
+    المجمعة مسبقاً، وتقرأ النتائج على دفعات حتى يمكن بثها دون تحميل كل الطلبات في الذاكرة.
+    """
+    order_expenses = db.session.query(
+        Expense.order_id.label('order_id'),
+        func.sum(Expense.amount).label('amount')
+    ).filter(
+        Expense.order_id.isnot(None)
+    ).group_by(Expense.order_id).subquery()
+
+    revenue = func.coalesce(Order.total_amount, Product.price * Order.quantity, 0)
+    expenses = func.coalesce(order_expenses.c.amount, 0)
+    delivery_cost = func.coalesce(Order.delivery_price, 0)
+    cogs = func.coalesce(Order.unit_cost * Order.quantity, 0)
+
+    query = db.session.query(
+        Order.order_id,
+        Order.product_id,
+        Order.quantity,
+        Order.order_status,
+        Order.order_date,
+        revenue.label('revenue'),
+        expenses.label('expenses'),
+        delivery_cost.label('delivery_cost'),
+        cogs.label('cogs')
+    ).outerjoin(
+        Product, Product.product_id == Order.product_id
+    ).outerjoin(
+        order_expenses, order_expenses.c.order_id == Order.order_id
+    )
+
+    if start:
+        query = query.filter(Order.order_date >= start)
+    if end:
+        query = query.filter(Order.order_date <= end)
+    if statuses:
+        query = query.filter(Order.order_status.in_(statuses))
+
+    query = query.order_by(Order.order_id).yield_per(batch_size)
+
+    for row in query:
+        profit = float(row.revenue) - float(row.expenses) - float(row.delivery_cost)
+
+        yield {
+            'order_id': row.order_id,
+            'product_id': row.product_id,
+            'quantity': row.quantity,
+            'order_status': row.order_status,
+            'order_date': row.order_date.isoformat() if row.order_date else None,
+            'revenue': float(row.revenue),
+            'expenses': float(row.expenses),
+            'delivery_cost': float(row.delivery_cost),
+            'cogs': float(row.cogs),
+            'profit': profit,
+            'net_profit': profit - float(row.cogs)
+        }
@@ -0,0 +1,47 @@
+from src.models import db, Order, Product
+from sqlalchemy import select, update
+from typing import Dict
+
+
+def backfill_order_snapshots() -> Dict[str, int]:
+    """تعبئة لقطات السعر والتكلفة للطلبات القديمة
+
+    تعمل بثلاث جمل UPDATE على مستوى قاعدة البيانات بدلاً من المرور على كل طلب،
+    ولا تلمس إلا الصفوف التي ما زالت قيمها فارغة.
+    """
+    product_price = select(Product.price).where(
+        Product.product_id == Order.product_id
+    ).scalar_subquery()
+
+    product_cost = select(Product.cost_price).where(
+        Product.product_id == Order.product_id
+    ).scalar_subquery()
+
+    unit_price_result = db.session.execute(
+        update(Order)
+        .where(Order.unit_price.is_(None), product_price.isnot(None))
+        .values(unit_price=product_price)
+        .execution_options(synchronize_session=False)
+    )
+
+    total_amount_result = db.session.execute(
+        update(Order)
+        .where(Order.total_amount.is_(None), Order.unit_price.isnot(None))
+        .values(total_amount=Order.unit_price * Order.quantity)
+        .execution_options(synchronize_session=False)
+    )
+
+    unit_cost_result = db.session.execute(
+        update(Order)
+        .where(Order.unit_cost.is_(None), product_cost.isnot(None))
+        .values(unit_cost=product_cost)
+        .execution_options(synchronize_session=False)
+    )
+
+    db.session.commit()
+
+    return {
+        'unit_price_filled': unit_price_result.rowcount,
+        'total_amount_filled': total_amount_result.rowcount,
+        'unit_cost_filled': unit_cost_result.rowcount
+    }
@@ -0,0 +1,75 @@
+from src.models import db, Order, Product, InventoryMovement
+from src.services.cost_lots import FifoCostEngine
+from src.services.order_metrics import OrderMetricsRecorder
+from src.services.inventory_ledger import InventoryLedger
+from datetime import datetime
+from typing import Optional
+
+# الحالات التي أعيد فيها مخزون الطلب ('ملغي' كتبتها نسخ سابقة من تتبع الشحنات)
+STOCK_RELEASED_STATUSES = ['ملغى', 'ملغي', 'مرتجع']
+
+def _restore_stock(order: Order, old_status: str, reason: str):
+    # الدفتر يعيد الوحدات إلى دفعاتها (FIFO) مع المخزون
+    if old_status in STOCK_RELEASED_STATUSES:
+        return
+    product = db.session.get(Product, order.product_id)
+    if product:
+        InventoryLedger().apply(product, order.quantity, reason, 'order', order.order_id)
+
+def _reserve_stock(order: Order):
+    # طلب أعيد مخزونه ثم أعيد تفعيله يحجز كميته من جديد (ويستهلك من الدفعات)
+    if not InventoryLedger().reserve(order.product_id, order.quantity, InventoryMovement.ORDER,
+                                     'order', order.order_id):
+        raise ValueError(f'المخزون غير كافٍ لإعادة تفعيل الطلب {order.order_id}')
+
+def change_order_status(order: Order, new_status: str, now: Optional[datetime] = None) -> bool:
+    """انتقال الطلب إلى حالة جديدة مع تواريخها والمخزون والتكلفة والملخصات
+
+    المسار الوحيد لتغيير حالة الطلب: التحديث اليدوي وتتبع الشحنات يمران من هنا.
+    الطلب يحجز مخزونه ما دام خارج حالات الإلغاء والإرجاع؛ إعادة تفعيله بعدها
+    تحجز الكمية من جديد وترفع ValueError إذا لم يكفِ المخزون. يرجع True إذا
+    تغيرت الحالة.
+    """
+    old_status = order.order_status
+    if new_status == old_status:
+        return False
+
+    if old_status in STOCK_RELEASED_STATUSES and new_status not in STOCK_RELEASED_STATUSES:
+        _reserve_stock(order)
+
+    now = now or datetime.utcnow()
+    order.order_status = new_status
+
+    if new_status == 'اتصال أول' and not order.first_call_date:
+        order.first_call_date = now
+    elif new_status == 'اتصال ثانٍ' and not order.second_call_date:
+        order.second_call_date = now
+    elif new_status == 'مؤكد' and not order.confirmed_date:
+        order.confirmed_date = now
+    elif new_status == 'تم الشحن' and not order.shipped_date:
+        order.shipped_date = now
+    elif new_status == 'تم التسليم' and not order.delivered_date:
+        order.delivered_date = now
+    elif new_status == 'ملغى' and not order.cancelled_date:
+        order.cancelled_date = now
+    elif new_status == 'مرتجع' and not order.returned_date:
+        order.returned_date = now
+
+    # إرجاع المخزون عند كل انتقال من حجز إلى إلغاء أو إرجاع
+    if new_status == 'ملغى':
+        _restore_stock(order, old_status, InventoryMovement.ORDER_CANCELLED)
+    elif new_status == 'مرتجع':
+        _restore_stock(order, old_status, InventoryMovement.ORDER_RETURNED)
+
+    # الطلبات التي حُجز مخزونها قبل دفتر الدفعات تُحتسب تكلفتها عند تأكيد البيع
+    # (بعد إعادة الحجز يكون الطلب مستهلكاً مسبقاً فلا يتكرر الاستهلاك)
+    if new_status in Order.SOLD_STATUSES and old_status not in Order.SOLD_STATUSES:
+        FifoCostEngine().consume(order)
+
+    # تحديث ملخصات أزمنة التأكيد والتسليم
+    if order.confirmed_date == now:
+        OrderMetricsRecorder().record_confirmed(order)
+    if order.delivered_date == now:
+        OrderMetricsRecorder().record_delivered(order)
+
+    return True
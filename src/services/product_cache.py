@@ -0,0 +1,84 @@
+from src.models import db, Product, CatalogVersion
+from flask import g, has_request_context
+from sqlalchemy import update
+from collections import namedtuple
+from typing import Dict, Optional
+import threading
+
+CachedProduct = namedtuple(
+    'CachedProduct',
+    ['product_id', 'sku', 'product_name', 'price', 'cost_price', 'is_active', 'low_stock_threshold']
+)
+
+CATALOG_ID = 1
+
+def current_catalog_version() -> int:
+    """رقم إصدار الكتالوج الحالي في قاعدة البيانات"""
+    version = db.session.query(CatalogVersion.version).filter_by(catalog_id=CATALOG_ID).scalar()
+    return version or 0
+
+def bump_catalog_version():
+    """زيادة إصدار الكتالوج ضمن المعاملة الحالية (يُستدعى مع أي تعديل على المنتجات)"""
+    updated = db.session.execute(
+        update(CatalogVersion).where(
+            CatalogVersion.catalog_id == CATALOG_ID
+        ).values(version=CatalogVersion.version + 1)
+    ).rowcount
+    if not updated:
+        db.session.add(CatalogVersion(catalog_id=CATALOG_ID, version=1))
+
+class ProductCache:
+    """ذاكرة مؤقتة للمنتجات حسب SKU مشتركة بين خيوط العملية
+
+    تحمل بيانات التسعير والحالة فقط (لا المخزون). كل عامل يقارن إصدار الكتالوج
+    مرة واحدة لكل طلب HTTP ويعيد تحميل الكتالوج كاملاً عند تغيره.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_sku: Dict[str, CachedProduct] = {}
+        self._version: Optional[int] = None
+
+    def _load(self, version: int):
+        rows = db.session.query(
+            Product.product_id, Product.sku, Product.product_name, Product.price,
+            Product.cost_price, Product.is_active, Product.low_stock_threshold
+        ).all()
+        by_sku = {
+            row.sku: CachedProduct(
+                row.product_id, row.sku, row.product_name, row.price,
+                row.cost_price, row.is_active is not False, row.low_stock_threshold
+            )
+            for row in rows
+        }
+        with self._lock:
+            self._by_sku = by_sku
+            self._version = version
+
+    def ensure_current(self):
+        """التحقق من الإصدار (مرة واحدة لكل طلب HTTP) وإعادة التحميل عند الحاجة"""
+        if has_request_context() and g.get('catalog_version_checked'):
+            return
+
+        version = current_catalog_version()
+        if version != self._version:
+            self._load(version)
+
+        if has_request_context():
+            g.catalog_version_checked = True
+
+    def get(self, sku: str) -> Optional[CachedProduct]:
+        """جلب المنتج حسب SKU"""
+        self.ensure_current()
+        with self._lock:
+            return self._by_sku.get(sku)
+
+    def invalidate(self):
+        """إبطال الذاكرة المحلية وزيادة الإصدار لبقية العمال"""
+        bump_catalog_version()
+        with self._lock:
+            self._version = None
+        if has_request_context():
+            g.catalog_version_checked = False
+
+product_cache = ProductCache()
@@ -0,0 +1,243 @@
+from src.models import db, Product, InventoryMovement
+from src.services.inventory_ledger import InventoryLedger
+from src.services.stock_alerts import StockAlertService
+from src.services.product_cache import product_cache
+from sqlalchemy.dialects import sqlite, postgresql
+from datetime import datetime
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+import csv
+import json
+import os
+
+def _text(value):
+    if value is None:
+        raise ValueError('قيمة فارغة')
+    value = str(value).strip()
+    if not value:
+        raise ValueError('قيمة فارغة')
+    return value
+
+def _optional_text(value):
+    return str(value).strip() if value is not None else None
+
+def _price(value):
+    price = float(value)
+    if price < 0:
+        raise ValueError('لا يمكن أن يكون سالباً')
+    return price
+
+def _optional_price(value):
+    return _price(value) if value not in (None, '') else None
+
+def _stock(value):
+    stock = int(value)
+    if stock < 0:
+        raise ValueError('لا يمكن أن يكون سالباً')
+    return stock
+
+def _optional_int(value):
+    return int(value) if value not in (None, '') else None
+
+def parse_flag(value) -> bool:
+    """قيمة منطقية من JSON أو نص (true/false، 1/0، نعم/لا)"""
+    if isinstance(value, bool):
+        return value
+    normalized = str(value).strip().lower()
+    if normalized in ('1', 'true', 'yes', 'نعم'):
+        return True
+    if normalized in ('0', 'false', 'no', 'لا'):
+        return False
+    raise ValueError('قيمة منطقية غير صالحة')
+
+class ProductImporter:
+    """استيراد المنتجات من CSV أو NDJSON وتحديثها حسب SKU على دفعات
+
+    كل دفعة تُكتب بجملة INSERT ... ON CONFLICT (sku) DO UPDATE واحدة لكل مجموعة
+    أعمدة، والمخزون الافتتاحي للمنتجات الجديدة يُسجل عبر دفتر الحركات. المخزون
+    الحالي للمنتجات الموجودة لا يُعدل من الاستيراد.
+    """
+
+    REQUIRED_COLUMNS = ['sku', 'product_name', 'price']
+
+    COLUMN_PARSERS = {
+        'sku': _text,
+        'product_name': _text,
+        'description': _optional_text,
+        'price': _price,
+        'cost_price': _optional_price,
+        'current_stock': _stock,
+        'initial_stock': _stock,
+        'is_active': parse_flag,
+        'low_stock_threshold': _optional_int
+    }
+
+    # أعمدة لا تُحدّث عند وجود المنتج مسبقاً
+    INSERT_ONLY_COLUMNS = {'sku', 'current_stock'}
+
+    MAX_REPORTED_ERRORS = 1000
+
+    INVALID_LINE = '_invalid'
+
+    def __init__(self, chunk_size: Optional[int] = None):
+        self.chunk_size = chunk_size or int(os.getenv('PRODUCT_IMPORT_CHUNK_SIZE', 500))
+        dialect = db.engine.dialect.name
+        if dialect == 'sqlite':
+            self._insert = sqlite.insert
+        elif dialect == 'postgresql':
+            self._insert = postgresql.insert
+        else:
+            raise ValueError(f'الاستيراد غير مدعوم على قاعدة البيانات {dialect}')
+
+    @classmethod
+    def iter_csv(cls, lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        reader = csv.DictReader(line.lstrip('﻿') if i == 0 else line for i, line in enumerate(lines))
+        if reader.fieldnames is None:
+            return
+        # في CSV الأعمدة ثابتة فيكفي فحص سطر العناوين
+        cls._validate_columns([name.strip() for name in reader.fieldnames if name])
+        for row in reader:
+            yield {key.strip(): value for key, value in row.items() if key}
+
+    @staticmethod
+    def iter_ndjson(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                yield {ProductImporter.INVALID_LINE: f'سطر JSON غير صالح: {e.msg}'}
+
+    @classmethod
+    def _validate_columns(cls, columns: List[str]):
+        missing = [column for column in cls.REQUIRED_COLUMNS if column not in columns]
+        if missing:
+            raise ValueError(f'أعمدة مطلوبة مفقودة: {", ".join(missing)}')
+        unknown = [column for column in columns if column not in cls.COLUMN_PARSERS]
+        if unknown:
+            raise ValueError(f'أعمدة غير معروفة: {", ".join(unknown)}')
+
+    def _parse_chunk(self, rows: List[Tuple[int, Dict[str, Any]]], report: Dict[str, Any]) -> Dict[str, Tuple[int, Dict[str, Any]]]:
+        """تحويل أعمدة الدفعة عموداً عموداً وجمع الأخطاء لكل سطر"""
+        columns = {column for _, row in rows for column in row if column in self.COLUMN_PARSERS}
+        parsed = [{} for _ in rows]
+        errors: List[Dict[str, str]] = [{} for _ in rows]
+
+        for column in columns:
+            parser = self.COLUMN_PARSERS[column]
+            for index, (_, row) in enumerate(rows):
+                if column not in row:
+                    continue
+                value = row[column]
+                if value in (None, '') and column not in self.REQUIRED_COLUMNS:
+                    continue
+                try:
+                    parsed[index][column] = parser(value)
+                except (ValueError, TypeError) as e:
+                    errors[index][column] = str(e)
+
+        valid: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        for index, (line_number, row) in enumerate(rows):
+            if self.INVALID_LINE in row:
+                self._add_error(report, line_number, None, {'line': row[self.INVALID_LINE]})
+                continue
+
+            # مفاتيح NDJSON تختلف من سطر لآخر، فيفحص كل سطر على حدة
+            for column in row:
+                if column not in self.COLUMN_PARSERS:
+                    errors[index][column] = 'عمود غير معروف'
+            for column in self.REQUIRED_COLUMNS:
+                if column not in parsed[index] and column not in errors[index]:
+                    errors[index][column] = 'مطلوب'
+
+            if errors[index]:
+                self._add_error(report, line_number, row.get('sku'), errors[index])
+                continue
+
+            sku = parsed[index]['sku']
+            if sku in valid:
+                self._add_error(report, valid[sku][0], sku, {'sku': 'مكرر في الملف، تم اعتماد السطر الأخير'})
+            valid[sku] = (line_number, parsed[index])
+
+        return valid
+
+    def _add_error(self, report: Dict[str, Any], line_number: int, sku: Optional[str], errors: Dict[str, str]):
+        report['failed'] += 1
+        if len(report['errors']) < self.MAX_REPORTED_ERRORS:
+            report['errors'].append({'row': line_number, 'sku': sku, 'errors': errors})
+
+    def _upsert(self, valid: Dict[str, Tuple[int, Dict[str, Any]]], report: Dict[str, Any]):
+        skus = list(valid.keys())
+        existing = {sku for (sku,) in db.session.query(Product.sku).filter(Product.sku.in_(skus)).all()}
+        now = datetime.utcnow()
+
+        # المنتجات الجديدة تبدأ بمخزون صفر ثم يُسجل مخزونها الافتتاحي في الدفتر
+        opening_stock = {}
+        groups: Dict[frozenset, List[Dict[str, Any]]] = {}
+        for sku, (_, values) in valid.items():
+            values = dict(values)
+            stock = values.pop('current_stock', 0)
+            if sku not in existing and stock:
+                opening_stock[sku] = stock
+            values['current_stock'] = 0
+            values['updated_at'] = now
+            groups.setdefault(frozenset(values), []).append(values)
+
+        for columns, rows in groups.items():
+            statement = self._insert(Product)
+            update_columns = {
+                column: statement.excluded[column]
+                for column in columns if column not in self.INSERT_ONLY_COLUMNS
+            }
+            statement = statement.on_conflict_do_update(index_elements=['sku'], set_=update_columns)
+            db.session.execute(statement, rows)
+
+        new_skus = [sku for sku in skus if sku not in existing]
+        # المنتجات الموجودة التي تغير حد التنبيه لها تعيد حساب تنبيهها كما في PUT /products
+        threshold_skus = [sku for sku in skus if sku in existing and 'low_stock_threshold' in valid[sku][1]]
+        if new_skus or threshold_skus:
+            ledger = InventoryLedger()
+            alerts = StockAlertService()
+            for product in Product.query.filter(Product.sku.in_(new_skus + threshold_skus)).populate_existing().all():
+                if opening_stock.get(product.sku):
+                    ledger.set_stock(product, opening_stock[product.sku], InventoryMovement.INITIAL)
+                alerts.sync(product)
+
+        report['inserted'] += len(new_skus)
+        report['updated'] += len(skus) - len(new_skus)
+
+    def run(self, records: Iterator[Dict[str, Any]]) -> Dict[str, Any]:
+        """تنفيذ الاستيراد؛ كل دفعة في معاملة، وإصدار الكتالوج يُزاد مرة واحدة في النهاية"""
+        report = {'rows': 0, 'inserted': 0, 'updated': 0, 'failed': 0, 'chunks': 0, 'errors': []}
+        chunk: List[Tuple[int, Dict[str, Any]]] = []
+        changed = False
+
+        def flush_chunk():
+            nonlocal changed
+            valid = self._parse_chunk(chunk, report)
+            if valid:
+                self._upsert(valid, report)
+            db.session.commit()
+            changed = changed or bool(valid)
+            report['chunks'] += 1
+            chunk.clear()
+
+        try:
+            for line_number, record in enumerate(records, start=1):
+                report['rows'] += 1
+                chunk.append((line_number, record))
+                if len(chunk) >= self.chunk_size:
+                    flush_chunk()
+
+            if chunk:
+                flush_chunk()
+
+        finally:
+            # دفعة فشلت تترك الجلسة في حاجة إلى rollback، والدفعات المؤكدة قبلها تحتاج إصداراً جديداً
+            db.session.rollback()
+            if changed:
+                product_cache.invalidate()
+                db.session.commit()
+
+        return report
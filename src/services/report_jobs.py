@@ -0,0 +1,149 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Optional
+from flask import current_app
+from src.models import db, ReportJob
+
+# مجلد دائم بجانب قاعدة البيانات حتى تبقى النتائج بعد إعادة التشغيل
+DEFAULT_REPORT_JOBS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'report_jobs')
+
+class ReportJobRunner:
+    """تشغيل التقارير الطويلة في الخلفية وحفظ نتائجها مضغوطة على القرص
+
+    بيانات كل مهمة في جدول report_jobs فتبقى بعد إعادة التشغيل وتراها كل العمليات،
+    والمهام المتطابقة (اسم التقرير + المعاملات) التي ما زالت قيد التنفيذ تُدمج في
+    مهمة واحدة. المهام التي لم تنتهِ خلال REPORT_JOB_STALE_SECONDS تعتبر متوقفة،
+    والملفات الأقدم من مدة الصلاحية تحذف بفحص المجلد نفسه.
+    """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+
+    def __init__(self, results_dir: Optional[str] = None, max_workers: Optional[int] = None,
+                 ttl_seconds: Optional[int] = None, stale_seconds: Optional[int] = None):
+        self.results_dir = results_dir or os.getenv('REPORT_JOBS_DIR', DEFAULT_REPORT_JOBS_DIR)
+        self.max_workers = max_workers or int(os.getenv('REPORT_JOBS_WORKERS', 2))
+        self.ttl_seconds = ttl_seconds or int(os.getenv('REPORT_RESULT_TTL', 3600))
+        self.stale_seconds = stale_seconds or int(os.getenv('REPORT_JOB_STALE_SECONDS', 1800))
+
+        os.makedirs(self.results_dir, exist_ok=True)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='report-job')
+
+    @staticmethod
+    def spec_key(report: str, params: Dict[str, Any]) -> str:
+        """مفتاح موحد لمواصفات التقرير"""
+        return json.dumps({'report': report, 'params': params}, sort_keys=True, ensure_ascii=False)
+
+    @classmethod
+    def spec_hash(cls, report: str, params: Dict[str, Any]) -> str:
+        return hashlib.sha1(cls.spec_key(report, params).encode('utf-8')).hexdigest()
+
+    def submit(self, report: str, params: Dict[str, Any], compute: Callable[[], Any]) -> Dict[str, Any]:
+        """إضافة مهمة تقرير جديدة أو إرجاع المهمة المطابقة قيد التنفيذ"""
+        self.purge_expired()
+
+        spec_hash = self.spec_hash(report, params)
+        existing = ReportJob.query.filter(
+            ReportJob.spec_hash == spec_hash,
+            ReportJob.status.in_([self.PENDING, self.RUNNING])
+        ).order_by(ReportJob.created_at.desc()).first()
+        if existing:
+            job = existing.to_dict()
+            job['deduplicated'] = True
+            return job
+
+        job = ReportJob(
+            job_id=uuid.uuid4().hex,
+            report=report,
+            params=json.dumps(params, ensure_ascii=False),
+            spec_hash=spec_hash,
+            status=self.PENDING,
+            created_at=datetime.utcnow()
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        app = current_app._get_current_object()
+        self._executor.submit(self._run, app, job.job_id, compute)
+
+        return job.to_dict()
+
+    def _run(self, app, job_id: str, compute: Callable[[], Any]):
+        """تنفيذ المهمة في خيط العمل وحفظ النتيجة"""
+        with app.app_context():
+            self._update(job_id, status=self.RUNNING, started_at=datetime.utcnow())
+
+            try:
+                result = compute()
+                payload = json.dumps(result, ensure_ascii=False, default=str).encode('utf-8')
+
+                path = self.result_path(job_id)
+                temp_path = path + '.tmp'
+                with gzip.open(temp_path, 'wb', compresslevel=6) as f:
+                    f.write(payload)
+                os.replace(temp_path, path)
+
+                self._update(job_id, status=self.COMPLETED, finished_at=datetime.utcnow(),
+                             result_size=os.path.getsize(path))
+
+            except Exception as e:
+                db.session.rollback()
+                self._update(job_id, status=self.FAILED, finished_at=datetime.utcnow(), error=str(e))
+
+    def _update(self, job_id: str, **fields):
+        ReportJob.query.filter_by(job_id=job_id).update(fields)
+        db.session.commit()
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """جلب حالة مهمة"""
+        self.purge_expired()
+
+        job = db.session.get(ReportJob, job_id)
+        return job.to_dict() if job else None
+
+    def list_jobs(self) -> list:
+        """جلب جميع المهام الحالية"""
+        self.purge_expired()
+
+        jobs = ReportJob.query.order_by(ReportJob.created_at.desc()).all()
+        return [job.to_dict() for job in jobs]
+
+    def result_path(self, job_id: str) -> str:
+        """مسار ملف النتيجة المضغوط"""
+        return os.path.join(self.results_dir, f'{job_id}.json.gz')
+
+    def purge_expired(self) -> int:
+        """حذف المهام والملفات التي تجاوزت مدة الصلاحية وإنهاء المهام المتوقفة"""
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=self.ttl_seconds)
+
+        # مهام عملية توقفت قبل أن تنهيها
+        ReportJob.query.filter(
+            ReportJob.status.in_([self.PENDING, self.RUNNING]),
+            ReportJob.created_at < now - timedelta(seconds=self.stale_seconds)
+        ).update({'status': self.FAILED, 'finished_at': now, 'error': 'توقف تنفيذ المهمة قبل اكتمالها'},
+                 synchronize_session=False)
+
+        expired = ReportJob.query.filter(ReportJob.finished_at < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+
+        # الملفات نفسها تحذف حسب تاريخها، بما فيها ملفات مهام لم يعد لها سجل
+        cutoff_ts = time.time() - self.ttl_seconds
+        for name in os.listdir(self.results_dir):
+            path = os.path.join(self.results_dir, name)
+            try:
+                if os.path.isfile(path) and os.path.getmtime(path) < cutoff_ts:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+        return expired
@@ -0,0 +1,166 @@
+from src.models import db, Order, Product, ProductSalesVelocity, InventoryMovement
+from src.services.upsert import insert_if_missing
+from sqlalchemy import func, and_
+from datetime import datetime, date, timedelta
+from typing import Dict, Any, List, Optional
+import math
+import os
+
+class SalesVelocityTracker:
+    """سرعة البيع اليومية لكل منتج كمتوسط متحرك أسي يُحدّث مع كل طلب
+
+    لكل منتج صف واحد فيه المتوسط حتى نهاية اليوم السابق ومجموع وحدات اليوم
+    الجاري. عند أول حركة في يوم جديد يُدمج اليوم المنتهي في المتوسط وتُخفض
+    قيمته للأيام التي لم يُبع فيها شيء، فلا حاجة لإعادة قراءة الطلبات.
+    الوحدات تحسب في يوم حركة المخزون: البيع يوم الحجز والإلغاء أو الإرجاع يوم
+    حدوثه، وrebuild() يتبع نفس القاعدة.
+    """
+
+    def __init__(self, half_life_days: Optional[float] = None):
+        self.half_life_days = half_life_days or float(os.getenv('SALES_VELOCITY_HALF_LIFE_DAYS', 14))
+        self.alpha = 1 - 0.5 ** (1.0 / self.half_life_days)
+
+    def _fold(self, velocity: float, day: date, day_units: int, until: date) -> float:
+        """المتوسط حتى نهاية اليوم السابق لـ until"""
+        if until <= day:
+            return velocity
+        velocity = self.alpha * day_units + (1 - self.alpha) * velocity
+        idle_days = (until - day).days - 1
+        return velocity * (1 - self.alpha) ** idle_days
+
+    def record(self, product_id: int, units: int, at: Optional[datetime] = None):
+        """تسجيل وحدات مباعة (أو مسترجعة بقيمة سالبة)"""
+        day = (at or datetime.utcnow()).date()
+
+        query = ProductSalesVelocity.query.filter_by(product_id=product_id).with_for_update().populate_existing()
+        state = query.first()
+        if not state:
+            insert_if_missing(ProductSalesVelocity, {
+                'product_id': product_id,
+                'velocity': 0.0,
+                'day': day,
+                'day_units': 0
+            }, ['product_id'])
+            state = query.one()
+
+        if day > state.day:
+            state.velocity = self._fold(state.velocity, state.day, state.day_units, day)
+            state.day = day
+            state.day_units = 0
+
+        state.day_units += units
+
+    def current_velocity(self, state: Optional[ProductSalesVelocity], today: Optional[date] = None) -> float:
+        """سرعة البيع اليومية حتى نهاية أمس"""
+        if not state:
+            return 0.0
+        today = today or datetime.utcnow().date()
+        return max(0.0, self._fold(state.velocity, state.day, state.day_units, today))
+
+    def forecast(self, horizon_days: int = 30, lead_time_days: int = 7, cover_days: int = 30,
+                 at_risk_only: bool = False) -> List[Dict[str, Any]]:
+        """توقع نفاد المخزون وكمية إعادة الطلب لكل المنتجات"""
+        today = datetime.utcnow().date()
+
+        rows = db.session.query(Product, ProductSalesVelocity).outerjoin(
+            ProductSalesVelocity, ProductSalesVelocity.product_id == Product.product_id
+        ).all()
+
+        results = []
+        for product, state in rows:
+            velocity = self.current_velocity(state, today)
+            stock = product.current_stock or 0
+
+            if stock <= 0:
+                days_to_stockout = 0.0
+            elif velocity > 0:
+                days_to_stockout = stock / velocity
+            else:
+                days_to_stockout = None
+
+            at_risk = days_to_stockout is not None and days_to_stockout <= horizon_days
+            if at_risk_only and not at_risk:
+                continue
+
+            # تغطية مدة التوريد + مدة التغطية المطلوبة
+            needed = velocity * (lead_time_days + cover_days)
+            suggested_reorder = max(0, int(math.ceil(needed - max(stock, 0))))
+
+            results.append({
+                'product_id': product.product_id,
+                'product_name': product.product_name,
+                'sku': product.sku,
+                'current_stock': stock,
+                'daily_velocity': round(velocity, 3),
+                'days_to_stockout': round(days_to_stockout, 1) if days_to_stockout is not None else None,
+                'stockout_date': (today + timedelta(days=int(days_to_stockout))).isoformat()
+                if days_to_stockout is not None else None,
+                'at_risk': at_risk,
+                'suggested_reorder_quantity': suggested_reorder
+            })
+
+        results.sort(key=lambda r: (r['days_to_stockout'] is None, r['days_to_stockout'] or 0, -r['daily_velocity']))
+
+        return results
+
+    def rebuild(self) -> int:
+        """إعادة بناء الحالة من دفتر حركات المخزون
+
+        صافي حركات البيع والإلغاء والإرجاع لكل يوم كما يسجلها record()، والطلبات
+        الأقدم من الدفتر (بلا حركة حجز) تحسب يوم إنشائها إذا لم تلغَ أو ترجع.
+        """
+        ProductSalesVelocity.query.delete()
+
+        movement_day = func.date(InventoryMovement.created_at)
+        movements = db.session.query(
+            InventoryMovement.product_id,
+            movement_day.label('day'),
+            (-func.sum(InventoryMovement.quantity_change)).label('units')
+        ).filter(
+            InventoryMovement.reason.in_([
+                InventoryMovement.ORDER,
+                InventoryMovement.ORDER_CANCELLED,
+                InventoryMovement.ORDER_RETURNED
+            ])
+        ).group_by(
+            InventoryMovement.product_id, movement_day
+        ).all()
+
+        order_day = func.date(Order.order_date)
+        reserved = db.session.query(InventoryMovement.movement_id).filter(and_(
+            InventoryMovement.reason == InventoryMovement.ORDER,
+            InventoryMovement.reference_type == 'order',
+            InventoryMovement.reference_id == Order.order_id
+        ))
+        legacy_orders = db.session.query(
+            Order.product_id,
+            order_day.label('day'),
+            func.sum(Order.quantity).label('units')
+        ).filter(
+            Order.order_status.notin_(['ملغى', 'ملغي', 'مرتجع']),
+            ~reserved.exists()
+        ).group_by(
+            Order.product_id, order_day
+        ).all()
+
+        units_by_day: Dict[tuple, int] = {}
+        for row in list(movements) + list(legacy_orders):
+            day = row.day if isinstance(row.day, date) else date.fromisoformat(str(row.day))
+            key = (row.product_id, day)
+            units_by_day[key] = units_by_day.get(key, 0) + int(row.units or 0)
+
+        states: Dict[int, ProductSalesVelocity] = {}
+        for (product_id, day), units in sorted(units_by_day.items()):
+            state = states.get(product_id)
+            if not state:
+                state = ProductSalesVelocity(product_id=product_id, velocity=0.0, day=day, day_units=0)
+                states[product_id] = state
+            elif day > state.day:
+                state.velocity = self._fold(state.velocity, state.day, state.day_units, day)
+                state.day = day
+                state.day_units = 0
+            state.day_units += units
+
+        db.session.add_all(states.values())
+
+        return len(states)
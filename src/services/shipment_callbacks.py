@@ -0,0 +1,287 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+from sqlalchemy import func, update
+from src.models import db, CarrierEvent
+from src.services.shipment_tracking import resolve_tracking_numbers, apply_shipment_status
+from src.services.upsert import insert_if_missing
+
+CARRIER_CALLBACK_FLUSH_INTERVAL = float(os.getenv('CARRIER_CALLBACK_FLUSH_INTERVAL', 0.3))
+CARRIER_CALLBACK_BATCH_SIZE = int(os.getenv('CARRIER_CALLBACK_BATCH_SIZE', 500))
+CARRIER_CALLBACK_MAX_ATTEMPTS = int(os.getenv('CARRIER_CALLBACK_MAX_ATTEMPTS', 5))
+
+# أسماء الحالات كما ترسلها الشركات -> مفاتيح SHIPMENT_STATUS_MAPPING
+CALLBACK_STATUS_ALIASES = {
+    'livré': 'delivered',
+    'livre': 'delivered',
+    'en_livraison': 'out_for_delivery',
+    'sorti_en_livraison': 'out_for_delivery',
+    'en_transit': 'in_transit',
+    'expédié': 'in_transit',
+    'retourné': 'returned',
+    'retour': 'returned',
+    'annulé': 'cancelled',
+    'canceled': 'cancelled'
+}
+
+def webhook_secret(carrier: str) -> Optional[str]:
+    """السر المشترك لتوقيع إشعارات الشركة (مثلاً YALIDINE_WEBHOOK_SECRET)"""
+    return os.getenv(f'{carrier.upper()}_WEBHOOK_SECRET')
+
+def verify_signature(secret: str, body: bytes, signature: Optional[str]) -> bool:
+    """التحقق من توقيع HMAC-SHA256 لجسم الطلب (بصيغة hex مع أو بدون sha256=)"""
+    if not secret or not signature:
+        return False
+    if signature.startswith('sha256='):
+        signature = signature[len('sha256='):]
+    expected = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature.strip().lower())
+
+def normalize_status(status: str) -> str:
+    key = (status or '').strip().lower().replace(' ', '_').replace('-', '_')
+    return CALLBACK_STATUS_ALIASES.get(key, key)
+
+def _parse_time(value) -> Optional[datetime]:
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value)
+    if isinstance(value, str) and value:
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+            if parsed.tzinfo:
+                parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+            return parsed
+        except ValueError:
+            pass
+    return None
+
+def normalize_events(carrier: str, payload) -> List[Dict[str, Any]]:
+    """تحويل إشعار الشركة إلى أحداث موحدة
+
+    يقبل حدثاً واحداً أو قائمة أو {'events': [...]}، مع الحقول بصيغة Yalidine
+    (tracking, status, data) أو Aramex (WaybillNumber, UpdateDescription).
+    """
+    if isinstance(payload, dict) and 'events' in payload:
+        payload = payload['events']
+    if isinstance(payload, dict):
+        payload = [payload]
+    if not isinstance(payload, list):
+        raise ValueError('صيغة الإشعار غير صحيحة')
+
+    events = []
+    for raw in payload:
+        if not isinstance(raw, dict):
+            raise ValueError('صيغة الحدث غير صحيحة')
+        data = raw.get('data') if isinstance(raw.get('data'), dict) else raw
+
+        tracking_number = data.get('tracking') or data.get('tracking_number') or data.get('WaybillNumber')
+        status = data.get('status') or data.get('UpdateDescription')
+        if not tracking_number or not status:
+            raise ValueError('رقم التتبع والحالة مطلوبان في كل حدث')
+
+        occurred_at = _parse_time(
+            raw.get('occurred_at') or data.get('last_update') or data.get('UpdateDateTime')
+        )
+        status = normalize_status(status)
+        # بدون معرف ولا وقت يبنى المعرف من الشحنة والحالة فقط حتى تُستبعد إعادة الإرسال
+        event_id = raw.get('event_id') or raw.get('id') or hashlib.sha1(
+            f'{tracking_number}|{status}|{occurred_at.isoformat() if occurred_at else ""}'.encode('utf-8')
+        ).hexdigest()
+
+        events.append({
+            'carrier': carrier,
+            'event_id': str(event_id),
+            'tracking_number': str(tracking_number),
+            'status': status,
+            'occurred_at': occurred_at or datetime.utcnow()
+        })
+
+    return events
+
+class CarrierCallbackBuffer:
+    """تخزين أحداث الشركات قبل الرد عليها ثم تطبيقها على الطلبات دفعة كل بضع مئات من الأجزاء من الثانية
+
+    الحدث يكتب في carrier_events (pending) قبل إرجاع 202، فلا يضيع إذا توقفت
+    العملية، والتكرار يمنعه القيد الفريد (carrier, event_id). التفريغ يطبق
+    الأحداث المعلقة في معاملة واحدة، وإذا فشلت يعيدها شحنة شحنة حتى لا يوقف
+    حدث معطوب البقية؛ الحدث الذي يفشل CARRIER_CALLBACK_MAX_ATTEMPTS مرة يترك
+    مع آخر خطأ. الحدث الأقدم من آخر حدث مطبق للشحنة نفسها يسجل دون أن يعيد
+    حالة الطلب إلى الوراء.
+    """
+
+    def __init__(self, flush_interval: float = None, batch_size: int = None, max_attempts: int = None):
+        self.flush_interval = flush_interval or CARRIER_CALLBACK_FLUSH_INTERVAL
+        self.batch_size = batch_size or CARRIER_CALLBACK_BATCH_SIZE
+        self.max_attempts = max_attempts or CARRIER_CALLBACK_MAX_ATTEMPTS
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self.stats = {'received': 0, 'duplicates': 0, 'stale': 0, 'orders_updated': 0, 'flushes': 0, 'failed': 0}
+
+    def add(self, app, events: List[Dict[str, Any]]) -> int:
+        """تخزين الأحداث في المعاملة الحالية وتشغيل خيط التفريغ؛ يرجع عدد الأحداث الجديدة"""
+        stored = 0
+        for event in events:
+            if insert_if_missing(CarrierEvent, {**event, 'pending': True}, ['carrier', 'event_id']):
+                stored += 1
+        db.session.commit()
+
+        with self._lock:
+            self.stats['received'] += len(events)
+            self.stats['duplicates'] += len(events) - stored
+        self.start(app)
+        return stored
+
+    def start(self, app):
+        """تشغيل خيط التفريغ مرة واحدة في العملية"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, args=(app,), name='carrier-callbacks', daemon=True)
+                self._thread.start()
+
+    def start_if_pending(self, app) -> bool:
+        """تشغيل التفريغ عند بدء التطبيق إذا بقيت أحداث معلقة من عملية سابقة"""
+        with app.app_context():
+            pending = db.session.query(CarrierEvent.id).filter(CarrierEvent.pending.is_(True)).first() is not None
+        if pending:
+            self.start(app)
+        return pending
+
+    def _loop(self, app):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                with app.app_context():
+                    self.flush()
+            except Exception as e:
+                print(f"خطأ في تطبيق إشعارات شركات التوصيل: {str(e)}")
+
+    def _pending(self) -> List[CarrierEvent]:
+        return CarrierEvent.query.filter(
+            CarrierEvent.pending.is_(True)
+        ).order_by(CarrierEvent.id).limit(self.batch_size).all()
+
+    def flush(self) -> int:
+        """تطبيق الأحداث المعلقة؛ يرجع عدد الطلبات المحدثة"""
+        with self._flush_lock:
+            events = self._pending()
+            if not events:
+                return 0
+
+            by_tracking: Dict[str, List[CarrierEvent]] = {}
+            for event in events:
+                by_tracking.setdefault(event.tracking_number, []).append(event)
+
+            try:
+                updated = self._apply(by_tracking)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                # عزل الشحنة التي يفشل تطبيقها عن بقية الدفعة
+                updated = 0
+                for tracking_number in by_tracking:
+                    try:
+                        group = self._pending_group(tracking_number)
+                        updated += self._apply({tracking_number: group}) if group else 0
+                        db.session.commit()
+                    except Exception as e:
+                        db.session.rollback()
+                        self._record_failure(tracking_number, str(e))
+
+            with self._lock:
+                self.stats['flushes'] += 1
+                self.stats['orders_updated'] += updated
+            return updated
+
+    def _pending_group(self, tracking_number: str) -> List[CarrierEvent]:
+        return CarrierEvent.query.filter(
+            CarrierEvent.tracking_number == tracking_number,
+            CarrierEvent.pending.is_(True)
+        ).order_by(CarrierEvent.id).all()
+
+    def _record_failure(self, tracking_number: str, error: str):
+        """زيادة عدد محاولات أحداث الشحنة، وإيقافها بعد الحد الأقصى"""
+        with self._lock:
+            self.stats['failed'] += 1
+        db.session.execute(
+            update(CarrierEvent).where(
+                CarrierEvent.tracking_number == tracking_number,
+                CarrierEvent.pending.is_(True)
+            ).values(
+                attempts=CarrierEvent.attempts + 1,
+                last_error=error[:1000],
+                pending=CarrierEvent.attempts + 1 < self.max_attempts
+            ).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    def _claim(self, event: CarrierEvent) -> bool:
+        # عملية أخرى قد تفرغ الأحداث نفسها؛ التحديث المشروط يترك كل حدث لواحدة فقط
+        return db.session.execute(
+            update(CarrierEvent).where(
+                CarrierEvent.id == event.id,
+                CarrierEvent.pending.is_(True)
+            ).values(pending=False).execution_options(synchronize_session=False)
+        ).rowcount == 1
+
+    def _apply(self, by_tracking: Dict[str, List[CarrierEvent]]) -> int:
+        tracking_numbers = list(by_tracking)
+        resolved = resolve_tracking_numbers(tracking_numbers)
+        last_applied = dict(
+            db.session.query(CarrierEvent.tracking_number, func.max(CarrierEvent.occurred_at)).filter(
+                CarrierEvent.tracking_number.in_(tracking_numbers),
+                CarrierEvent.applied.is_(True)
+            ).group_by(CarrierEvent.tracking_number).all()
+        )
+
+        now = datetime.utcnow()
+        updated = 0
+        for tracking_number, events in by_tracking.items():
+            events = [event for event in events if self._claim(event)]
+            if not events:
+                continue
+
+            order = resolved.get(tracking_number, (None, None))[0]
+            for event in events:
+                event.pending = False
+                event.order_id = order.order_id if order else None
+            if not order:
+                continue
+
+            # آخر حدث للشحنة هو الذي يحدد حالة الطلب
+            latest = max(events, key=lambda event: (event.occurred_at, event.id))
+            previous = last_applied.get(tracking_number)
+            if previous and latest.occurred_at < previous:
+                with self._lock:
+                    self.stats['stale'] += 1
+                continue
+            latest.applied = True
+            if apply_shipment_status(order, latest.status, now):
+                updated += 1
+
+        return updated
+
+    def status(self) -> Dict[str, Any]:
+        pending, failing = db.session.query(
+            func.count(CarrierEvent.id),
+            func.count(CarrierEvent.id).filter(CarrierEvent.attempts > 0)
+        ).filter(CarrierEvent.pending.is_(True)).one()
+        abandoned = CarrierEvent.query.filter(
+            CarrierEvent.pending.is_(False),
+            CarrierEvent.attempts >= self.max_attempts
+        ).count()
+        with self._lock:
+            stats = dict(self.stats)
+        return {
+            'pending': pending,
+            'retrying': failing,
+            'abandoned': abandoned,
+            'flush_interval': self.flush_interval,
+            **stats
+        }
+
+# مخزن مشترك على مستوى العملية
+callback_buffer = CarrierCallbackBuffer()
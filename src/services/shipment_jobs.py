@@ -0,0 +1,306 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+from sqlalchemy import func, or_, update
+from src.models import db, Order, DeliveryCompany, ShipmentJob
+from src.services.order_status import change_order_status
+
+SHIPMENT_JOB_MAX_ORDERS = int(os.getenv('SHIPMENT_JOB_MAX_ORDERS', 2000))
+SHIPMENT_JOB_STALE_SECONDS = float(os.getenv('SHIPMENT_JOB_STALE_SECONDS', 1800))
+SHIPPABLE_STATUS = 'مؤكد'
+SHIPPED_STATUS = 'تم الشحن'
+
+def shipment_payload(order: Order, options: Dict[str, Any]) -> Dict[str, Any]:
+    """تحضير بيانات الشحنة من الطلب وخيارات الطرد والمرسل"""
+    return {
+        'order_id': str(order.order_id),
+        'customer_name': order.customer_name,
+        'customer_phone': order.customer_phone,
+        'customer_address': order.customer_address,
+        'product_description': f'طلب رقم {order.order_id}',
+        'total_amount': float(order.total_amount or 0),
+        'weight': options.get('weight', 1),
+        'length': options.get('length', 10),
+        'width': options.get('width', 10),
+        'height': options.get('height', 10),
+        'declared_value': float(order.total_amount or 0),
+        'insurance': options.get('insurance', False),
+        'free_shipping': options.get('free_shipping', False),
+        'from_wilaya': options.get('from_wilaya', 'الجزائر'),
+        'to_wilaya': options.get('to_wilaya') or order.wilaya or '',
+        'to_commune': options.get('to_commune', ''),
+        'customer_city': options.get('customer_city') or order.wilaya or '',
+        'sender_name': options.get('sender_name', ''),
+        'sender_company': options.get('sender_company', ''),
+        'sender_phone': options.get('sender_phone', ''),
+        'sender_address': options.get('sender_address', ''),
+        'sender_email': options.get('sender_email', ''),
+        'customer_email': options.get('customer_email', ''),
+        'comments': options.get('comments', order.notes or '')
+    }
+
+class ShipmentJobRunningError(Exception):
+    """المهمة تنفذ حالياً في طلب أو عملية أخرى"""
+
+def _not_created(result: Dict[str, Any]) -> bool:
+    """هل الفشل مؤكد (رد صريح من الشركة أو طلب لم يُرسل) وليس انقطاعاً قد يكون بعد إنشاء الطرد"""
+    return bool(result.get('not_sent')) or 'data' in result or (result.get('status_code') or 500) < 500
+
+def select_orders(filters: Dict[str, Any]) -> List[int]:
+    """الطلبات القابلة للشحن حسب الفلتر (مؤكدة ولم تشحن بعد)"""
+    query = db.session.query(Order.order_id).filter(
+        Order.order_status == SHIPPABLE_STATUS,
+        func.coalesce(Order.shipping_tracking_id, '') == '',
+        Order.shipment_job_id.is_(None)
+    )
+
+    if filters.get('date_from'):
+        query = query.filter(Order.order_date >= datetime.fromisoformat(filters['date_from']))
+    if filters.get('date_to'):
+        query = query.filter(Order.order_date <= datetime.fromisoformat(filters['date_to']))
+    if filters.get('wilaya'):
+        query = query.filter(Order.wilaya == filters['wilaya'])
+    if filters.get('delivery_company_id'):
+        query = query.filter(Order.delivery_company_id == int(filters['delivery_company_id']))
+
+    limit = min(int(filters.get('limit', SHIPMENT_JOB_MAX_ORDERS)), SHIPMENT_JOB_MAX_ORDERS)
+    return [order_id for (order_id,) in query.order_by(Order.order_id).limit(limit)]
+
+class ShipmentJobRunner:
+    """إنشاء شحنات عدة طلبات وتسجيل النتيجة في مهمة قابلة للاستئناف
+
+    الطلبات تجمع حسب شركة التوصيل وترسل لكل شركة عبر create_shipments (طلبات
+    مجمعة أو استدعاءات متوازية محدودة)، والشركات تعالج بالتوازي. قبل الإرسال
+    يحفظ كل طلب بحالة submitting، وبعده تكتب أرقام التتبع والحالات ونتيجة المهمة
+    في معاملة واحدة. الطلب الذي انقطع إرساله دون رد صريح يبقى submitting، وعند
+    الاستئناف يبحث عنه لدى الشركة برقم الطلب بدل إعادة إرساله (أو يعاد إرساله
+    إذا طلب ذلك المشغل عبر resubmit لشركة لا تدعم البحث). المهمة تحجز بتحديث
+    مشروط فلا تنفذ مرتين في الوقت نفسه (إلا إذا توقفت أكثر من
+    SHIPMENT_JOB_STALE_SECONDS)، وكل طلب يحجز للمهمة في orders.shipment_job_id
+    حتى يشحن أو يفشل فشلاً مؤكداً، فلا ترسله مهمتان.
+    """
+
+    def __init__(self, delivery_manager, stale_seconds: float = None):
+        self.delivery_manager = delivery_manager
+        self.stale_seconds = stale_seconds or SHIPMENT_JOB_STALE_SECONDS
+
+    def create_job(self, order_ids: List[int], service_name: Optional[str] = None,
+                   options: Optional[Dict[str, Any]] = None) -> ShipmentJob:
+        order_ids = list(dict.fromkeys(int(order_id) for order_id in order_ids))
+        if not order_ids:
+            raise ValueError('لا توجد طلبات للشحن')
+        if len(order_ids) > SHIPMENT_JOB_MAX_ORDERS:
+            raise ValueError(f'الحد الأقصى {SHIPMENT_JOB_MAX_ORDERS} طلب في المهمة الواحدة')
+        if service_name and not self.delivery_manager.get_service(service_name):
+            raise ValueError(f'خدمة التوصيل {service_name} غير متاحة')
+
+        job = ShipmentJob(
+            service_name=service_name,
+            status=ShipmentJob.PENDING,
+            order_ids=json.dumps(order_ids),
+            options=json.dumps(options or {}, ensure_ascii=False),
+            results='{}',
+            total_orders=len(order_ids)
+        )
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    def _company_ids(self) -> Dict[str, int]:
+        return {
+            name.lower(): company_id
+            for company_id, name in db.session.query(DeliveryCompany.company_id, DeliveryCompany.company_name)
+        }
+
+    def claim(self, job: ShipmentJob) -> bool:
+        """حجز المهمة للتنفيذ إذا لم تكن قيد التنفيذ (أو توقف تنفيذها منذ مدة)"""
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            update(ShipmentJob).where(
+                ShipmentJob.job_id == job.job_id,
+                or_(
+                    ShipmentJob.status != ShipmentJob.RUNNING,
+                    ShipmentJob.updated_at < now - timedelta(seconds=self.stale_seconds)
+                )
+            ).values(
+                status=ShipmentJob.RUNNING,
+                attempts=ShipmentJob.attempts + 1,
+                updated_at=now
+            ).execution_options(synchronize_session=False)
+        ).rowcount == 1
+        db.session.commit()
+        db.session.refresh(job)
+        return claimed
+
+    @staticmethod
+    def _claim_order(order: Order, job_id: int) -> bool:
+        """حجز الطلب لهذه المهمة إذا لم تحجزه مهمة أخرى"""
+        return db.session.execute(
+            update(Order).where(
+                Order.order_id == order.order_id,
+                Order.order_status == SHIPPABLE_STATUS,
+                func.coalesce(Order.shipping_tracking_id, '') == '',
+                or_(Order.shipment_job_id.is_(None), Order.shipment_job_id == job_id)
+            ).values(shipment_job_id=job_id).execution_options(synchronize_session=False)
+        ).rowcount == 1
+
+    def run(self, job: ShipmentJob, resubmit: Optional[List[int]] = None) -> ShipmentJob:
+        """تنفيذ المهمة أو استئنافها
+
+        resubmit طلبات بحالة submitting يعاد إرسالها دون البحث عنها لدى الشركة،
+        بعد أن يتحقق المشغل بنفسه أنها لم تنشأ.
+        """
+        if not self.claim(job):
+            raise ShipmentJobRunningError('المهمة قيد التنفيذ حالياً')
+
+        try:
+            return self._execute(job, set(int(order_id) for order_id in resubmit or []))
+        except Exception:
+            # النتائج المحفوظة (ومنها علامات الإرسال) تبقى للاستئناف
+            db.session.rollback()
+            job.status = ShipmentJob.FAILED
+            db.session.commit()
+            raise
+
+    def _execute(self, job: ShipmentJob, resubmit: set) -> ShipmentJob:
+        results = job.get_results()
+        options = job.get_options()
+        pending_ids = [
+            order_id for order_id in job.get_order_ids()
+            if results.get(str(order_id), {}).get('status') != 'created'
+        ]
+
+        orders = {
+            order.order_id: order
+            for order in Order.query.filter(Order.order_id.in_(pending_ids)).all()
+        } if pending_ids else {}
+        company_ids = self._company_ids()
+        company_names = {company_id: name for name, company_id in company_ids.items()}
+
+        carrier_results: Dict[str, Dict[str, Any]] = {}
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for order_id in pending_ids:
+            previous = results.get(str(order_id), {})
+            order = orders.get(order_id)
+            if not order:
+                results[str(order_id)] = {'status': 'failed', 'message': 'الطلب غير موجود'}
+                continue
+            if order.shipping_tracking_id:
+                # شُحن في محاولة سابقة أو من مسار آخر
+                if order.shipment_job_id == job.job_id:
+                    order.shipment_job_id = None
+                results[str(order_id)] = {
+                    'status': 'created',
+                    'tracking_number': order.shipping_tracking_id,
+                    'message': 'الطلب لديه رقم تتبع مسبقاً'
+                }
+                continue
+            if order.order_status != SHIPPABLE_STATUS:
+                results[str(order_id)] = {
+                    'status': 'failed',
+                    'message': f'لا يمكن شحن طلب حالته {order.order_status}'
+                }
+                continue
+
+            service_name = job.service_name or company_names.get(order.delivery_company_id)
+            if not service_name or not self.delivery_manager.get_service(service_name):
+                results[str(order_id)] = {'status': 'failed', 'message': 'لا يمكن تحديد خدمة التوصيل'}
+                continue
+
+            if not self._claim_order(order, job.job_id):
+                results[str(order_id)] = {
+                    'status': 'failed',
+                    'message': f'الطلب قيد الإرسال في مهمة أخرى ({order.shipment_job_id})'
+                }
+                continue
+            order.shipment_job_id = job.job_id
+
+            if previous.get('status') == 'submitting' and order_id not in resubmit:
+                # إرسال سابق انقطع: قد يكون الطرد أنشئ لدى الشركة
+                service_name = previous.get('service_name') or service_name
+                found = self.delivery_manager.find_shipment_with_service(service_name, str(order_id))
+                if not found.get('success'):
+                    results[str(order_id)] = {
+                        **previous,
+                        'message': f'تعذر التحقق من الشحنة لدى الشركة: {found.get("message", "")}'
+                    }
+                    continue
+                if found.get('tracking_number'):
+                    carrier_results[str(order_id)] = {
+                        'service_name': service_name,
+                        'success': True,
+                        'tracking_number': found['tracking_number']
+                    }
+                    continue
+
+            groups.setdefault(service_name, []).append(shipment_payload(order, options))
+
+        # علامة الإرسال تحفظ قبل الاتصال بالشركات
+        for service_name, payloads in groups.items():
+            for payload in payloads:
+                results[payload['order_id']] = {'status': 'submitting', 'service_name': service_name}
+        job.results = json.dumps(results, ensure_ascii=False)
+        db.session.commit()
+
+        if groups:
+            with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+                futures = {
+                    service_name: executor.submit(
+                        self.delivery_manager.create_shipments_with_service, service_name, payloads
+                    )
+                    for service_name, payloads in groups.items()
+                }
+                for service_name, future in futures.items():
+                    try:
+                        created = future.result()
+                    except Exception as e:
+                        created = {}
+                        error = f'خطأ في إنشاء الشحنات: {str(e)}'
+                    else:
+                        error = 'لم ترجع شركة التوصيل نتيجة لهذا الطلب'
+                    for payload in groups[service_name]:
+                        carrier_results[payload['order_id']] = {
+                            'service_name': service_name,
+                            **(created.get(payload['order_id']) or {'success': False, 'message': error})
+                        }
+
+        # كتابة أرقام التتبع والحالات ونتيجة المهمة في معاملة واحدة
+        now = datetime.utcnow()
+        for order_id, result in carrier_results.items():
+            order = orders[int(order_id)]
+            if result.get('success') and result.get('tracking_number'):
+                order.shipping_tracking_id = result['tracking_number']
+                order.delivery_company_id = company_ids.get(result['service_name'], order.delivery_company_id)
+                order.shipment_job_id = None
+                change_order_status(order, SHIPPED_STATUS, now)
+                results[order_id] = {
+                    'status': 'created',
+                    'service_name': result['service_name'],
+                    'tracking_number': result['tracking_number']
+                }
+            else:
+                not_created = _not_created(result)
+                if not_created:
+                    # فشل مؤكد: الطلب متاح لأي مهمة أخرى
+                    order.shipment_job_id = None
+                results[order_id] = {
+                    'status': 'failed' if not_created else 'submitting',
+                    'service_name': result['service_name'],
+                    'message': result.get('message', 'فشل في إنشاء الشحنة')
+                }
+
+        created_count = sum(1 for result in results.values() if result['status'] == 'created')
+        job.results = json.dumps(results, ensure_ascii=False)
+        job.created_count = created_count
+        job.failed_count = job.total_orders - created_count
+        if job.failed_count == 0:
+            job.status = ShipmentJob.COMPLETED
+        elif created_count:
+            job.status = ShipmentJob.PARTIAL
+        else:
+            job.status = ShipmentJob.FAILED
+        db.session.commit()
+
+        return job
@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+from sqlalchemy import func, or_, update
+from src.models import db, Order, DeliveryCompany
+from src.services.shipment_tracking import ShipmentTracker, apply_shipment_status
+
+# الطلب يبقى 'تم الشحن' ما دامت الشحنة عند شركة التوصيل، ومرحلتها في shipment_status
+IN_FLIGHT_STATUS = 'تم الشحن'
+OUT_FOR_DELIVERY_STATUS = 'خرج للتسليم'
+
+SHIPMENT_POLL_BASE_INTERVAL = float(os.getenv('SHIPMENT_POLL_BASE_INTERVAL', 1800))
+SHIPMENT_POLL_OUT_FOR_DELIVERY_INTERVAL = float(os.getenv('SHIPMENT_POLL_OUT_FOR_DELIVERY_INTERVAL', 600))
+SHIPMENT_POLL_MAX_INTERVAL = float(os.getenv('SHIPMENT_POLL_MAX_INTERVAL', 6 * 3600))
+SHIPMENT_POLL_BACKOFF_FACTOR = float(os.getenv('SHIPMENT_POLL_BACKOFF_FACTOR', 2))
+SHIPMENT_POLL_MAX_PER_CARRIER = int(os.getenv('SHIPMENT_POLL_MAX_PER_CARRIER', 200))
+SHIPMENT_POLL_CLAIM_SECONDS = float(os.getenv('SHIPMENT_POLL_CLAIM_SECONDS', 300))
+
+class ShipmentPoller:
+    """تحديث حالات الشحنات الجارية دورياً بفترات متكيفة
+
+    موعد الاستعلام القادم لكل شحنة وفترته في جدول الطلبات (next_poll_at,
+    poll_interval): الفترة تتضاعف كلما لم تتغير الحالة حتى SHIPMENT_POLL_MAX_INTERVAL،
+    وتعود للفترة الأساسية عند أي تغيير، ولا تتجاوز SHIPMENT_POLL_OUT_FOR_DELIVERY_INTERVAL
+    إذا كانت الشحنة خرجت للتسليم.
+    كل دورة تحجز الشحنات المستحقة بتحديث مشروط لموعدها، فإذا عملت عدة عمليات
+    (عدة workers) معاً لا تستعلم اثنتان عن الشحنة نفسها. الحجز ينتهي بعد
+    SHIPMENT_POLL_CLAIM_SECONDS إذا توقفت العملية قبل تسجيل النتيجة.
+    """
+
+    def __init__(self, delivery_manager, base_interval: float = None, out_for_delivery_interval: float = None,
+                 max_interval: float = None, backoff_factor: float = None, max_per_carrier: int = None,
+                 claim_seconds: float = None):
+        self.tracker = ShipmentTracker(delivery_manager)
+        self.delivery_manager = delivery_manager
+        self.base_interval = base_interval or SHIPMENT_POLL_BASE_INTERVAL
+        self.out_for_delivery_interval = out_for_delivery_interval or SHIPMENT_POLL_OUT_FOR_DELIVERY_INTERVAL
+        self.max_interval = max_interval or SHIPMENT_POLL_MAX_INTERVAL
+        self.backoff_factor = backoff_factor or SHIPMENT_POLL_BACKOFF_FACTOR
+        self.max_per_carrier = max_per_carrier or SHIPMENT_POLL_MAX_PER_CARRIER
+        self.claim_seconds = claim_seconds or SHIPMENT_POLL_CLAIM_SECONDS
+        self.last_cycle: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _in_flight():
+        return db.session.query(Order).filter(
+            Order.order_status == IN_FLIGHT_STATUS,
+            Order.shipping_tracking_id.isnot(None),
+            Order.shipping_tracking_id != ''
+        )
+
+    @staticmethod
+    def _is_due(now: datetime):
+        return or_(Order.next_poll_at.is_(None), Order.next_poll_at <= now)
+
+    def _due(self, service_name: str, now: datetime) -> List[int]:
+        """الطلبات المستحقة لشركة واحدة، الأقدم استحقاقاً أولاً"""
+        return [
+            order_id for (order_id,) in self._in_flight().join(
+                DeliveryCompany, DeliveryCompany.company_id == Order.delivery_company_id
+            ).filter(
+                func.lower(DeliveryCompany.company_name) == service_name,
+                self._is_due(now)
+            ).order_by(
+                Order.next_poll_at.isnot(None), Order.next_poll_at, Order.order_id
+            ).with_entities(Order.order_id).limit(self.max_per_carrier)
+        ]
+
+    def _claim(self, order_id: int, now: datetime) -> bool:
+        """حجز شحنة مستحقة بتأجيل موعدها؛ يفشل إذا حجزتها عملية أخرى"""
+        return db.session.execute(
+            update(Order).where(
+                Order.order_id == order_id,
+                Order.order_status == IN_FLIGHT_STATUS,
+                self._is_due(now)
+            ).values(
+                next_poll_at=now + timedelta(seconds=self.claim_seconds)
+            ).execution_options(synchronize_session=False)
+        ).rowcount == 1
+
+    def _next_interval(self, order: Order, changed: bool) -> float:
+        if changed or not order.poll_interval:
+            interval = self.base_interval
+        else:
+            interval = min(order.poll_interval * self.backoff_factor, self.max_interval)
+        if order.shipment_status == OUT_FOR_DELIVERY_STATUS:
+            interval = min(interval, self.out_for_delivery_interval)
+        return interval
+
+    def poll_once(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """تنفيذ دورة استعلام واحدة للشحنات المستحقة"""
+        with self._lock:
+            now = now or datetime.utcnow()
+
+            claimed: Dict[str, List[int]] = {}
+            for service_name in self.delivery_manager.get_available_services():
+                order_ids = [order_id for order_id in self._due(service_name, now) if self._claim(order_id, now)]
+                if order_ids:
+                    claimed[service_name] = order_ids
+            # الحجز يُثبت قبل الاستعلام من الشركات حتى تراه العمليات الأخرى
+            db.session.commit()
+
+            orders = {
+                order.order_id: order
+                for order in Order.query.filter(
+                    Order.order_id.in_([order_id for ids in claimed.values() for order_id in ids])
+                ).populate_existing().all()
+            } if claimed else {}
+            due = {
+                service_name: [orders[order_id].shipping_tracking_id for order_id in order_ids]
+                for service_name, order_ids in claimed.items()
+            }
+
+            results = self.tracker.fetch(due)
+            by_tracking = {order.shipping_tracking_id: order for order in orders.values()}
+
+            updated = 0
+            failed = 0
+            for tracking_number, result in results.items():
+                order = by_tracking[tracking_number]
+                changed = False
+
+                if not result.get('success'):
+                    failed += 1
+                elif apply_shipment_status(order, result.get('status', ''), now):
+                    changed = True
+                    updated += 1
+
+                order.poll_interval = self._next_interval(order, changed)
+                order.next_poll_at = now + timedelta(seconds=order.poll_interval)
+
+            db.session.commit()
+
+            self.last_cycle = {
+                'ran_at': now.isoformat(),
+                'in_flight': self._in_flight().count(),
+                'polled': len(results),
+                'polled_by_carrier': {service_name: len(numbers) for service_name, numbers in due.items()},
+                'failed': failed,
+                'updated_orders': updated
+            }
+            return self.last_cycle
+
+    def status(self) -> Dict[str, Any]:
+        """حالة الجدولة الحالية"""
+        now = datetime.utcnow()
+        tracked, due_now, next_poll = self._in_flight().with_entities(
+            func.count(Order.order_id),
+            func.count(Order.order_id).filter(self._is_due(now)),
+            func.min(Order.next_poll_at)
+        ).one()
+        return {
+            'tracked_shipments': tracked,
+            'due_now': due_now,
+            'next_poll_in_seconds': max(0, round((next_poll - now).total_seconds(), 1)) if next_poll is not None else None,
+            'last_cycle': self.last_cycle
+        }
+
+    def start_background_polling(self, app, tick: float):
+        """تشغيل الدورات في خيط خلفي كل tick ثانية"""
+        def loop():
+            while True:
+                try:
+                    with app.app_context():
+                        self.poll_once()
+                except Exception as e:
+                    print(f"خطأ في تحديث حالات الشحنات: {str(e)}")
+                time.sleep(tick)
+
+        thread = threading.Thread(target=loop, name='shipment-poller', daemon=True)
+        thread.start()
+        return thread
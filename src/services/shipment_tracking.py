@@ -0,0 +1,151 @@
+from src.models import db, Order, DeliveryCompany
+from src.services.order_status import change_order_status
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+# تحويل حالة الشحنة لدى الشركة إلى (حالة الطلب، حالة الشحنة)؛ الشحنة الجارية
+# تبقى 'تم الشحن' حتى تحتسب في المبيعات، ومرحلتها تحفظ في shipment_status
+SHIPMENT_STATUS_MAPPING = {
+    'delivered': ('تم التسليم', None),
+    'in_transit': ('تم الشحن', 'في الطريق'),
+    'out_for_delivery': ('تم الشحن', 'خرج للتسليم'),
+    'returned': ('مرتجع', None),
+    'cancelled': ('ملغى', None)
+}
+
+def resolve_tracking_numbers(tracking_numbers: List[str]) -> Dict[str, Tuple[Order, Optional[str]]]:
+    """ربط أرقام التتبع بطلباتها وشركات توصيلها في استعلام واحد"""
+    if not tracking_numbers:
+        return {}
+
+    rows = db.session.query(Order, DeliveryCompany.company_name).outerjoin(
+        DeliveryCompany, DeliveryCompany.company_id == Order.delivery_company_id
+    ).filter(
+        Order.shipping_tracking_id.in_(tracking_numbers)
+    ).all()
+
+    return {
+        order.shipping_tracking_id: (order, company_name.lower() if company_name else None)
+        for order, company_name in rows
+    }
+
+def apply_shipment_status(order: Order, shipment_status: str, now: Optional[datetime] = None) -> bool:
+    """تطبيق حالة الشحنة على الطلب؛ يرجع True إذا تغيرت حالة الطلب أو مرحلة الشحنة"""
+    mapped = SHIPMENT_STATUS_MAPPING.get((shipment_status or '').lower())
+    if not mapped:
+        return False
+
+    new_status, new_shipment_status = mapped
+    if new_status == order.order_status and new_shipment_status == order.shipment_status:
+        return False
+
+    try:
+        change_order_status(order, new_status, now)
+    except ValueError as e:
+        # طلب ملغى لا يعاد تفعيله من الشركة إذا لم يعد مخزونه متاحاً
+        print(f"تعذر تطبيق حالة الشحنة على الطلب {order.order_id}: {str(e)}")
+        return False
+    order.shipment_status = new_shipment_status
+    return True
+
+class ShipmentTracker:
+    """تتبع عدة شحنات مجمعة حسب شركة التوصيل
+
+    كل شركة تستقبل أرقامها دفعة واحدة عبر track_shipments (طلبات مجمعة أو
+    استدعاءات متوازية محدودة حسب الشركة)؛ تحديث الطلبات يتم بعد جمع النتائج
+    في خيط الطلب نفسه وضمن معاملة واحدة.
+    """
+
+    def __init__(self, delivery_manager):
+        self.delivery_manager = delivery_manager
+
+    def fetch(self, groups: Dict[str, List[str]]) -> Dict[str, Dict[str, Any]]:
+        """جلب حالات الشحنات من الشركات بالتوازي بين الشركات"""
+        results = {}
+        if not groups:
+            return results
+
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            futures = {
+                service_name: executor.submit(
+                    self.delivery_manager.track_shipments_with_service, service_name, numbers
+                )
+                for service_name, numbers in groups.items()
+            }
+            for service_name, future in futures.items():
+                try:
+                    carrier_results = future.result()
+                except Exception as e:
+                    carrier_results = {
+                        number: {'success': False, 'message': f'خطأ في التتبع: {str(e)}'}
+                        for number in groups[service_name]
+                    }
+                for number in groups[service_name]:
+                    results[number] = carrier_results.get(number) or {
+                        'success': False,
+                        'message': 'لم ترجع شركة التوصيل نتيجة لهذه الشحنة'
+                    }
+
+        return results
+
+    def track_many(self, tracking_numbers: List[str], service_name: Optional[str] = None) -> Dict[str, Any]:
+        """تتبع الشحنات وتحديث حالات الطلبات المرتبطة بها"""
+        tracking_numbers = list(dict.fromkeys(tracking_numbers))
+        resolved = resolve_tracking_numbers(tracking_numbers)
+
+        results: Dict[str, Dict[str, Any]] = {}
+        groups: Dict[str, List[str]] = {}
+
+        for tracking_number in tracking_numbers:
+            order, order_service = resolved.get(tracking_number, (None, None))
+            current_service = service_name or order_service
+
+            if not current_service:
+                results[tracking_number] = {
+                    'tracking_number': tracking_number,
+                    'service_name': None,
+                    'result': {
+                        'success': False,
+                        'message': 'لا يمكن تحديد خدمة التوصيل'
+                    }
+                }
+                continue
+
+            groups.setdefault(current_service, []).append(tracking_number)
+
+        fetched = self.fetch(groups)
+        for current_service, numbers in groups.items():
+            for tracking_number in numbers:
+                results[tracking_number] = {
+                    'tracking_number': tracking_number,
+                    'service_name': current_service,
+                    'result': fetched[tracking_number]
+                }
+
+        # تحديث جميع الطلبات في معاملة واحدة
+        now = datetime.utcnow()
+        updated_orders = 0
+        for tracking_number, entry in results.items():
+            order = resolved.get(tracking_number, (None, None))[0]
+            entry['order_id'] = order.order_id if order else None
+            entry['order_updated'] = False
+            if order and entry['result'].get('success'):
+                if apply_shipment_status(order, entry['result'].get('status', ''), now):
+                    entry['order_updated'] = True
+                    entry['order_status'] = order.order_status
+                    updated_orders += 1
+
+        if updated_orders:
+            db.session.commit()
+
+        ordered = [results[tracking_number] for tracking_number in tracking_numbers]
+        successful = sum(1 for entry in ordered if entry['result'].get('success'))
+
+        return {
+            'total_shipments': len(ordered),
+            'successful_tracks': successful,
+            'failed_tracks': len(ordered) - successful,
+            'updated_orders': updated_orders,
+            'results': ordered
+        }
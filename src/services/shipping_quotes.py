@@ -0,0 +1,198 @@
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Any, List, Optional
+from cachetools import TTLCache
+from src.models import db, DeliveryPriceList, DeliveryCompany
+
+QUOTE_CACHE_TTL = float(os.getenv('QUOTE_CACHE_TTL', 900))
+QUOTE_CACHE_SIZE = int(os.getenv('QUOTE_CACHE_SIZE', 5000))
+QUOTE_WEIGHT_BUCKET_KG = float(os.getenv('QUOTE_WEIGHT_BUCKET_KG', 0.5))
+QUOTE_VALUE_BUCKET = float(os.getenv('QUOTE_VALUE_BUCKET', 1000))
+QUOTE_DIMENSION_BUCKET_CM = float(os.getenv('QUOTE_DIMENSION_BUCKET_CM', 5))
+RATE_SHOP_BUDGET_MS = float(os.getenv('RATE_SHOP_BUDGET_MS', 1500))
+
+_quote_executor = ThreadPoolExecutor(max_workers=int(os.getenv('RATE_SHOP_WORKERS', 8)), thread_name_prefix='rate-shop')
+
+def quote_total(result: Dict[str, Any]) -> Optional[float]:
+    """تكلفة السعر الناجح، أو None إذا فشل أو لم ترجع الشركة تكلفة موجبة"""
+    if not result.get('success'):
+        return None
+    try:
+        total = float(result.get('total_cost'))
+    except (TypeError, ValueError):
+        return None
+    return total if total > 0 else None
+
+def _bucket(value, size: float) -> float:
+    """الحد الأعلى للشريحة التي تقع فيها القيمة"""
+    value = max(float(value or 0), 0.0)
+    if value == 0:
+        return 0.0
+    return round(math.ceil(value / size) * size, 6)
+
+class QuoteCache:
+    """ذاكرة مؤقتة لأسعار الشحن (TTL + LRU)
+
+    المفتاح (الشركة، من، إلى، شريحة الوزن، شرائح الأبعاد، شريحة القيمة المصرح بها)؛
+    الأبعاد لأن Aramex تسعر بالوزن الحجمي. الطلب يرسل للشركة بالحد الأعلى للشريحة
+    فيصلح السعر المخزن لكل القيم داخلها.
+    """
+
+    def __init__(self, maxsize: int = None, ttl: float = None):
+        self._cache = TTLCache(maxsize=maxsize or QUOTE_CACHE_SIZE, ttl=ttl or QUOTE_CACHE_TTL)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(cost_data: Dict[str, Any]) -> Dict[str, Any]:
+        """تقريب الوزن والأبعاد والقيمة إلى حدود الشرائح"""
+        normalized = dict(cost_data)
+        normalized['weight'] = _bucket(cost_data.get('weight', 1), QUOTE_WEIGHT_BUCKET_KG)
+        for dimension in ('length', 'width', 'height'):
+            normalized[dimension] = _bucket(cost_data.get(dimension, 10), QUOTE_DIMENSION_BUCKET_CM)
+        normalized['declared_value'] = _bucket(cost_data.get('declared_value', 0), QUOTE_VALUE_BUCKET)
+        return normalized
+
+    @staticmethod
+    def key(service_name: str, cost_data: Dict[str, Any]) -> tuple:
+        # Yalidine تسعر حسب الولاية و Aramex حسب المدينة، فيدخل الاثنان في المفتاح
+        return (
+            service_name,
+            cost_data.get('from_wilaya') or '',
+            cost_data.get('sender_city') or '',
+            cost_data.get('to_wilaya') or '',
+            cost_data.get('customer_city') or '',
+            cost_data.get('weight'),
+            cost_data.get('length'),
+            cost_data.get('width'),
+            cost_data.get('height'),
+            cost_data.get('declared_value')
+        )
+
+    def get_shipping_cost(self, service_name: str, service, cost_data: Dict[str, Any],
+                          timeout: Optional[float] = None) -> Dict[str, Any]:
+        """سعر الشحن من الذاكرة المؤقتة أو من الشركة؛ تخزن الأسعار الصالحة فقط"""
+        cost_data = self.normalize(cost_data)
+        key = self.key(service_name, cost_data)
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self.hits += 1
+                return {**cached, 'cached': True}
+            self.misses += 1
+
+        result = service.get_shipping_cost(cost_data, timeout=timeout)
+        if quote_total(result) is not None:
+            with self._lock:
+                self._cache[key] = result
+
+        return {**result, 'cached': False}
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'size': len(self._cache),
+                'maxsize': self._cache.maxsize,
+                'ttl': self._cache.ttl,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+# ذاكرة مشتركة على مستوى العملية
+quote_cache = QuoteCache()
+
+def price_list_quotes(product_id: int, quantity: int, region: str = '') -> List[Dict[str, Any]]:
+    """أسعار التوصيل المحلية لمنتج؛ سعر المنطقة مقدم على السعر العام لكل شركة"""
+    rows = db.session.query(DeliveryPriceList, DeliveryCompany.company_name).join(
+        DeliveryCompany, DeliveryCompany.company_id == DeliveryPriceList.delivery_company_id
+    ).filter(
+        DeliveryPriceList.product_id == product_id,
+        DeliveryPriceList.is_active == True,
+        DeliveryPriceList.region.in_([region, ''] if region else [''])
+    ).all()
+
+    best: Dict[int, tuple] = {}
+    for price_list, company_name in rows:
+        current = best.get(price_list.delivery_company_id)
+        if current is None or (price_list.region and not current[0].region):
+            best[price_list.delivery_company_id] = (price_list, company_name)
+
+    return [
+        {
+            'source': 'price_list',
+            'service_name': company_name.lower(),
+            'delivery_company_id': price_list.delivery_company_id,
+            'price_list_id': price_list.price_list_id,
+            'region': price_list.region,
+            'total_cost': price_list.price_per_unit * quantity,
+            'currency': 'DZD'
+        }
+        for price_list, company_name in best.values()
+    ]
+
+def rate_shop(delivery_manager, cost_data: Dict[str, Any], product_id: Optional[int] = None,
+              quantity: int = 1, region: str = '', budget_ms: float = None) -> Dict[str, Any]:
+    """مقارنة أسعار كل الشركات المسجلة بالتوازي مع أسعار القوائم المحلية
+
+    الشركات التي لا ترد خلال الميزانية الزمنية تستبعد من المقارنة، وطلب كل
+    شركة محدود بالميزانية نفسها (دون إعادة محاولة) فلا يبقى خيط معلقاً بعدها.
+    السعر الناقص أو غير الموجب يعد فشلاً وليس أرخص خيار.
+    """
+    if budget_ms is not None and budget_ms <= 0:
+        raise ValueError('budget_ms يجب أن يكون أكبر من صفر')
+    budget = (budget_ms if budget_ms is not None else RATE_SHOP_BUDGET_MS) / 1000.0
+    started = time.monotonic()
+
+    futures = {
+        _quote_executor.submit(
+            quote_cache.get_shipping_cost, service_name, delivery_manager.get_service(service_name), cost_data, budget
+        ): service_name
+        for service_name in delivery_manager.get_available_services()
+    }
+    done, _ = wait(futures, timeout=budget)
+
+    options = []
+    failures = []
+    for future, service_name in futures.items():
+        if future not in done:
+            failures.append({'service_name': service_name, 'message': 'تجاوزت الشركة المهلة المحددة'})
+            continue
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {'success': False, 'message': str(e)}
+
+        total_cost = quote_total(result)
+        if total_cost is not None:
+            options.append({
+                'source': 'carrier',
+                'service_name': service_name,
+                'total_cost': total_cost,
+                'currency': result.get('currency', 'DZD'),
+                'cached': result.get('cached', False)
+            })
+        elif result.get('success'):
+            failures.append({'service_name': service_name, 'message': 'لم ترجع الشركة تكلفة صالحة'})
+        else:
+            failures.append({'service_name': service_name, 'message': result.get('message', '')})
+
+    if product_id is not None:
+        options.extend(price_list_quotes(product_id, quantity, region))
+
+    options.sort(key=lambda option: option['total_cost'])
+
+    return {
+        'cheapest': options[0] if options else None,
+        'options': options,
+        'failures': failures,
+        'elapsed_ms': round((time.monotonic() - started) * 1000, 1)
+    }
@@ -0,0 +1,192 @@
+import base64
+import hashlib
+import json
+import math
+import random
+from typing import Dict, Any, List, Optional
+
+class KLLSketch:
+    """ملخص KLL للمئينات قابل للدمج
+
+    يحتفظ بعدد محدود من العينات موزعة على مستويات، كل مستوى وزن عناصره ضعف
+    الذي قبله. الخطأ النسبي في الترتيب تقريباً 1.7/k (حوالي 1% عند k=200).
+    """
+
+    def __init__(self, k: int = 200, seed: Optional[int] = None):
+        self.k = k
+        self.n = 0
+        self.min_value = None
+        self.max_value = None
+        self.levels: List[List[float]] = [[]]
+        self._random = random.Random(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2.0 / 3.0) ** depth)))
+
+    def _size(self) -> int:
+        return sum(len(level) for level in self.levels)
+
+    def _max_size(self) -> int:
+        return sum(self._capacity(level) for level in range(len(self.levels)))
+
+    def _compress(self):
+        while self._size() > self._max_size():
+            for level in range(len(self.levels)):
+                if len(self.levels[level]) >= self._capacity(level):
+                    if level + 1 == len(self.levels):
+                        self.levels.append([])
+
+                    items = sorted(self.levels[level])
+                    # عند العدد الفردي يبقى عنصر واحد في المستوى الحالي
+                    keep = [items.pop()] if len(items) % 2 else []
+                    offset = self._random.randint(0, 1)
+                    self.levels[level + 1].extend(items[offset::2])
+                    self.levels[level] = keep
+                    break
+
+    def add(self, value: float):
+        """إضافة قيمة"""
+        value = float(value)
+        self.n += 1
+        self.min_value = value if self.min_value is None else min(self.min_value, value)
+        self.max_value = value if self.max_value is None else max(self.max_value, value)
+        self.levels[0].append(value)
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def merge(self, other: 'KLLSketch'):
+        """دمج ملخص آخر في هذا الملخص"""
+        if other.n == 0:
+            return
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+
+        self.n += other.n
+        self.min_value = other.min_value if self.min_value is None else min(self.min_value, other.min_value)
+        self.max_value = other.max_value if self.max_value is None else max(self.max_value, other.max_value)
+        self._compress()
+
+    def quantiles(self, fractions: List[float]) -> List[Optional[float]]:
+        """حساب المئينات المطلوبة (0..1)"""
+        if self.n == 0:
+            return [None for _ in fractions]
+
+        weighted = sorted(
+            (value, 2 ** level)
+            for level, items in enumerate(self.levels)
+            for value in items
+        )
+        total_weight = sum(weight for _, weight in weighted)
+
+        results = []
+        for fraction in fractions:
+            if fraction <= 0:
+                results.append(self.min_value)
+                continue
+            if fraction >= 1:
+                results.append(self.max_value)
+                continue
+
+            target = fraction * total_weight
+            cumulative = 0
+            result = weighted[-1][0]
+            for value, weight in weighted:
+                cumulative += weight
+                if cumulative >= target:
+                    result = value
+                    break
+            results.append(result)
+
+        return results
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'type': 'kll',
+            'k': self.k,
+            'n': self.n,
+            'min': self.min_value,
+            'max': self.max_value,
+            'levels': self.levels
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'KLLSketch':
+        sketch = cls(k=data.get('k', 200))
+        sketch.n = data.get('n', 0)
+        sketch.min_value = data.get('min')
+        sketch.max_value = data.get('max')
+        sketch.levels = data.get('levels') or [[]]
+        return sketch
+
+class HyperLogLog:
+    """عداد HyperLogLog للقيم المميزة قابل للدمج (خطأ قياسي ~1.04/sqrt(2^p))"""
+
+    def __init__(self, p: int = 12):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.sha1(value.encode('utf-8')).digest()[:8], 'big')
+
+    def position(self, value: str) -> tuple:
+        """رقم السجل والرتبة التي تضعها القيمة فيه"""
+        hashed = self._hash(value)
+        index = hashed >> (64 - self.p)
+        remaining = (hashed << self.p) & ((1 << 64) - 1)
+        rank = min(64 - self.p, (64 - remaining.bit_length())) + 1
+        return index, rank
+
+    def add(self, value: str) -> bool:
+        """إضافة قيمة؛ يرجع True إذا تغير أحد السجلات"""
+        index, rank = self.position(value)
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, other: 'HyperLogLog'):
+        """دمج عداد آخر"""
+        if other.p != self.p:
+            raise ValueError('لا يمكن دمج عدادات بدقة مختلفة')
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def count(self) -> int:
+        """تقدير عدد القيم المميزة"""
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # تصحيح المدى الصغير (linear counting)
+            estimate = self.m * math.log(self.m / zeros)
+
+        return int(round(estimate))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'type': 'hll',
+            'p': self.p,
+            'registers': base64.b64encode(bytes(self.registers)).decode('ascii')
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'HyperLogLog':
+        sketch = cls(p=data.get('p', 12))
+        sketch.registers = bytearray(base64.b64decode(data['registers']))
+        return sketch
+
+def sketch_from_json(payload: str):
+    """تحويل النص المخزن إلى ملخص"""
+    data = json.loads(payload)
+    if data['type'] == 'hll':
+        return HyperLogLog.from_dict(data)
+    return KLLSketch.from_dict(data)
+
+def sketch_to_json(sketch) -> str:
+    """تحويل الملخص إلى نص للتخزين"""
+    return json.dumps(sketch.to_dict(), separators=(',', ':'))
@@ -0,0 +1,175 @@
+from src.models import db, Product, InventoryAlert
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, List, Callable, Optional
+import json
+import os
+import queue
+import threading
+import requests
+
+DEFAULT_LOW_STOCK_THRESHOLD = int(os.getenv('LOW_STOCK_THRESHOLD', 10))
+
+def threshold_for(product: Product) -> int:
+    """حد التنبيه للمنتج أو الحد الافتراضي"""
+    if product.low_stock_threshold is not None:
+        return product.low_stock_threshold
+    return DEFAULT_LOW_STOCK_THRESHOLD
+
+def alert_level(stock: int, threshold: int) -> Optional[str]:
+    """مستوى التنبيه لقيمة مخزون معينة"""
+    if stock <= 0:
+        return InventoryAlert.OUT_OF_STOCK
+    if stock <= threshold:
+        return InventoryAlert.LOW_STOCK
+    return None
+
+class StockAlertDispatcher:
+    """توزيع أحداث التنبيه بعد نجاح المعاملة على المشتركين
+
+    المشتركون داخل العملية (دوال)، عنوان webhook محلي (STOCK_ALERT_WEBHOOK_URL)
+    يُرسل إليه في خيط خلفي، وطوابير بث SSE لكل اتصال مفتوح.
+    """
+
+    def __init__(self, webhook_url: Optional[str] = None, stream_queue_size: int = 100):
+        self.webhook_url = webhook_url or os.getenv('STOCK_ALERT_WEBHOOK_URL')
+        self.webhook_timeout = float(os.getenv('STOCK_ALERT_WEBHOOK_TIMEOUT', 5))
+        self.stream_queue_size = stream_queue_size
+
+        self._lock = threading.Lock()
+        self._subscribers: List[Callable[[Dict[str, Any]], None]] = []
+        self._streams: List[queue.Queue] = []
+        self._webhook_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stock-alert-webhook')
+
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None]):
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[Dict[str, Any]], None]):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def open_stream(self) -> queue.Queue:
+        """طابور أحداث لاتصال SSE جديد"""
+        stream = queue.Queue(maxsize=self.stream_queue_size)
+        with self._lock:
+            self._streams.append(stream)
+        return stream
+
+    def close_stream(self, stream: queue.Queue):
+        with self._lock:
+            if stream in self._streams:
+                self._streams.remove(stream)
+
+    def dispatch(self, events: List[Dict[str, Any]]):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            streams = list(self._streams)
+
+        for alert_event in events:
+            for callback in subscribers:
+                try:
+                    callback(alert_event)
+                except Exception as e:
+                    print(f"خطأ في مشترك تنبيهات المخزون: {str(e)}")
+
+            for stream in streams:
+                try:
+                    stream.put_nowait(alert_event)
+                except queue.Full:
+                    # مستمع بطيء: نتخطى الحدث بدلاً من حجز الطلب
+                    pass
+
+        if self.webhook_url and events:
+            self._webhook_executor.submit(self._post_webhook, events)
+
+    def _post_webhook(self, events: List[Dict[str, Any]]):
+        try:
+            requests.post(
+                self.webhook_url,
+                data=json.dumps({'alerts': events}, ensure_ascii=False).encode('utf-8'),
+                headers={'Content-Type': 'application/json'},
+                timeout=self.webhook_timeout
+            )
+        except requests.RequestException as e:
+            print(f"تعذر إرسال تنبيهات المخزون إلى {self.webhook_url}: {str(e)}")
+
+alert_dispatcher = StockAlertDispatcher()
+
+_PENDING_KEY = 'pending_stock_alerts'
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_pending_alerts(session):
+    events = session.info.pop(_PENDING_KEY, None)
+    if events:
+        alert_dispatcher.dispatch(events)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending_alerts(session):
+    session.info.pop(_PENDING_KEY, None)
+
+class StockAlertService:
+    """اكتشاف عبور حد التنبيه عند كتابة المخزون وتحديث جدول التنبيهات"""
+
+    def on_stock_change(self, product: Product, old_stock: int, new_stock: int):
+        """يُستدعى من دفتر الحركات؛ لا يلمس الجدول إلا عند تغير المستوى"""
+        threshold = threshold_for(product)
+        if alert_level(old_stock, threshold) != alert_level(new_stock, threshold):
+            self.sync(product)
+
+    def sync(self, product: Product) -> Optional[InventoryAlert]:
+        """مطابقة التنبيه النشط للمنتج مع مخزونه الحالي"""
+        threshold = threshold_for(product)
+        stock = product.current_stock or 0
+        level = alert_level(stock, threshold)
+        now = datetime.utcnow()
+
+        active = InventoryAlert.query.filter_by(
+            product_id=product.product_id, is_active=True
+        ).with_for_update().first()
+
+        if active and active.alert_type == level:
+            active.current_stock = stock
+            active.threshold = threshold
+            return active
+
+        if active:
+            active.is_active = False
+            active.resolved_at = now
+            self._queue_event('resolved', active, product)
+
+        if not level:
+            return None
+
+        alert = InventoryAlert(
+            product_id=product.product_id,
+            alert_type=level,
+            current_stock=stock,
+            threshold=threshold,
+            is_active=True,
+            triggered_at=now
+        )
+        db.session.add(alert)
+        db.session.flush()
+        self._queue_event('triggered', alert, product)
+
+        return alert
+
+    def rebuild(self) -> int:
+        """مطابقة تنبيهات جميع المنتجات (للتهيئة الأولى أو بعد تغيير الحد الافتراضي)"""
+        products = Product.query.all()
+        for product in products:
+            self.sync(product)
+        return len(products)
+
+    @staticmethod
+    def _queue_event(action: str, alert: InventoryAlert, product: Product):
+        db.session.info.setdefault(_PENDING_KEY, []).append({
+            'event': action,
+            'alert': alert.to_dict(),
+            'product_name': product.product_name,
+            'sku': product.sku
+        })
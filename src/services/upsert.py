@@ -0,0 +1,29 @@
+from src.models import db
+from sqlalchemy import insert
+from sqlalchemy.dialects import sqlite, postgresql
+from sqlalchemy.exc import IntegrityError
+from typing import Dict, Any, List
+
+def insert_if_missing(model, values: Dict[str, Any], index_elements: List[str]) -> bool:
+    """إدراج صف إذا لم يكن موجوداً، دون خطأ إذا أدرجته معاملة متزامنة (ON CONFLICT DO NOTHING)
+
+    يرجع True إذا أُدرج الصف.
+
+    يستخدم قبل SELECT ... FOR UPDATE عند إنشاء صف ملخص لأول مرة: الإدراج لا يفشل
+    أبداً، ثم يقفل الصف الموجود ويعدل كالمعتاد.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        statement = sqlite.insert(model).values(**values).on_conflict_do_nothing(index_elements=index_elements)
+    elif dialect == 'postgresql':
+        statement = postgresql.insert(model).values(**values).on_conflict_do_nothing(index_elements=index_elements)
+    else:
+        # قواعد أخرى: نقطة حفظ تلغي الإدراج المكرر وحده دون المعاملة كاملة
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(model).values(**values))
+        except IntegrityError:
+            return False
+        return True
+
+    return db.session.execute(statement).rowcount == 1
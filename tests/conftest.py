@@ -0,0 +1,60 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix='ecom-tests-')
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(_tmp, "test.db")}'
+os.environ['REPORT_JOBS_DIR'] = os.path.join(_tmp, 'reports')
+os.environ['ORDER_ARCHIVE_DIR'] = os.path.join(_tmp, 'archive')
+os.environ.pop('SHIPMENT_POLL_TICK', None)
+os.environ.pop('ANALYTICS_REFRESH_INTERVAL', None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.main import app as flask_app
+from src.models import db, Product, Order
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        yield flask_app
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_product(app):
+    def make(**fields):
+        values = {'product_name': 'منتج', 'sku': f'SKU-{Product.query.count() + 1}', 'price': 1000.0,
+                  'current_stock': 0, 'is_active': True}
+        values.update(fields)
+        product = Product(**values)
+        db.session.add(product)
+        db.session.commit()
+        return product
+    return make
+
+
+@pytest.fixture
+def make_order(app):
+    def make(product, **fields):
+        values = {'customer_name': 'زبون', 'customer_phone': '0550000000', 'customer_address': 'العنوان',
+                  'wilaya': 'الجزائر', 'product_id': product.product_id, 'quantity': 1,
+                  'order_source': 'manual', 'order_status': 'قيد الانتظار'}
+        values.update(fields)
+        order = Order(**values)
+        order.apply_product_snapshot(product)
+        db.session.add(order)
+        db.session.commit()
+        return order
+    return make
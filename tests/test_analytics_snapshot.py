@@ -0,0 +1,66 @@
+from datetime import datetime
+
+from src.models import db, Expense
+from src.services.analytics_snapshot import OrderAnalyticsSnapshot, to_day
+
+
+def _rows_by(rows, key):
+    return {row[key]: row for row in rows}
+
+
+def test_incremental_refresh_overwrites_changed_orders(app, make_product, make_order):
+    product = make_product(current_stock=5)
+    order = make_order(product, order_status='مؤكد', quantity=1)
+    snapshot = OrderAnalyticsSnapshot()
+    snapshot.refresh()
+
+    order.quantity = 3
+    order.order_status = 'تم التسليم'
+    db.session.commit()
+    snapshot.refresh()
+
+    rows = snapshot.aggregate_orders(['status'], ['quantity', 'orders'])
+    assert rows == [{'status': 'تم التسليم', 'quantity': 3.0, 'orders': 1}]
+
+
+def test_grouping_and_filters(app, make_product, make_order):
+    first = make_product(current_stock=10, price=1000.0)
+    second = make_product(current_stock=10, price=500.0)
+    make_order(first, wilaya='وهران', order_source='facebook', order_date=datetime(2026, 3, 2))
+    make_order(first, wilaya='وهران', order_source='manual', order_date=datetime(2026, 3, 3))
+    make_order(second, wilaya='الجزائر', order_source='facebook', order_date=datetime(2026, 4, 1))
+    snapshot = OrderAnalyticsSnapshot()
+    snapshot.refresh()
+
+    by_wilaya = _rows_by(snapshot.aggregate_orders(['wilaya'], ['orders']), 'wilaya')
+    assert by_wilaya['وهران']['orders'] == 2 and by_wilaya['الجزائر']['orders'] == 1
+
+    by_month = _rows_by(snapshot.aggregate_orders(['month', 'product'], ['orders']), 'month')
+    assert by_month['2026-03']['product'] == first.product_id
+
+    facebook = snapshot.aggregate_orders(['product'], ['orders'], sources=['facebook'],
+                                         start_day=to_day(datetime(2026, 3, 1)),
+                                         end_day=to_day(datetime(2026, 3, 31)))
+    assert facebook == [{'product': first.product_id, 'orders': 1}]
+    assert snapshot.aggregate_orders(['product'], ['orders'], wilayas=['قسنطينة']) == []
+
+
+def test_incremental_refresh_evicts_deleted_orders_and_expenses(app, make_product, make_order):
+    product = make_product(current_stock=5)
+    kept = make_order(product)
+    removed = make_order(product)
+    expense = Expense(expense_type='إعلانات', amount=200.0, expense_date=datetime(2026, 3, 1).date())
+    db.session.add(expense)
+    db.session.commit()
+    snapshot = OrderAnalyticsSnapshot()
+    snapshot.refresh()
+    assert snapshot.status()['orders'] == 2 and snapshot.status()['expenses'] == 1
+
+    # الأرشفة تحذف الطلبات من الجدول الحي بالطريقة نفسها
+    db.session.delete(removed)
+    db.session.delete(expense)
+    db.session.commit()
+    snapshot.refresh()
+
+    assert list(snapshot.orders.columns['order_id']) == [kept.order_id]
+    assert snapshot.aggregate_expenses(['expense_type']) == []
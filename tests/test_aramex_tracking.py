@@ -0,0 +1,59 @@
+import json
+import threading
+
+import requests
+
+from src.services import delivery_integration
+from src.services.delivery_integration import AramexService
+
+
+def json_response(status, body):
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(body).encode('utf-8')
+    return response
+
+
+def fake_track(calls, missing=()):
+    lock = threading.Lock()
+
+    def post(path, json=None, **kwargs):
+        with lock:
+            calls.append(list(json['Shipments']))
+        results = []
+        for number in json['Shipments']:
+            if number in missing:
+                continue
+            # الأحدث أولاً كما ترجعه Aramex
+            results.append({'WaybillNumber': number, 'UpdateDescription': 'Delivered', 'UpdateDateTime': '2'})
+            results.append({'WaybillNumber': number, 'UpdateDescription': 'Picked Up', 'UpdateDateTime': '1'})
+        return json_response(200, {'HasErrors': False, 'TrackingResults': results})
+    return post
+
+
+def test_tracking_is_split_into_batches_without_duplicates(monkeypatch):
+    monkeypatch.setattr(delivery_integration, 'ARAMEX_TRACK_BATCH_SIZE', 2)
+    service = AramexService()
+    calls = []
+    monkeypatch.setattr(service.http, 'post', fake_track(calls))
+
+    results = service.track_shipments(['A1', 'A2', 'A3', 'A1', 'A4', 'A5'])
+
+    assert sorted(len(batch) for batch in calls) == [1, 2, 2]
+    assert sorted(number for batch in calls for number in batch) == ['A1', 'A2', 'A3', 'A4', 'A5']
+    assert set(results) == {'A1', 'A2', 'A3', 'A4', 'A5'}
+    assert results['A3']['status'] == 'Delivered' and len(results['A3']['tracking_history']) == 2
+
+
+def test_missing_waybill_fails_alone_and_batch_errors_fail_the_batch(monkeypatch):
+    service = AramexService()
+    monkeypatch.setattr(service.http, 'post', fake_track([], missing={'B2'}))
+
+    results = service.track_shipments(['B1', 'B2'])
+
+    assert results['B1']['success'] is True
+    assert results['B2']['success'] is False and results['B2']['tracking_number'] == 'B2'
+
+    monkeypatch.setattr(service.http, 'post', lambda *args, **kwargs: json_response(503, {}))
+    results = service.track_shipments(['B1', 'B2'])
+    assert {number: result['status_code'] for number, result in results.items()} == {'B1': 503, 'B2': 503}
@@ -0,0 +1,60 @@
+from src.models import db, InventoryMovement, StockLot
+from src.services.bulk_inventory import BulkInventoryUpdate
+
+
+def restock(product, quantity, unit_cost=100.0):
+    result = BulkInventoryUpdate(BulkInventoryUpdate.RESTOCK).run(
+        [{'sku': product.sku, 'quantity': quantity, 'unit_cost': unit_cost}], reference='PO-1'
+    )
+    db.session.commit()
+    return result
+
+
+def adjustments(product):
+    return InventoryMovement.query.filter_by(
+        product_id=product.product_id, reason=InventoryMovement.ADJUSTMENT
+    ).all()
+
+
+def test_rows_for_the_same_product_use_a_running_total(app, make_product):
+    product = make_product()
+    restock(product, 5)
+
+    result = BulkInventoryUpdate(BulkInventoryUpdate.ADJUST).run([
+        {'product_id': product.product_id, 'adjustment': 3, 'reason': 'جرد'},
+        {'sku': product.sku, 'adjustment': -7, 'reason': 'تالف'},
+        {'sku': product.sku, 'adjustment': -2, 'reason': 'تالف'}
+    ])
+
+    # السطر الثالث يتجاوز المخزون بعد السطرين الأولين (5 + 3 - 7 = 1)
+    assert [row['status'] for row in result['rows']] == ['skipped', 'skipped', 'error']
+    assert result['applied'] is False
+    db.session.rollback()
+    db.session.refresh(product)
+    assert product.current_stock == 5 and adjustments(product) == []
+
+
+def test_allow_partial_applies_one_negative_net_change_per_product(app, make_product):
+    product = make_product()
+    other = make_product()
+    restock(product, 5)
+
+    result = BulkInventoryUpdate(BulkInventoryUpdate.ADJUST).run([
+        {'sku': product.sku, 'adjustment': 2},
+        {'sku': product.sku, 'adjustment': -6},
+        {'sku': other.sku, 'adjustment': -1},
+        {'sku': 'NOPE', 'adjustment': 1}
+    ], reason='جرد', allow_partial=True)
+    db.session.commit()
+
+    assert result['applied_rows'] == 2 and result['failed_rows'] == 2 and result['products_updated'] == 1
+    assert [row['new_stock'] for row in result['rows'][:2]] == [7, 1]
+    db.session.refresh(product)
+    assert product.current_stock == 1
+    movement, = adjustments(product)
+    assert movement.quantity_change == -4 and movement.balance_after == 1
+    # الدفعات تبقى مساوية للمخزون بعد الخصم
+    remaining = db.session.query(db.func.sum(StockLot.remaining_quantity)).filter_by(
+        product_id=product.product_id
+    ).scalar()
+    assert remaining == 1
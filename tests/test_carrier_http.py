@@ -0,0 +1,103 @@
+import io
+import time
+
+import requests
+
+from src.services.carrier_http import CarrierHttpClient, CircuitBreaker
+
+
+def fake_response(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response.raw = io.BytesIO(b'{}')
+    return response
+
+
+def test_unparseable_retry_after_falls_back_to_backoff(monkeypatch):
+    client = CarrierHttpClient('test', 'http://carrier.invalid', max_retries=1, backoff_base=0.001, backoff_max=0.01)
+    responses = [fake_response(503, {'Retry-After': 'soon'}), fake_response(200)]
+    closed = []
+    responses[0].close = lambda: closed.append(True)
+    monkeypatch.setattr(client.session, 'request', lambda *args, **kwargs: responses.pop(0))
+
+    response = client.get('/parcels/')
+
+    assert response.status_code == 200
+    assert closed == [True]
+    assert 0 <= client._backoff(0, fake_response(503, {'Retry-After': 'soon'})) <= 0.01
+
+
+def test_stats_survive_missing_pool_internals(monkeypatch):
+    client = CarrierHttpClient('test', 'http://carrier.invalid')
+    monkeypatch.setattr(client._adapter.poolmanager, 'pools', object())
+
+    stats = client.get_stats()
+
+    assert 'connections_opened' not in stats
+    assert stats['carrier'] == 'test'
+
+
+def test_half_open_counts_only_probe_results():
+    breaker = CircuitBreaker(window=4, min_calls=2, failure_rate=0.5, open_seconds=0.01, half_open_probes=1)
+    early = breaker.allow()
+    late = breaker.allow()
+    breaker.record(False, admission=early)
+    breaker.record(False, admission=breaker.allow())
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.02)
+    probe = breaker.allow()
+    assert probe.probe and breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow() is None
+
+    # طلب سمح به قبل فتح الدائرة لا يغلقها ولا يعيد فتحها
+    breaker.record(True, admission=late)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    breaker.record(True, admission=probe)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_hedge_delay_ignores_other_endpoints(monkeypatch):
+    client = CarrierHttpClient('test', 'http://carrier.invalid')
+    client.hedge_min_samples = 5
+    monkeypatch.setattr(client.session, 'request', lambda *args, **kwargs: fake_response(201))
+
+    for _ in range(10):
+        client.post('/parcels/')
+    assert client._hedge_delay('tracking') is None
+
+    for _ in range(5):
+        client.get('/parcels/1/tracking', hedge='tracking')
+    assert client._hedge_delay('tracking') == client.hedge_min_delay
+    assert client._hedge_delay('quote') is None
+
+
+def test_budget_disables_retries(monkeypatch):
+    client = CarrierHttpClient('test', 'http://carrier.invalid', max_retries=3, backoff_base=0.001)
+    calls = []
+
+    def request(*args, **kwargs):
+        calls.append(kwargs['timeout'])
+        return fake_response(503)
+
+    monkeypatch.setattr(client.session, 'request', request)
+
+    assert client.post('/deliveryfees/', idempotent=True, **client.budget(0.5)).status_code == 503
+    assert calls == [0.5]
+
+
+def test_zero_timeout_is_not_replaced_by_the_default(monkeypatch):
+    client = CarrierHttpClient('test', 'http://carrier.invalid', max_retries=0)
+    calls = []
+
+    def request(*args, **kwargs):
+        calls.append(kwargs['timeout'])
+        return fake_response(200)
+
+    monkeypatch.setattr(client.session, 'request', request)
+
+    client.get('/parcels/', timeout=0)
+    client.get('/parcels/')
+    assert calls == [0, (client.connect_timeout, client.read_timeout)]
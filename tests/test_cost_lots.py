@@ -0,0 +1,61 @@
+from src.models import db, InventoryMovement, StockLot
+from src.services.cost_lots import FifoCostEngine, OPENING_LOT_REFERENCE
+from src.services.inventory_ledger import InventoryLedger
+
+
+def open_quantity(product):
+    return sum(lot.remaining_quantity for lot in StockLot.query.filter_by(product_id=product.product_id))
+
+
+def test_legacy_stock_is_costed_before_newer_lots(app, make_product, make_order):
+    product = make_product(current_stock=10, cost_price=100.0)
+
+    FifoCostEngine().receive(product, 5, 200.0)
+    InventoryLedger().apply(product, 5, InventoryMovement.RESTOCK)
+    db.session.commit()
+
+    opening = StockLot.query.filter_by(reference=OPENING_LOT_REFERENCE).one()
+    assert opening.quantity == 10 and opening.unit_cost == 100.0
+    assert product.cost_price == 200.0
+
+    order = make_order(product, quantity=12)
+    assert InventoryLedger().reserve(product.product_id, 12, InventoryMovement.ORDER, 'order', order.order_id)
+    db.session.commit()
+
+    assert order.unit_cost == (10 * 100.0 + 2 * 200.0) / 12
+    assert open_quantity(product) == product.current_stock == 3
+
+
+def test_every_stock_decrease_consumes_lots(app, make_product):
+    product = make_product(current_stock=0, cost_price=50.0)
+    ledger = InventoryLedger()
+
+    ledger.set_stock(product, 20, InventoryMovement.INITIAL)
+    ledger.apply(product, -4, InventoryMovement.ADJUSTMENT)
+    ledger.set_stock(product, 11)
+    db.session.commit()
+
+    assert open_quantity(product) == product.current_stock == 11
+
+
+def test_cancellation_returns_units_to_their_lots(app, make_product, make_order):
+    product = make_product(current_stock=0, cost_price=80.0)
+    InventoryLedger().set_stock(product, 5, InventoryMovement.INITIAL)
+    db.session.commit()
+
+    order = make_order(product, quantity=3)
+    InventoryLedger().reserve(product.product_id, 3, InventoryMovement.ORDER, 'order', order.order_id)
+    InventoryLedger().apply(product, 3, InventoryMovement.ORDER_CANCELLED, 'order', order.order_id)
+    db.session.commit()
+
+    assert not FifoCostEngine().is_consumed(order)
+    assert open_quantity(product) == product.current_stock == 5
+
+
+def test_uncosted_units_leave_order_cost_unknown(app, make_product, make_order):
+    product = make_product(current_stock=4, cost_price=None)
+    order = make_order(product, quantity=2)
+
+    assert order.unit_cost is None
+    assert FifoCostEngine().consume(order) is None
+    assert order.unit_cost is None
@@ -0,0 +1,74 @@
+from datetime import datetime
+
+from src.models import db, DeliveryCompany, DeliveryPriceList, Expense
+
+PERIOD = {'start_date': '2026-03-01T00:00:00', 'end_date': '2026-03-31T23:59:59'}
+
+
+def test_orders_keep_their_price_snapshot_in_revenue(client, make_product, make_order):
+    product = make_product(current_stock=10, price=1000.0, cost_price=600.0)
+    make_order(product, order_status='مؤكد', quantity=2, order_date=datetime(2026, 3, 5))
+    make_order(product, order_status='قيد الانتظار', quantity=1, order_date=datetime(2026, 3, 6))
+
+    # تغيير سعر المنتج لاحقاً لا يغير إيرادات الطلبات السابقة
+    product.price = 5000.0
+    product.cost_price = 4000.0
+    db.session.commit()
+
+    data = client.get('/api/financial/profit-loss', query_string=PERIOD).get_json()['data']
+    assert data['revenue']['total_revenue'] == 2000.0
+    assert data['revenue']['total_orders'] == 1
+    assert data['costs']['total_cogs'] == 1200.0
+
+
+def test_backfill_fills_only_missing_snapshots(client, make_product, make_order):
+    product = make_product(current_stock=10, price=800.0, cost_price=500.0)
+    legacy = make_order(product, order_status='تم التسليم', quantity=3, order_date=datetime(2026, 3, 5))
+    legacy.unit_price = legacy.total_amount = legacy.unit_cost = None
+    kept = make_order(product, order_status='تم التسليم', quantity=1, order_date=datetime(2026, 3, 6))
+    kept.total_amount = 700.0
+    db.session.commit()
+
+    result = client.post('/api/financial/backfill-snapshots').get_json()['data']
+
+    assert result == {'unit_price_filled': 1, 'total_amount_filled': 1, 'unit_cost_filled': 1}
+    db.session.refresh(legacy)
+    assert (legacy.unit_price, legacy.total_amount, legacy.unit_cost) == (800.0, 2400.0, 500.0)
+    db.session.refresh(kept)
+    assert kept.total_amount == 700.0
+
+
+def test_product_profitability_aggregates_costs_and_sorts_in_sql(client, make_product, make_order):
+    company = DeliveryCompany(company_name='Yalidine')
+    db.session.add(company)
+    db.session.flush()
+    cheap = make_product(current_stock=10, price=500.0, cost_price=300.0)
+    dear = make_product(current_stock=10, price=2000.0, cost_price=1000.0)
+    db.session.add(DeliveryPriceList(price_list_name='عام', product_id=dear.product_id,
+                                     delivery_company_id=company.company_id, price_per_unit=150.0))
+    db.session.commit()
+
+    make_order(cheap, order_status='تم التسليم', quantity=2, order_date=datetime(2026, 3, 5), delivery_price=100.0)
+    # بدون سعر توصيل مسجل: يؤخذ من قائمة الأسعار لكل وحدة
+    listed = make_order(dear, order_status='مؤكد', quantity=2, order_date=datetime(2026, 3, 7),
+                        delivery_company_id=company.company_id)
+    make_order(dear, order_status='ملغى', quantity=5, order_date=datetime(2026, 3, 8))
+    db.session.add_all([
+        Expense(expense_type='تغليف', amount=50.0, expense_date=datetime(2026, 3, 7).date(), order_id=listed.order_id),
+        Expense(expense_type='تغليف', amount=25.0, expense_date=datetime(2026, 3, 7).date(), order_id=listed.order_id)
+    ])
+    db.session.commit()
+
+    data = client.get('/api/financial/product-profitability', query_string={**PERIOD, 'top': 1}).get_json()['data']
+
+    assert data['total_products'] == 2 and data['returned_products'] == 1
+    top = data['products'][0]
+    assert top['product_id'] == dear.product_id
+    assert top['total_orders'] == 1 and top['total_quantity_sold'] == 2
+    assert top['delivery_costs'] == 300.0 and top['product_expenses'] == 75.0
+    assert top['net_profit'] == 4000.0 - 2000.0 - 300.0 - 75.0
+
+    data = client.get('/api/financial/product-profitability',
+                      query_string={**PERIOD, 'sort_by': 'total_revenue', 'order': 'asc'}).get_json()['data']
+    assert [entry['product_id'] for entry in data['products']] == [cheap.product_id, dear.product_id]
+    assert client.get('/api/financial/product-profitability', query_string={'sort_by': 'sku'}).status_code == 400
@@ -0,0 +1,51 @@
+import threading
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from src.models import db, InventoryMovement, InventorySnapshot
+from src.services.inventory_ledger import InventoryLedger
+
+
+def test_concurrent_first_movement_of_the_day_keeps_one_snapshot(app, make_product):
+    product = make_product(current_stock=10)
+    product_id = product.product_id
+    today = datetime.utcnow().date()
+    errors = []
+
+    # معاملة أخرى كتبت رصيد اليوم ولم تؤكده بعد
+    connection = db.engine.connect()
+    transaction = connection.begin()
+    connection.execute(insert(InventorySnapshot).values(product_id=product_id, day=today, opening_stock=10))
+
+    def move():
+        with app.app_context():
+            try:
+                InventoryLedger().apply(db.session.get(type(product), product_id), -2,
+                                        InventoryMovement.ADJUSTMENT)
+                db.session.commit()
+            except Exception as e:
+                errors.append(e)
+                db.session.rollback()
+
+    thread = threading.Thread(target=move)
+    thread.start()
+    thread.join(0.3)
+    transaction.commit()
+    connection.close()
+    thread.join()
+
+    assert errors == []
+    snapshots = InventorySnapshot.query.filter_by(product_id=product_id, day=today).all()
+    assert [snapshot.opening_stock for snapshot in snapshots] == [10]
+
+
+def test_stock_at_uses_the_first_opening_of_the_day(app, make_product):
+    product = make_product(current_stock=10)
+    ledger = InventoryLedger()
+    ledger.apply(product, -3, InventoryMovement.ADJUSTMENT)
+    ledger.apply(product, 5, InventoryMovement.ADJUSTMENT)
+    db.session.commit()
+
+    assert InventorySnapshot.query.filter_by(product_id=product.product_id).one().opening_stock == 10
+    assert ledger.stock_at(datetime.utcnow(), [product.product_id]) == {product.product_id: 12}
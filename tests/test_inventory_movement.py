@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta
+
+from src.models import db
+
+
+def sold(make_order, product, days_ago, quantity=1):
+    return make_order(product, quantity=quantity, order_status='تم التسليم',
+                      order_date=datetime.utcnow() - timedelta(days=days_ago))
+
+
+def test_days_outside_windows_is_rejected(client):
+    response = client.get('/api/inventory/movement?days=14&windows=7,30')
+    assert response.status_code == 400
+
+
+def test_total_products_ignores_limit_and_primary_window_excludes_older_sales(client, make_product, make_order):
+    recent = [make_product(current_stock=10) for _ in range(3)]
+    older = make_product(current_stock=10)
+    for product in recent:
+        sold(make_order, product, 2)
+    sold(make_order, older, 20)
+
+    data = client.get('/api/inventory/movement?days=7&windows=7,30&limit=2').get_json()['data']
+
+    assert len(data['movement']) == 2
+    assert data['total_products'] == 3
+    assert older.product_id not in [entry['product_id'] for entry in data['movement']]
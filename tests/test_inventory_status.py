@@ -0,0 +1,31 @@
+from src.routes.inventory import _inventory_summary
+
+
+def stock_levels(make_product, *levels):
+    return [make_product(current_stock=level, price=100.0) for level in levels]
+
+
+def test_summary_counts_in_one_pass_and_limits_flagged_products(app, make_product):
+    out_a, out_b, low, _, _ = stock_levels(make_product, 0, 0, 3, 8, 50)
+
+    summary, low_stock, out_of_stock = _inventory_summary(10, limit=3)
+
+    assert summary['total_products'] == 5
+    assert summary['low_stock_count'] == 4 and summary['out_of_stock_count'] == 2
+    assert summary['total_inventory_value'] == 6100.0
+    # النافدة أولاً ثم الأقل مخزوناً، والباقي مقطوع بالحد
+    assert [p.product_id for p in out_of_stock] == [out_a.product_id, out_b.product_id]
+    assert [p.product_id for p in low_stock] == [low.product_id]
+    assert summary['truncated'] is True
+
+
+def test_counts_only_skips_product_lists(client, make_product):
+    stock_levels(make_product, 0, 5, 20)
+
+    data = client.get('/api/inventory/status', query_string={'counts_only': 'true'}).get_json()['data']
+    assert data == {'total_products': 3, 'low_stock_count': 2, 'out_of_stock_count': 1,
+                    'total_inventory_value': 2500.0}
+
+    data = client.get('/api/inventory/alerts', query_string={'low_stock_threshold': 10, 'limit': 1}).get_json()['data']
+    assert data['low_stock_count'] == 1 and data['out_of_stock_count'] == 1
+    assert [alert['type'] for alert in data['alerts']] == ['out_of_stock'] and data['truncated'] is True
@@ -0,0 +1,92 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.models import db, Order, DeliveryCompany, DeliveryPriceList
+from src.services.order_archive import OrderArchive
+
+
+def old_order(make_order, product, **fields):
+    return make_order(product, order_status='تم التسليم',
+                      order_date=datetime.utcnow() - timedelta(days=400), **fields)
+
+
+def test_archive_refuses_without_directory(app, monkeypatch):
+    monkeypatch.delenv('ORDER_ARCHIVE_DIR', raising=False)
+    archive = OrderArchive()
+
+    with pytest.raises(ValueError):
+        archive.archive_closed_orders(12)
+    assert archive.status()['configured'] is False
+
+
+def test_archived_delivery_cost_falls_back_to_price_list(app, tmp_path, make_product, make_order):
+    product = make_product(current_stock=5)
+    company = DeliveryCompany(company_name='Yalidine')
+    db.session.add(company)
+    db.session.flush()
+    db.session.add(DeliveryPriceList(price_list_name='عام', product_id=product.product_id, delivery_company_id=company.company_id,
+                                     price_per_unit=300.0))
+    db.session.commit()
+    order = old_order(make_order, product, quantity=2, delivery_company_id=company.company_id)
+    order_id = order.order_id
+
+    archive = OrderArchive(str(tmp_path))
+    archive.archive_closed_orders(12)
+
+    assert archive.find_order(order_id)['delivery_cost'] == 600.0
+    assert archive.sales_by_product(None, None)[product.product_id]['delivery_price'] == 600.0
+
+
+def test_reconcile_rolls_back_segment_whose_orders_were_not_deleted(app, tmp_path, make_product, make_order):
+    product = make_product(current_stock=5)
+    order = old_order(make_order, product)
+    archive = OrderArchive(str(tmp_path), reconcile_age=0.001)
+
+    # توقف بعد تسجيل المقطع المعلق وقبل حذف الطلبات
+    rows = [(order, 0, 0)]
+    segment = archive._write_segment(rows)
+    segment['created_at'] = (datetime.utcnow() - timedelta(hours=1)).isoformat()
+    archive._set_segment(segment['name'], {**segment, 'committed': False})
+    os.makedirs(tmp_path / 'stray-segment')
+    old = datetime.utcnow().timestamp() - 60
+    os.utime(tmp_path / 'stray-segment', (old, old))
+
+    assert archive.status()['archived_orders'] == 0
+    result = archive.reconcile()
+
+    assert result == {'rolled_back': 1, 'completed': 0, 'orphans_removed': 1}
+    assert db.session.get(Order, order.order_id) is not None
+    assert archive.manifest()['segments'] == []
+
+
+def test_reconcile_completes_segment_after_partial_failure(app, tmp_path, make_product, make_order):
+    product = make_product(current_stock=5)
+    first, second = old_order(make_order, product), old_order(make_order, product)
+    second_id = second.order_id
+    archive = OrderArchive(str(tmp_path), reconcile_age=0.001)
+
+    segment = archive._write_segment([(first, 0, 0), (second, 0, 0)])
+    segment['created_at'] = (datetime.utcnow() - timedelta(hours=1)).isoformat()
+    archive._set_segment(segment['name'], {**segment, 'committed': False})
+    db.session.delete(first)
+    db.session.commit()
+
+    assert archive.reconcile()['completed'] == 1
+    assert db.session.get(Order, second_id) is None
+    assert archive.status()['archived_orders'] == 2
+
+
+def test_archive_detaches_carrier_events(app, tmp_path, make_product, make_order):
+    from src.models import CarrierEvent
+
+    order = old_order(make_order, make_product(current_stock=5), shipping_tracking_id='YAL-1')
+    db.session.add(CarrierEvent(carrier='yalidine', event_id='e1', tracking_number='YAL-1', status='delivered',
+                                occurred_at=datetime.utcnow(), order_id=order.order_id, applied=True))
+    db.session.commit()
+
+    OrderArchive(str(tmp_path)).archive_closed_orders(12)
+
+    event = CarrierEvent.query.filter_by(event_id='e1').one()
+    assert event.order_id is None
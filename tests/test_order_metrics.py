@@ -0,0 +1,96 @@
+import threading
+from datetime import date, datetime, timedelta
+
+from src.models import db, OrderMetricSketch
+from src.services import order_metrics
+from src.services.order_metrics import OrderMetricsRecorder
+from src.services.order_archive import OrderArchive
+from src.services.sketches import sketch_from_json
+
+
+def test_first_insert_race_on_same_day_does_not_fail(app, monkeypatch):
+    day = date(2026, 1, 5)
+    barrier = threading.Barrier(2, timeout=5)
+    real_insert = order_metrics.insert_if_missing
+
+    def insert_after_both_selected(*args, **kwargs):
+        # الخيطان لم يجدا الصف، والآن يحاولان إدراجه معاً
+        barrier.wait()
+        real_insert(*args, **kwargs)
+
+    monkeypatch.setattr(order_metrics, 'insert_if_missing', insert_after_both_selected)
+    errors = []
+
+    def record(value):
+        with app.app_context():
+            try:
+                OrderMetricsRecorder()._update('time_to_confirm', day, value)
+                db.session.commit()
+            except Exception as e:
+                errors.append(e)
+                db.session.rollback()
+
+    threads = [threading.Thread(target=record, args=(value,)) for value in (1.0, 2.0)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    row = OrderMetricSketch.query.filter_by(metric='time_to_confirm', day=day).one()
+    assert row.observations == 2
+    assert sketch_from_json(row.payload).n == 2
+
+
+def test_repeat_customer_does_not_rewrite_sketch(app, make_product, make_order):
+    product = make_product(current_stock=5)
+    order = make_order(product, customer_phone='0551234567')
+    recorder = OrderMetricsRecorder()
+
+    recorder.record_created(order)
+    db.session.commit()
+    recorder.record_created(order)
+    db.session.commit()
+    row = OrderMetricSketch.query.filter_by(metric=recorder.CUSTOMERS_METRIC).one()
+    updated_at = row.updated_at
+
+    recorder.record_created(order)
+    db.session.commit()
+
+    db.session.refresh(row)
+    assert row.observations == 1
+    assert row.updated_at == updated_at
+
+
+def test_order_value_is_recorded_on_delivery_only(app, make_product, make_order):
+    product = make_product(current_stock=5)
+    order = make_order(product, order_date=datetime.utcnow() - timedelta(days=2))
+    recorder = OrderMetricsRecorder()
+
+    recorder.record_created(order)
+    assert OrderMetricSketch.query.filter_by(metric='order_value').count() == 0
+
+    order.delivered_date = datetime.utcnow()
+    recorder.record_delivered(order)
+    db.session.commit()
+
+    row = OrderMetricSketch.query.filter_by(metric='order_value').one()
+    assert row.day == order.order_date.date()
+
+
+def test_rebuild_includes_archived_orders(app, tmp_path, make_product, make_order):
+    product = make_product(current_stock=5)
+    ordered = datetime.utcnow() - timedelta(days=400)
+    old_id = make_order(product, order_status='تم التسليم', customer_phone='0551111111', order_date=ordered,
+                        delivered_date=ordered + timedelta(days=2)).order_id
+    make_order(product, customer_phone='0552222222')
+    archive = OrderArchive(str(tmp_path))
+    archive.archive_closed_orders(12)
+    assert archive.find_order(old_id) is not None
+
+    assert OrderMetricsRecorder().rebuild(archive) == 2
+
+    customers = OrderMetricSketch.query.filter_by(metric=OrderMetricsRecorder.CUSTOMERS_METRIC).all()
+    assert sum(row.observations for row in customers) == 2
+    value = OrderMetricSketch.query.filter_by(metric='order_value').one()
+    assert value.day == ordered.date()
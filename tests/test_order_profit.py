@@ -0,0 +1,46 @@
+import json
+from datetime import datetime
+
+from src.models import db, Expense
+from src.services.order_profit import iter_order_profits
+
+
+def test_batch_profit_matches_per_order_profit(app, make_product, make_order):
+    product = make_product(current_stock=10, price=1000.0, cost_price=400.0)
+    orders = [
+        make_order(product, order_status='تم التسليم', quantity=quantity, delivery_price=200.0,
+                   order_date=datetime(2026, 3, day))
+        for day, quantity in ((1, 1), (2, 3), (3, 2))
+    ]
+    make_order(product, order_status='ملغى', order_date=datetime(2026, 3, 4))
+    # مصروفان على الطلب نفسه لا يكرران صفه في الربط
+    db.session.add_all([
+        Expense(expense_type='تغليف', amount=30.0, expense_date=datetime(2026, 3, 2).date(), order_id=orders[1].order_id),
+        Expense(expense_type='إرجاع', amount=70.0, expense_date=datetime(2026, 3, 2).date(), order_id=orders[1].order_id)
+    ])
+    db.session.commit()
+
+    rows = list(iter_order_profits(statuses=['تم التسليم'], batch_size=2))
+
+    assert [row['order_id'] for row in rows] == [order.order_id for order in orders]
+    for row, order in zip(rows, orders):
+        db.session.refresh(order)
+        assert row['profit'] == order.calculate_profit()
+        assert row['net_profit'] == row['profit'] - 400.0 * order.quantity
+    assert rows[1]['expenses'] == 100.0
+
+
+def test_profit_stream_filters_by_period_and_status(client, make_product, make_order):
+    product = make_product(current_stock=10, price=500.0)
+    inside = make_order(product, order_status='مؤكد', order_date=datetime(2026, 3, 10))
+    make_order(product, order_status='مؤكد', order_date=datetime(2026, 4, 10))
+    make_order(product, order_status='قيد الانتظار', order_date=datetime(2026, 3, 11))
+
+    response = client.get('/api/orders/profit', query_string={
+        'from': '2026-03-01T00:00:00', 'to': '2026-03-31T23:59:59', 'status': 'مؤكد,تم التسليم'
+    })
+
+    assert response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['order_id'] for row in rows] == [inside.order_id]
+    assert rows[0]['revenue'] == 500.0 and rows[0]['profit'] == 500.0
@@ -0,0 +1,74 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from src.models import Product, InventoryAlert
+from src.services.product_cache import current_catalog_version
+from src.services.product_import import ProductImporter
+
+
+def rows(count, start=0):
+    return [{'sku': f'IMP-{i}', 'product_name': f'منتج {i}', 'price': 10} for i in range(start, start + count)]
+
+
+def test_null_required_text_is_a_row_error(app):
+    report = ProductImporter().run(iter([{'sku': 'IMP-N', 'product_name': None, 'price': 10}]))
+
+    assert report['failed'] == 1
+    assert Product.query.filter_by(sku='IMP-N').count() == 0
+
+
+def test_failed_chunk_keeps_original_error_and_bumps_version_for_committed_chunks(app, monkeypatch):
+    importer = ProductImporter(chunk_size=2)
+    real_upsert = importer._upsert
+    calls = []
+
+    def upsert(valid, report):
+        calls.append(1)
+        real_upsert(valid, report)
+        if len(calls) == 2:
+            raise IntegrityError('INSERT', {}, Exception('boom'))
+
+    monkeypatch.setattr(importer, '_upsert', upsert)
+    version = current_catalog_version()
+
+    with pytest.raises(IntegrityError):
+        importer.run(iter(rows(4)))
+
+    assert Product.query.filter(Product.sku.like('IMP-%')).count() == 2
+    assert current_catalog_version() == version + 1
+
+
+def test_threshold_change_on_existing_sku_syncs_its_alert(app, make_product):
+    product = make_product(sku='IMP-T', current_stock=20, low_stock_threshold=5)
+    assert InventoryAlert.query.filter_by(product_id=product.product_id).count() == 0
+
+    report = ProductImporter().run(iter([
+        {'sku': 'IMP-T', 'product_name': 'منتج', 'price': 10, 'low_stock_threshold': 25}
+    ]))
+
+    assert report['updated'] == 1
+    alert = InventoryAlert.query.filter_by(product_id=product.product_id, is_active=True).one()
+    assert alert.alert_type == InventoryAlert.LOW_STOCK and alert.threshold == 25
+
+
+def test_every_ndjson_record_is_checked_for_unknown_keys(app):
+    lines = [
+        '{"sku": "IMP-A", "product_name": "أ", "price": 10}',
+        '{"sku": "IMP-B", "product_name": "ب", "price": 10, "low_stock_treshold": 3}',
+        '{"sku": "IMP-C", "product_name": "ج"}'
+    ]
+    importer = ProductImporter()
+
+    report = importer.run(importer.iter_ndjson(lines))
+
+    assert report['inserted'] == 1 and report['failed'] == 2
+    assert report['errors'][0]['errors'] == {'low_stock_treshold': 'عمود غير معروف'}
+    assert report['errors'][1]['errors'] == {'price': 'مطلوب'}
+
+
+def test_unknown_csv_header_rejects_the_file(app):
+    importer = ProductImporter()
+
+    with pytest.raises(ValueError):
+        importer.run(importer.iter_csv(['sku,product_name,price,prise\n', 'IMP-X,س,10,12\n']))
+    assert Product.query.filter_by(sku='IMP-X').count() == 0
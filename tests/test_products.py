@@ -0,0 +1,61 @@
+from src.models import db, Product
+from src.services.inventory_ledger import InventoryLedger
+
+
+def test_string_false_deactivates_product(client):
+    response = client.post('/api/products', json={'product_name': 'منتج', 'sku': 'B-1', 'price': 100,
+                                                  'is_active': 'false'})
+    assert response.status_code == 201
+    assert Product.query.filter_by(sku='B-1').one().is_active is False
+
+    response = client.put('/api/products/B-1', json={'is_active': 'true'})
+    assert response.status_code == 200
+    db.session.expire_all()
+    assert Product.query.filter_by(sku='B-1').one().is_active is True
+
+
+def test_invalid_boolean_is_rejected(client):
+    response = client.post('/api/products', json={'product_name': 'منتج', 'sku': 'B-2', 'price': 100,
+                                                  'is_active': 'maybe'})
+    assert response.status_code == 400
+    assert Product.query.filter_by(sku='B-2').count() == 0
+
+
+def test_keyset_pages_follow_the_after_cursor(client, make_product):
+    ids = [make_product(sku=f'PG-{i}').product_id for i in range(5)]
+
+    first = client.get('/api/products?limit=2').get_json()
+    assert [p['product_id'] for p in first['data']] == ids[:2]
+    assert first['pagination'] == {'limit': 2, 'has_more': True, 'next_cursor': ids[1]}
+
+    second = client.get(f'/api/products?limit=2&after={ids[1]}').get_json()
+    last = client.get(f'/api/products?limit=2&after={second["pagination"]["next_cursor"]}').get_json()
+    assert [p['product_id'] for p in second['data']] == ids[2:4]
+    assert [p['product_id'] for p in last['data']] == ids[4:]
+    assert last['pagination']['has_more'] is False and last['pagination']['next_cursor'] is None
+
+
+def test_prefix_search_matches_sku_or_name_start_only(client, make_product):
+    make_product(sku='ABC-1', product_name='ساعة')
+    make_product(sku='ABD-2', product_name='سوار', current_stock=3)
+    make_product(sku='XABC-3', product_name='حقيبة ABC')
+
+    found = client.get('/api/products?q=ABC').get_json()['data']
+    assert [p['sku'] for p in found] == ['ABC-1']
+    found = client.get('/api/products?q=AB&in_stock=true').get_json()['data']
+    assert [p['sku'] for p in found] == ['ABD-2']
+    found = client.get('/api/products?q=سا').get_json()['data']
+    assert [p['sku'] for p in found] == ['ABC-1']
+
+
+def test_unchanged_catalog_returns_304_until_stock_changes(client, make_product):
+    product = make_product(sku='ET-1', current_stock=5)
+
+    response = client.get('/api/products')
+    etag = response.headers['ETag']
+    assert client.get('/api/products', headers={'If-None-Match': etag}).status_code == 304
+
+    InventoryLedger().set_stock(product, 2)
+    db.session.commit()
+    response = client.get('/api/products', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.headers['ETag'] != etag
@@ -0,0 +1,46 @@
+import os
+import time
+
+from src.services.report_jobs import ReportJobRunner
+
+
+def wait_for(runner, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = runner.get_job(job_id)
+        if job['status'] in (ReportJobRunner.COMPLETED, ReportJobRunner.FAILED):
+            return job
+        time.sleep(0.05)
+    raise AssertionError('report job did not finish')
+
+
+def test_job_survives_runner_restart(app, tmp_path):
+    runner = ReportJobRunner(results_dir=str(tmp_path))
+    job = runner.submit('profit-loss', {'a': '1'}, lambda: {'success': True})
+    finished = wait_for(runner, job['job_id'])
+    assert finished['status'] == ReportJobRunner.COMPLETED
+
+    restarted = ReportJobRunner(results_dir=str(tmp_path))
+    assert restarted.get_job(job['job_id'])['status'] == ReportJobRunner.COMPLETED
+    assert os.path.exists(restarted.result_path(job['job_id']))
+
+
+def test_matching_jobs_in_flight_are_deduplicated(app, tmp_path):
+    runner = ReportJobRunner(results_dir=str(tmp_path))
+    first = runner.submit('profit-loss', {'a': '1'}, lambda: time.sleep(0.3) or {})
+    second = runner.submit('profit-loss', {'a': '1'}, lambda: {})
+
+    assert second['job_id'] == first['job_id'] and second['deduplicated']
+    wait_for(runner, first['job_id'])
+
+
+def test_purge_removes_orphaned_result_files(app, tmp_path):
+    runner = ReportJobRunner(results_dir=str(tmp_path), ttl_seconds=60)
+    orphan = tmp_path / 'deadbeef.json.gz'
+    orphan.write_bytes(b'x')
+    old = time.time() - 120
+    os.utime(orphan, (old, old))
+
+    runner.purge_expired()
+
+    assert not orphan.exists()
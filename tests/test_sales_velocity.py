@@ -0,0 +1,63 @@
+import threading
+from datetime import datetime, timedelta
+
+from src.models import db, InventoryMovement, ProductSalesVelocity
+from src.services import sales_velocity
+from src.services.inventory_ledger import InventoryLedger
+from src.services.sales_velocity import SalesVelocityTracker
+
+
+def test_first_record_race_for_a_product_does_not_fail(app, make_product, monkeypatch):
+    product_id = make_product(current_stock=10).product_id
+    barrier = threading.Barrier(2, timeout=5)
+    real_insert = sales_velocity.insert_if_missing
+
+    def insert_after_both_selected(*args, **kwargs):
+        barrier.wait()
+        real_insert(*args, **kwargs)
+
+    monkeypatch.setattr(sales_velocity, 'insert_if_missing', insert_after_both_selected)
+    errors = []
+
+    def record():
+        with app.app_context():
+            try:
+                SalesVelocityTracker().record(product_id, 2)
+                db.session.commit()
+            except Exception as e:
+                errors.append(e)
+                db.session.rollback()
+
+    threads = [threading.Thread(target=record) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert db.session.get(ProductSalesVelocity, product_id).day_units == 4
+
+
+def test_rebuild_follows_the_live_movement_day_convention(app, make_product, make_order):
+    product = make_product(current_stock=10, cost_price=10.0)
+    ledger = InventoryLedger()
+
+    kept = make_order(product, quantity=3)
+    cancelled = make_order(product, quantity=2)
+    ledger.reserve(product.product_id, 3, InventoryMovement.ORDER, 'order', kept.order_id)
+    ledger.reserve(product.product_id, 2, InventoryMovement.ORDER, 'order', cancelled.order_id)
+    ledger.apply(product, 2, InventoryMovement.ORDER_CANCELLED, 'order', cancelled.order_id)
+    cancelled.order_status = 'ملغى'
+    # طلب أقدم من الدفتر بلا حركة حجز
+    make_order(product, quantity=4, order_status='تم التسليم', order_date=datetime.utcnow() - timedelta(days=3))
+    db.session.commit()
+
+    live = db.session.get(ProductSalesVelocity, product.product_id)
+    live_state = (live.day, live.day_units)
+
+    SalesVelocityTracker().rebuild()
+    db.session.commit()
+
+    rebuilt = db.session.get(ProductSalesVelocity, product.product_id)
+    assert (rebuilt.day, rebuilt.day_units) == live_state == (datetime.utcnow().date(), 3)
+    assert rebuilt.velocity > 0
@@ -0,0 +1,89 @@
+from src.models import db, CarrierEvent
+from src.services import shipment_callbacks
+from src.services.shipment_callbacks import CarrierCallbackBuffer, normalize_events
+
+
+def make_buffer():
+    # خيط التفريغ لا يستيقظ أثناء الاختبار؛ التفريغ يستدعى يدوياً
+    return CarrierCallbackBuffer(flush_interval=3600, max_attempts=2)
+
+
+def test_redelivered_event_without_id_or_time_is_deduplicated(app):
+    buffer = make_buffer()
+    payload = {'tracking': 'YAL-1', 'status': 'livré'}
+
+    first = normalize_events('yalidine', payload)
+    again = normalize_events('yalidine', payload)
+
+    assert first[0]['event_id'] == again[0]['event_id']
+    assert buffer.add(app, first) == 1
+    assert buffer.add(app, again) == 0
+    assert CarrierEvent.query.count() == 1
+
+
+def test_events_are_stored_before_they_are_applied(app, make_product, make_order):
+    order = make_order(make_product(current_stock=5), order_status='تم الشحن', shipping_tracking_id='YAL-1')
+    buffer = make_buffer()
+
+    buffer.add(app, normalize_events('yalidine', [
+        {'tracking': 'YAL-1', 'status': 'en_transit', 'occurred_at': '2026-01-01T10:00:00'},
+        {'tracking': 'YAL-1', 'status': 'livré', 'occurred_at': '2026-01-01T12:00:00'}
+    ]))
+    assert CarrierEvent.query.filter_by(pending=True).count() == 2
+    assert order.order_status == 'تم الشحن'
+
+    assert buffer.flush() == 1
+    assert order.order_status == 'تم التسليم'
+    assert CarrierEvent.query.filter_by(pending=True).count() == 0
+
+
+def test_failing_shipment_does_not_block_the_batch(app, make_product, make_order, monkeypatch):
+    product = make_product(current_stock=5)
+    good = make_order(product, order_status='تم الشحن', shipping_tracking_id='GOOD')
+    make_order(product, order_status='تم الشحن', shipping_tracking_id='BAD')
+    real_apply = shipment_callbacks.apply_shipment_status
+
+    def apply(order, status, now=None):
+        if order.shipping_tracking_id == 'BAD':
+            raise RuntimeError('حدث معطوب')
+        return real_apply(order, status, now)
+
+    monkeypatch.setattr(shipment_callbacks, 'apply_shipment_status', apply)
+    buffer = make_buffer()
+    buffer.add(app, normalize_events('yalidine', [
+        {'tracking': 'BAD', 'status': 'livré'},
+        {'tracking': 'GOOD', 'status': 'livré'}
+    ]))
+
+    assert buffer.flush() == 1
+    db.session.refresh(good)
+    assert good.order_status == 'تم التسليم'
+    bad = CarrierEvent.query.filter_by(tracking_number='BAD').one()
+    assert bad.pending and bad.attempts == 1 and 'معطوب' in bad.last_error
+
+    # بعد الحد الأقصى للمحاولات يترك الحدث ولا يعود إلى الدفعات
+    buffer.flush()
+    db.session.refresh(bad)
+    assert not bad.pending and bad.attempts == 2
+    assert buffer.status()['abandoned'] == 1
+    assert buffer.flush() == 0
+
+
+def test_pending_events_left_by_a_previous_process_are_flushed_at_startup(app, make_product, make_order):
+    order = make_order(make_product(current_stock=5), order_status='تم الشحن', shipping_tracking_id='YAL-7')
+    stored = make_buffer()
+    stored.add(app, normalize_events('yalidine', {'tracking': 'YAL-7', 'status': 'livré'}))
+
+    # عملية جديدة بمخزن فارغ: لا يصل إشعار جديد، فالتشغيل يأتي من بدء التطبيق
+    buffer = CarrierCallbackBuffer(flush_interval=3600)
+    started = []
+    buffer._loop = lambda app: started.append(app)
+
+    assert buffer.start_if_pending(app) is True
+    buffer._thread.join(timeout=5)
+    assert started == [app]
+
+    buffer.flush()
+    db.session.refresh(order)
+    assert order.order_status == 'تم التسليم'
+    assert CarrierCallbackBuffer().start_if_pending(app) is False
@@ -0,0 +1,164 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.models import db, ShipmentJob
+from src.services.shipment_jobs import ShipmentJobRunner, ShipmentJobRunningError
+
+
+class FakeDeliveryManager:
+    def __init__(self):
+        self.created = []
+        self.fail_with = None
+        self.parcels = {}
+
+    def get_service(self, service_name):
+        return object() if service_name == 'yalidine' else None
+
+    def create_shipments_with_service(self, service_name, orders_data):
+        results = {}
+        for order_data in orders_data:
+            self.created.append(order_data['order_id'])
+            if self.fail_with:
+                results[order_data['order_id']] = dict(self.fail_with)
+            else:
+                self.parcels[order_data['order_id']] = f'YAL-{order_data["order_id"]}'
+                results[order_data['order_id']] = {'success': True, 'tracking_number': f'YAL-{order_data["order_id"]}'}
+        return results
+
+    def find_shipment_with_service(self, service_name, order_id):
+        tracking_number = self.parcels.get(order_id)
+        return {'success': True, 'found': bool(tracking_number), 'tracking_number': tracking_number}
+
+
+def test_explicit_orders_must_be_confirmed(app, make_product, make_order):
+    product = make_product(current_stock=5)
+    confirmed = make_order(product, order_status='مؤكد')
+    pending = make_order(product, order_status='قيد الانتظار')
+    manager = FakeDeliveryManager()
+    runner = ShipmentJobRunner(manager)
+
+    job = runner.run(runner.create_job([confirmed.order_id, pending.order_id], 'yalidine'))
+
+    assert manager.created == [str(confirmed.order_id)]
+    assert job.get_results()[str(pending.order_id)]['status'] == 'failed'
+    assert pending.order_status == 'قيد الانتظار'
+    assert confirmed.order_status == 'تم الشحن' and confirmed.shipped_date is not None
+
+
+def test_running_job_is_not_run_twice(app, make_product, make_order):
+    order = make_order(make_product(current_stock=5), order_status='مؤكد')
+    manager = FakeDeliveryManager()
+    runner = ShipmentJobRunner(manager, stale_seconds=60)
+    job = runner.create_job([order.order_id], 'yalidine')
+    job.status = ShipmentJob.RUNNING
+    db.session.commit()
+
+    with pytest.raises(ShipmentJobRunningError):
+        runner.run(job)
+    assert manager.created == []
+
+    # تنفيذ توقف منذ أكثر من مهلة التوقف يمكن استئنافه
+    job.updated_at = datetime.utcnow() - timedelta(seconds=120)
+    db.session.commit()
+    assert runner.run(job).status == ShipmentJob.COMPLETED
+    assert job.attempts == 1
+
+
+def test_interrupted_submission_is_reconciled_instead_of_reposted(app, make_product, make_order):
+    order = make_order(make_product(current_stock=5), order_status='مؤكد')
+    manager = FakeDeliveryManager()
+    runner = ShipmentJobRunner(manager)
+    job = runner.create_job([order.order_id], 'yalidine')
+
+    # الطرد أنشئ لدى الشركة لكن الرد ضاع
+    def create_then_lose_reply(service_name, orders_data):
+        manager.create_shipments_with_service.__func__(manager, service_name, orders_data)
+        raise ConnectionError('انقطع الاتصال')
+
+    manager.create_shipments_with_service = lambda *args: create_then_lose_reply(*args)
+    job = runner.run(job)
+    assert job.get_results()[str(order.order_id)]['status'] == 'submitting'
+    assert order.shipping_tracking_id is None
+
+    del manager.create_shipments_with_service
+    job = runner.run(job)
+
+    assert manager.created == [str(order.order_id)]
+    assert job.status == ShipmentJob.COMPLETED
+    assert order.shipping_tracking_id == f'YAL-{order.order_id}'
+
+
+def test_carrier_rejection_is_retried_on_resume(app, make_product, make_order):
+    order = make_order(make_product(current_stock=5), order_status='مؤكد')
+    manager = FakeDeliveryManager()
+    manager.fail_with = {'success': False, 'message': 'ولاية غير صحيحة', 'status_code': 400}
+    runner = ShipmentJobRunner(manager)
+
+    job = runner.run(runner.create_job([order.order_id], 'yalidine'))
+    assert job.get_results()[str(order.order_id)]['status'] == 'failed'
+
+    manager.fail_with = None
+    assert runner.run(job).status == ShipmentJob.COMPLETED
+    assert manager.created == [str(order.order_id)] * 2
+
+
+def test_request_rejected_before_sending_is_retried(app, make_product, make_order):
+    from src.services.carrier_http import CircuitBreaker
+    from src.services.delivery_integration import AramexService
+
+    aramex = AramexService()
+    aramex.http.breaker = CircuitBreaker(open_seconds=60)
+    aramex.http.breaker._open(time.monotonic())
+    assert aramex.create_shipment({'order_id': '1'})['not_sent'] is True
+
+    order = make_order(make_product(current_stock=5), order_status='مؤكد')
+    manager = FakeDeliveryManager()
+    manager.fail_with = {'success': False, 'message': 'قاطع الدائرة مفتوح', 'not_sent': True}
+    runner = ShipmentJobRunner(manager)
+
+    job = runner.run(runner.create_job([order.order_id], 'yalidine'))
+    assert job.get_results()[str(order.order_id)]['status'] == 'failed'
+    assert order.shipment_job_id is None
+
+    manager.fail_with = None
+    assert runner.run(job).status == ShipmentJob.COMPLETED
+
+
+def test_operator_can_force_resubmit_without_lookup(app, make_product, make_order):
+    order = make_order(make_product(current_stock=5), order_status='مؤكد')
+    manager = FakeDeliveryManager()
+    manager.fail_with = {'success': False, 'message': 'انتهت المهلة'}
+    runner = ShipmentJobRunner(manager)
+    job = runner.run(runner.create_job([order.order_id], 'yalidine'))
+    assert job.get_results()[str(order.order_id)]['status'] == 'submitting'
+
+    def unsupported(service_name, order_id):
+        return {'success': False, 'message': 'غير مدعوم'}
+
+    manager.find_shipment_with_service = unsupported
+    manager.fail_with = None
+    assert runner.run(job).get_results()[str(order.order_id)]['status'] == 'submitting'
+    assert manager.created == [str(order.order_id)]
+
+    assert runner.run(job, resubmit=[order.order_id]).status == ShipmentJob.COMPLETED
+    assert manager.created == [str(order.order_id)] * 2
+
+
+def test_order_held_by_one_job_is_not_sent_by_another(app, make_product, make_order):
+    from src.services.shipment_jobs import select_orders
+
+    order = make_order(make_product(current_stock=5), order_status='مؤكد')
+    manager = FakeDeliveryManager()
+    manager.fail_with = {'success': False, 'message': 'انتهت المهلة'}
+    runner = ShipmentJobRunner(manager)
+    first = runner.run(runner.create_job([order.order_id], 'yalidine'))
+    assert order.shipment_job_id == first.job_id
+
+    assert select_orders({}) == []
+    manager.fail_with = None
+    second = runner.run(runner.create_job([order.order_id], 'yalidine'))
+
+    assert second.get_results()[str(order.order_id)]['status'] == 'failed'
+    assert manager.created == [str(order.order_id)]
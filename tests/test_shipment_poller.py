@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+
+from src.models import db, DeliveryCompany
+from src.services.shipment_poller import ShipmentPoller
+
+
+class FakeDeliveryManager:
+    def __init__(self, status='in_transit'):
+        self.status = status
+        self.calls = []
+
+    def get_available_services(self):
+        return ['yalidine']
+
+    def track_shipments_with_service(self, service_name, numbers):
+        self.calls.append(list(numbers))
+        return {number: {'success': True, 'status': self.status} for number in numbers}
+
+
+def shipped(make_product, make_order, count=1):
+    company = DeliveryCompany(company_name='Yalidine')
+    db.session.add(company)
+    db.session.commit()
+    product = make_product(current_stock=10)
+    return [
+        make_order(product, order_status='تم الشحن', shipping_tracking_id=f'YAL-{n}',
+                   delivery_company_id=company.company_id)
+        for n in range(count)
+    ]
+
+
+def test_second_worker_does_not_poll_claimed_shipments(app, make_product, make_order):
+    shipped(make_product, make_order, count=3)
+    now = datetime(2026, 1, 1, 12, 0)
+    first, second = FakeDeliveryManager(), FakeDeliveryManager()
+
+    assert ShipmentPoller(first, base_interval=60).poll_once(now)['polled'] == 3
+    assert ShipmentPoller(second, base_interval=60).poll_once(now)['polled'] == 0
+    assert second.calls == []
+
+
+def test_claim_is_conditional(app, make_product, make_order):
+    order, = shipped(make_product, make_order)
+    now = datetime(2026, 1, 1, 12, 0)
+    poller = ShipmentPoller(FakeDeliveryManager(), claim_seconds=300)
+
+    assert poller._claim(order.order_id, now)
+    assert not poller._claim(order.order_id, now)
+    # حجز عملية توقفت ينتهي بعد مدته
+    assert poller._claim(order.order_id, now + timedelta(seconds=301))
+
+
+def test_interval_backs_off_and_caps_out_for_delivery(app, make_product, make_order):
+    order, = shipped(make_product, make_order)
+    manager = FakeDeliveryManager('in_transit')
+    poller = ShipmentPoller(manager, base_interval=60, out_for_delivery_interval=90, backoff_factor=2)
+    now = datetime(2026, 1, 1, 12, 0)
+
+    poller.poll_once(now)
+    assert order.shipment_status == 'في الطريق' and order.poll_interval == 60
+
+    now = order.next_poll_at
+    poller.poll_once(now)
+    assert order.poll_interval == 120 and order.next_poll_at == now + timedelta(seconds=120)
+
+    manager.status = 'out_for_delivery'
+    poller.poll_once(order.next_poll_at)
+    poller.poll_once(order.next_poll_at)
+    assert order.order_status == 'تم الشحن' and order.poll_interval == 90
+
+    manager.status = 'delivered'
+    poller.poll_once(order.next_poll_at)
+    assert order.order_status == 'تم التسليم'
+    assert poller.status()['tracked_shipments'] == 0
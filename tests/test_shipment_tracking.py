@@ -0,0 +1,121 @@
+from src.models import db, Order, InventoryMovement, StockLot
+from src.services.cost_lots import FifoCostEngine
+from src.services.inventory_ledger import InventoryLedger
+from src.services.shipment_tracking import apply_shipment_status
+
+
+def shipped_order(product, make_order, quantity=2):
+    order = make_order(product, quantity=quantity, order_status='مؤكد', shipping_tracking_id='YAL-1')
+    InventoryLedger().reserve(product.product_id, quantity, InventoryMovement.ORDER, 'order', order.order_id)
+    db.session.commit()
+    return order
+
+
+def test_in_flight_shipment_stays_sold(app, make_product, make_order):
+    product = make_product(current_stock=5, cost_price=100.0)
+    order = shipped_order(product, make_order)
+
+    assert apply_shipment_status(order, 'in_transit')
+    assert (order.order_status, order.shipment_status) == ('تم الشحن', 'في الطريق')
+    assert order.shipped_date is not None
+
+    assert apply_shipment_status(order, 'out_for_delivery')
+    assert not apply_shipment_status(order, 'out_for_delivery')
+    assert (order.order_status, order.shipment_status) == ('تم الشحن', 'خرج للتسليم')
+    assert order.order_status in Order.SOLD_STATUSES
+
+    assert apply_shipment_status(order, 'delivered')
+    assert (order.order_status, order.shipment_status) == ('تم التسليم', None)
+
+
+def test_carrier_cancellation_restores_stock_and_lots(app, make_product, make_order):
+    product = make_product(current_stock=5, cost_price=100.0)
+    order = shipped_order(product, make_order)
+    apply_shipment_status(order, 'in_transit')
+
+    assert apply_shipment_status(order, 'cancelled')
+    db.session.commit()
+
+    assert order.order_status == 'ملغى' and order.cancelled_date is not None
+    assert product.current_stock == 5
+    assert not FifoCostEngine().is_consumed(order)
+    assert sum(lot.remaining_quantity for lot in StockLot.query.filter_by(product_id=product.product_id)) == 5
+
+    # إلغاء متكرر لا يعيد المخزون مرة ثانية
+    assert not apply_shipment_status(order, 'cancelled')
+    assert product.current_stock == 5
+
+
+def test_manual_status_update_uses_the_same_transition(client, make_product, make_order):
+    product = make_product(current_stock=5, cost_price=100.0)
+    order = shipped_order(product, make_order)
+
+    response = client.put(f'/api/orders/{order.order_id}/status', json={'order_status': 'مرتجع'})
+
+    assert response.status_code == 200
+    assert response.get_json()['data']['returned_date']
+    assert product.current_stock == 5
+    assert not FifoCostEngine().is_consumed(order)
+
+
+def test_cancel_confirm_cancel_keeps_lots_equal_to_stock(app, client, make_product, make_order):
+    product = make_product(current_stock=0, cost_price=100.0)
+    InventoryLedger().set_stock(product, 10, InventoryMovement.INITIAL)
+    db.session.commit()
+    order = make_order(product, quantity=3)
+    InventoryLedger().reserve(product.product_id, 3, InventoryMovement.ORDER, 'order', order.order_id)
+    db.session.commit()
+
+    def open_lots():
+        return sum(lot.remaining_quantity for lot in StockLot.query.filter_by(product_id=product.product_id))
+
+    for status, stock in [('مؤكد', 7), ('ملغى', 10), ('مؤكد', 7), ('ملغى', 10)]:
+        response = client.put(f'/api/orders/{order.order_id}/status', json={'order_status': status})
+        assert response.status_code == 200
+        db.session.refresh(product)
+        assert product.current_stock == open_lots() == stock
+
+
+def test_reactivation_is_rejected_when_stock_is_gone(app, client, make_product, make_order):
+    product = make_product(current_stock=0, cost_price=100.0)
+    InventoryLedger().set_stock(product, 3, InventoryMovement.INITIAL)
+    db.session.commit()
+    order = make_order(product, quantity=3)
+    InventoryLedger().reserve(product.product_id, 3, InventoryMovement.ORDER, 'order', order.order_id)
+    db.session.commit()
+
+    client.put(f'/api/orders/{order.order_id}/status', json={'order_status': 'ملغى'})
+    InventoryLedger().apply(product, -2, InventoryMovement.ADJUSTMENT)
+    db.session.commit()
+
+    response = client.put(f'/api/orders/{order.order_id}/status', json={'order_status': 'مؤكد'})
+    assert response.status_code == 400
+    db.session.refresh(order)
+    assert order.order_status == 'ملغى'
+    assert not apply_shipment_status(order, 'in_transit')
+
+
+def test_single_shipment_route_uses_the_shared_transition(client, make_product, make_order, monkeypatch):
+    from src.routes import delivery_integration
+
+    calls = []
+
+    def create(service_name, shipment_data):
+        calls.append(shipment_data['order_id'])
+        return {'success': True, 'tracking_number': 'YAL-9'}
+
+    monkeypatch.setattr(delivery_integration.delivery_manager, 'create_shipment_with_service', create)
+    product = make_product(current_stock=5)
+    pending = make_order(product)
+    confirmed = make_order(product, order_status='مؤكد')
+
+    response = client.post('/api/delivery/create-shipment', json={'service_name': 'yalidine', 'order_id': pending.order_id})
+    assert response.status_code == 400 and calls == []
+
+    response = client.post('/api/delivery/create-shipment', json={'service_name': 'yalidine', 'order_id': confirmed.order_id})
+    assert response.status_code == 201
+    db.session.refresh(confirmed)
+    assert confirmed.order_status == 'تم الشحن' and confirmed.shipped_date is not None
+
+    response = client.post('/api/delivery/create-shipment', json={'service_name': 'yalidine', 'order_id': confirmed.order_id})
+    assert response.status_code == 400 and len(calls) == 1
@@ -0,0 +1,67 @@
+from src.services.shipping_quotes import quote_cache, rate_shop
+
+
+class FakeService:
+    def __init__(self, result):
+        self.result = result
+        self.timeouts = []
+
+    def get_shipping_cost(self, cost_data, timeout=None):
+        self.timeouts.append(timeout)
+        return self.result
+
+
+class FakeDeliveryManager:
+    def __init__(self, services):
+        self.services = services
+
+    def get_available_services(self):
+        return list(self.services)
+
+    def get_service(self, service_name):
+        return self.services[service_name]
+
+
+def test_missing_or_zero_cost_is_a_failure_not_the_cheapest(app):
+    quote_cache.clear()
+    manager = FakeDeliveryManager({
+        'yalidine': FakeService({'success': True, 'total_cost': 650}),
+        'aramex': FakeService({'success': True}),
+        'zr': FakeService({'success': True, 'total_cost': 0})
+    })
+
+    result = rate_shop(manager, {'to_wilaya': 'وهران', 'weight': 1}, budget_ms=500)
+
+    assert result['cheapest']['service_name'] == 'yalidine'
+    assert sorted(failure['service_name'] for failure in result['failures']) == ['aramex', 'zr']
+    assert quote_cache.stats()['size'] == 1
+
+
+def test_each_carrier_call_is_bounded_by_the_budget(app):
+    quote_cache.clear()
+    service = FakeService({'success': True, 'total_cost': 500})
+
+    rate_shop(FakeDeliveryManager({'yalidine': service}), {'to_wilaya': 'وهران'}, budget_ms=800)
+
+    assert service.timeouts == [0.8]
+
+
+def test_parcel_dimensions_are_part_of_the_cached_quote(app):
+    quote_cache.clear()
+    service = FakeService({'success': True, 'total_cost': 900})
+    manager = FakeDeliveryManager({'aramex': service})
+    parcel = {'customer_city': 'Oran', 'weight': 1, 'length': 10, 'width': 10, 'height': 10}
+
+    rate_shop(manager, parcel, budget_ms=500)
+    rate_shop(manager, {**parcel, 'length': 9}, budget_ms=500)
+    rate_shop(manager, {**parcel, 'length': 60, 'width': 40}, budget_ms=500)
+
+    # 9 و10 في الشريحة نفسها، والطرد الأكبر يطلب سعره من الشركة
+    assert len(service.timeouts) == 2
+    assert quote_cache.stats()['size'] == 2
+
+
+def test_rate_shop_rejects_a_non_positive_budget(client):
+    for budget_ms in (0, -100):
+        response = client.post('/api/delivery/rate-shop', json={'to_wilaya': 'وهران', 'budget_ms': budget_ms})
+        assert response.status_code == 400
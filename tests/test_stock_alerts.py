@@ -0,0 +1,35 @@
+from src.models import db, InventoryAlert, InventoryMovement
+from src.services.inventory_ledger import InventoryLedger
+from src.services.stock_alerts import StockAlertDispatcher, alert_dispatcher
+
+
+def test_failing_subscriber_does_not_block_the_others(capsys):
+    dispatcher = StockAlertDispatcher(webhook_url='')
+    received = []
+    dispatcher.subscribe(lambda event: 1 / 0)
+    dispatcher.subscribe(received.append)
+
+    dispatcher.dispatch([{'event': 'triggered'}])
+
+    assert received == [{'event': 'triggered'}]
+    assert 'division by zero' in capsys.readouterr().out
+
+
+def test_alert_events_are_dispatched_once_after_commit_only(app, make_product):
+    product = make_product(current_stock=20, low_stock_threshold=5)
+    received = []
+    alert_dispatcher.subscribe(received.append)
+    try:
+        InventoryLedger().apply(product, -17, InventoryMovement.ADJUSTMENT)
+        db.session.rollback()
+        assert received == []
+
+        product = db.session.get(type(product), product.product_id)
+        InventoryLedger().apply(product, -17, InventoryMovement.ADJUSTMENT)
+        InventoryLedger().apply(product, -1, InventoryMovement.ADJUSTMENT)
+        db.session.commit()
+    finally:
+        alert_dispatcher.unsubscribe(received.append)
+
+    assert [event['event'] for event in received] == ['triggered']
+    assert InventoryAlert.query.filter_by(product_id=product.product_id, is_active=True).count() == 1